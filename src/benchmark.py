@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+import argparse
+import time
+import tracemalloc
+from datetime import datetime
+from logging import getLogger, Logger
+from os import path
+from tempfile import TemporaryDirectory
+from typing import Sequence
+
+import numpy as np
+from shapely.geometry import shape
+
+from common import setup_log, jitter_coordinates, render_geojson_points, value_classes
+from isochrone import IsochroneIndex, IsochroneGrid, read_isochrone_map
+from model import ParcelOffer
+
+ISOCHRONE_MAP = path.join(path.dirname(path.realpath(__file__)), "..", "data", "isochrone_wroclaw_car_56min_7min.json")
+OFFER = ParcelOffer(timestamp=datetime(2020, 4, 16, 18, 43, 48), ident="597681409",
+                    url="https://www.olx.pl/oferta/gajkow-dzialka-gotowa-do-budowy-CID3-IDErOeJ.html",
+                    location="Gajków, wrocławski, Dolnośląskie", area_m2=1000, price_pln=169000,
+                    title="Gajków działka gotowa do budowy")
+
+
+def bench_offer_objects(log: Logger, count: int = 20000):
+    row = OFFER.to_csv_row()
+    rows = [row[:3] + [str(i)] + row[4:] for i in range(count)]
+    start = time.perf_counter()
+    _ = [ParcelOffer.from_csv_row(r) for r in rows]
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    snapshot_start = tracemalloc.take_snapshot()
+    unique_offers = set(ParcelOffer.from_csv_row(r) for r in rows)
+    snapshot_end = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in snapshot_end.compare_to(snapshot_start, "filename"))
+    log.info(f"ParcelOffer: {count / elapsed:.0f} objects/s, {allocated / len(unique_offers):.0f} bytes/object")
+
+
+def bench_feature_builder(log: Logger, count: int = 100000):
+    rng = np.random.default_rng(0)
+    keys = [str(i) for i in range(count)]
+    prices = rng.uniform(10, 200, count)
+    start = time.perf_counter()
+    lat, lon = jitter_coordinates(rng.uniform(50, 52, count), rng.uniform(16, 18, count), keys)
+    _ = render_geojson_points(lat, lon, marker_color=[str(c) for c in value_classes(prices, 30, 150)],
+                              props=[{"title": k} for k in keys])
+    log.info(f"render_geojson_points: {count / (time.perf_counter() - start):.0f} features/s")
+
+
+def bench_isochrone_classifiers(log: Logger, count: int = 100000):
+    index = IsochroneIndex([shape(f["geometry"]) for f in read_isochrone_map(ISOCHRONE_MAP)["features"]])
+    rng = np.random.default_rng(0)
+    lat, lon = rng.uniform(50.6, 51.8, count), rng.uniform(16., 18., count)
+    start = time.perf_counter()
+    _ = index.classify(lat, lon)
+    log.info(f"IsochroneIndex: {count / (time.perf_counter() - start):.0f} points/s")
+    with TemporaryDirectory() as grid_dir:
+        IsochroneGrid.rasterize(index, resolution=0.01).save(grid_dir)
+        grid = IsochroneGrid.load(grid_dir)
+        start = time.perf_counter()
+        _ = grid.classify(lat, lon)
+        log.info(f"IsochroneGrid: {count / (time.perf_counter() - start):.0f} points/s")
+
+
+BENCHMARKS = {
+    "offers": bench_offer_objects,
+    "features": bench_feature_builder,
+    "isochrones": bench_isochrone_classifiers,
+}
+
+
+def main(benchmarks: Sequence[str] = tuple(BENCHMARKS)):
+    setup_log()
+    log = getLogger()
+    for name in benchmarks:
+        BENCHMARKS[name](log)
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Measure throughput of hot paths, kept out of the unit tests')
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help=f'Benchmarks to run out of: {", ".join(BENCHMARKS)}; all if none given')
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(unknown)}")
+    return args
+
+
+def cli_main():
+    args = _parse_args()
+    main(args.benchmarks or tuple(BENCHMARKS))
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -1,47 +1,83 @@
 #!/usr/bin/env python3
 
 import argparse
+from datetime import timedelta
 from logging import getLogger
 from os import path
+from typing import Optional, Dict
 
-from common import setup_log, list_csv_files, read_csv
+from common import setup_log, list_csv_sources, read_csv
+from gazetteer import Gazetteer, OfflineGeocoder
 from model import ParcelOffer
-from place_resolver import MapQuestClient, PlaceResolver
+from place_resolver import MapQuestClient, PlaceResolver, SqlitePlaceCache, build_resolve_name
 
 
-def main(map_quest_api_key: str, csv_cache: str, offers_directory: str):
+def main(map_quest_api_key: str, csv_cache: str, offers_directory: str, sqlite_cache: Optional[str] = None,
+         negative_ttl_days: int = 30, workers: int = 8, rate_limit: float = 5., gazetteer: Optional[str] = None):
     setup_log()
     log = getLogger()
-    client = MapQuestClient(map_quest_api_key, log)
-    resolver = PlaceResolver(client, log)
+    map_quest = client = MapQuestClient(map_quest_api_key, log, rate_limit=rate_limit, pool_size=workers)
+    if gazetteer:
+        client = OfflineGeocoder(Gazetteer.load(gazetteer), log, fallback=map_quest)
+        log.info(f"Loaded gazetteer {gazetteer} with {len(client.gazetteer)} entries, MapQuest used on misses only")
+    cache = SqlitePlaceCache(sqlite_cache or ":memory:", negative_ttl=timedelta(days=negative_ttl_days))
+    resolver = PlaceResolver(client, log, cache)
 
     if path.isfile(csv_cache):
         resolver.load(csv_cache)
-        log.info(f"Loaded {csv_cache} with {len(resolver.cache.keys())} addresses")
+        log.info(f"Loaded {csv_cache}, cache holds {len(resolver.cache)} addresses")
 
-    for csv_file in list_csv_files(offers_directory):
+    # domain of the first offer seen with each location, offers themselves are not kept
+    locations: Dict[str, str] = {}
+    for csv_file in list_csv_sources(offers_directory):
         log.info(f"Parsing CSV {csv_file}")
         for row in read_csv(csv_file):
             offer = ParcelOffer.from_csv_row(row)
             if offer:
-                _ = resolver.get(offer)
+                if offer.location:
+                    locations.setdefault(offer.location, offer.domain)
             else:
                 log.warning(f"Could not parse into offer: {row}")
-        log.info(f"Storing cache with {len(resolver.cache.keys())} into {csv_cache}")
+
+    queries = {build_resolve_name(domain, location) for location, domain in locations.items()}
+    if queries:
+        log.info(f"Found {len(locations)} distinct locations normalizing into {len(queries)} distinct queries "
+                 f"(dedup ratio {len(locations) / len(queries):.2f})")
+
+    try:
+        _ = resolver.resolve_locations(((domain, location) for location, domain in locations.items()), workers)
+    finally:
+        log.info(f"Storing cache with {len(resolver.cache)} addresses into {csv_cache}")
         resolver.save(csv_cache)
+        cache.close()
+        client.close()
+    log.info(f"Cache hits: {resolver.stats['hit']}, normalized query hits: {resolver.stats['query_hit']}, "
+             f"misses: {resolver.stats['miss']}, looked up: {resolver.stats['lookup']}")
+    if isinstance(client, OfflineGeocoder):
+        log.info(f"Resolved offline: {client.stats['offline']}, passed to MapQuest: {client.stats['fallback']}")
+    log.info(f"MapQuest API calls: {map_quest.stats['api_call']}, HTTP requests: {map_quest.stats['request']}")
 
 
 def _parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description='Populate places cache with locations resolved using MapQuest API')
     parser.add_argument('cache', type=str, help='Path CSV file containing places cache to work on')
     parser.add_argument('key', type=str, help='MapQuest API key')
-    parser.add_argument('offers', type=str, help='Path to directory containing CSV files with offers')
+    parser.add_argument('offers', type=str, help='Path to directory containing offer CSV files or .csv.zip archives')
+    parser.add_argument('--sqlite-cache', type=str, default=None,
+                        help='Path to sqlite3 DB persisting places cache between runs, in-memory if not given')
+    parser.add_argument('--negative-ttl', type=int, default=30,
+                        help='Days after which addresses that could not be resolved are looked up again')
+    parser.add_argument('--workers', type=int, default=8, help='Number of concurrent MapQuest API requests')
+    parser.add_argument('--rate-limit', type=float, default=5., help='Maximum MapQuest API requests per second')
+    parser.add_argument('--gazetteer', type=str, default=None,
+                        help='Path to gazetteer CSV built with gazetteer.py, resolving addresses offline when possible')
     return parser.parse_args()
 
 
 def cli_main():
     args = _parse_args()
-    main(args.key, args.cache, args.offers)
+    main(args.key, args.cache, args.offers, args.sqlite_cache, args.negative_ttl, args.workers, args.rate_limit,
+         args.gazetteer)
 
 
 if __name__ == '__main__':
@@ -1,14 +1,21 @@
 #!/usr/bin/env python3
 
 import argparse
-from logging import getLogger
+from logging import getLogger, Logger
+from typing import Iterable, Sequence, Any, List, Dict
 
-from common import setup_log, read_csv, render_geojson_point, save_geojson, color_gradient
+from common import setup_log, read_csv, render_geojson_points, save_geojson, color_gradient, value_classes
 
 
-def _calc_value(price_per_sqm: int, min_price: int = 30, max_price: int = 180) -> int:
-    value = min(max(price_per_sqm - min_price, 0) / (max_price - min_price), 1.)
-    return round((1 - value) * 9)
+def render_points(rows: Iterable[Sequence[Any]], log: Logger) -> List[Dict[str, Any]]:
+    colors = color_gradient("red", "green", 10)
+    rows = [t for t in rows if t[0]]
+    price_per_sqm = [int(float(t[1])) for t in rows]
+    return render_geojson_points([float(t[3]) for t in rows], [float(t[4]) for t in rows],
+                                 marker_color=[colors[c] for c in value_classes(price_per_sqm, 30, 180)],
+                                 props=[{"title": t[0],
+                                         "offer_count": int(float(t[2])),
+                                         "price_per_sqm": f"{p} zł/m2"} for t, p in zip(rows, price_per_sqm)])
 
 
 def main(avg_city_prices_csv: str, output_geojson: str, headers: bool = False) -> None:
@@ -18,13 +25,7 @@ def main(avg_city_prices_csv: str, output_geojson: str, headers: bool = False) -
     csv_lines = list(read_csv(avg_city_prices_csv))
     if headers:
         _ = csv_lines.pop(0)
-    colors = color_gradient("red", "green", 10)
-    points = [render_geojson_point(lat=float(t[3]), lon=float(t[4]),
-                                   marker_size="small", marker_color=colors[_calc_value(int(float(t[1])))],
-                                   props={"title": t[0],
-                                          "offer_count": int(float(t[2])),
-                                          "price_per_sqm": f"{round(int(float(t[1])))} zł/m2"})
-              for t in csv_lines if t[0]]
+    points = render_points(csv_lines, log)
     log.info(f"Rendering GeoJSON out of {len(points)} points...")
     save_geojson(points, output_geojson)
     log.info(f"Done rendering file {output_geojson}")
@@ -1,65 +1,57 @@
 import argparse
-import codecs
-import json
 from logging import getLogger
-from typing import List, Any, Dict, Optional
+from typing import Dict, List, Tuple
 
-from shapely.geometry import shape, Point, Polygon
+import numpy as np
 
 from common import setup_log, read_csv, write_csv
+from isochrone import load_isochrone, DriveTimeClassifier
 from model import Place
 
 
-def _build_polygons(isochrone_map: Dict[str, Any]) -> List[Polygon]:
-    return [shape(feature['geometry']) for feature in isochrone_map["features"]]
-
-
-def _index_of_polygon_point_is_in(lat: float, lon: float, polygons: List[shape]) -> int:
-    for i, polygon in enumerate(polygons):
-        if polygon.contains(Point(lon, lat)):
-            return i
-    return -1
+def _parse_origin(origin_and_isochrone: str) -> Tuple[str, str]:
+    origin, sep, isochrone = origin_and_isochrone.partition("=")
+    if not sep or not origin.strip() or not isochrone.strip():
+        raise argparse.ArgumentTypeError(f"Expected ORIGIN=ISOCHRONE, got: {origin_and_isochrone}")
+    return origin.strip(), isochrone.strip()
 
 
 def _parse_args() -> argparse.Namespace:
-    parser = argparse.ArgumentParser(description='Merges base isochrone map with given additional GeoJSON features')
-    parser.add_argument('isochrone', type=str, help='Path to isochrone map')
+    parser = argparse.ArgumentParser(description='Computes drive time from places to given origins using isochrones')
     parser.add_argument('place_cache', type=str, help='Path to places cache CSV file')
-    parser.add_argument('output', type=str, help='Path output CSV file')
+    parser.add_argument('output', type=str, help='Path output CSV file with origin, location and drive time rows')
+    parser.add_argument('isochrones', type=_parse_origin, nargs='+',
+                        help='Origins given as ORIGIN=ISOCHRONE, isochrone being GeoJSON map or grid directory')
+    parser.add_argument('--step', type=int, default=7,
+                        help='Drive time difference between isochrones in minutes, if not given by isochrone map')
     return parser.parse_args()
 
 
-def main(isochrone: str, place_cache: str, output: str, polygon_step_time_min: int = 7):
+def main(place_cache: str, output: str, isochrones: Dict[str, str], polygon_step_time_min: int = 7):
     setup_log()
     log = getLogger()
 
-    log.info(f"Reading isochrone map from {isochrone} ...")
-    with codecs.open(isochrone, 'r', 'utf-8-sig') as map_:
-        isochrone_map = json.load(map_)
-    polygons = _build_polygons(isochrone_map)
+    log.info(f"Reading isochrones of {len(isochrones)} origins: {', '.join(isochrones)} ...")
+    classifier = DriveTimeClassifier({origin: load_isochrone(isochrone, polygon_step_time_min)
+                                      for origin, isochrone in isochrones.items()})
 
     log.info(f"Reading places cache from {place_cache} ...")
-    places = filter(None, map(Place.from_csv_row, read_csv(place_cache)))
-    city_to_time_to_wroclaw: Dict[str, Optional[int]] = {}
-
-    log.info(f"Finding time to reach destination for places...")
-    for p in places:
-        if p not in city_to_time_to_wroclaw.keys():
-            index = _index_of_polygon_point_is_in(p.lat, p.lon, polygons)
-            if index != -1:
-                time_to_wroclaw_min = index * polygon_step_time_min
-                city_to_time_to_wroclaw[p.city] = time_to_wroclaw_min
-            else:
-                city_to_time_to_wroclaw[p.city] = None
-
-    log.info(f"Writing {len(city_to_time_to_wroclaw)} results to {output} ...")
-    write_csv(output, sorted([[k, v] for k, v in city_to_time_to_wroclaw.items()]))
+    places: List[Place] = [p for p in filter(None, map(Place.from_csv_row, read_csv(place_cache)))
+                           if p.lat is not None and p.lon is not None]
+
+    log.info(f"Finding drive time to {len(isochrones)} origins for {len(places)} places...")
+    drive_times = classifier.drive_time_min(np.array([p.lat for p in places]), np.array([p.lon for p in places]))
+    rows = [[origin, p.location, int(t) if not np.isnan(t) else None]
+            for origin, times in drive_times.items() for p, t in zip(places, times)]
+
+    log.info(f"Writing {len(rows)} results to {output} ...")
+    write_csv(output, sorted(rows))
     log.info("Done")
 
 
 def cli_main():
     args = _parse_args()
-    main(args.isochrone, args.place_cache, args.output)
+    main(args.place_cache, args.output, dict(args.isochrones), args.step)
 
 
 if __name__ == '__main__':
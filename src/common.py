@@ -1,16 +1,22 @@
 import csv
+import hashlib
+import io
 import json
 import logging
 import os
 import time
-from copy import deepcopy
+import zipfile
+from contextlib import contextmanager
 from os import path
-from random import uniform
-from typing import Generator, List, Iterable, Dict, Any, Tuple
+from operator import itemgetter
+from typing import Generator, List, Iterable, Dict, Any, Tuple, Sequence, Callable, Optional, IO, Iterator, Union
 
+import numpy as np
 from colour import Color
 from more_itertools import chunked
 
+ZIP_MEMBER_SEPARATOR = "!"
+
 GEOJSON_POINT_TEMPLATE = {
     "type": "Feature",
     "geometry": {
@@ -27,34 +33,180 @@ GEOJSON_POINT_TEMPLATE = {
 
 def render_geojson_point(lat: float, lon: float, marker_size: str = "small", marker_color: str = "",
                          marker_symbol: str = "bank", props: Dict[str, Any] = None) -> Dict[str, Any]:
-    point = deepcopy(GEOJSON_POINT_TEMPLATE)
-    point["geometry"]["coordinates"] = [lon, lat]
-    point["properties"]["marker-color"] = marker_color
-    point["properties"]["marker-size"] = marker_size
-    point["properties"]["marker-symbol"] = marker_symbol
-    point["properties"].update(props)
-    return point
-
-
-def save_geojson(features: List[Dict[str, Any]], output_file: str) -> None:
-    with open(output_file, "w") as f_:
-        json.dump({"type": "FeatureCollection", "features": features}, f_, ensure_ascii=False, indent=2)
-
-
-def randomize_coordinates(lat: float, lon: float, delta: float = 0.006) -> Tuple[float, float]:
-    lat_positive_delta = uniform(delta / 3, delta)
-    lat_negative_delta = uniform(-1 * delta / 3, -1 * delta)
-    lon_positive_delta = uniform(delta / 3, delta)
-    lon_negative_delta = uniform(-1 * delta / 3, -1 * delta)
-    selector = uniform(0, 1)
-    if selector <= 0.25:
-        return lat + lat_negative_delta, lon + lon_negative_delta
-    elif selector <= 0.5:
-        return lat + lat_negative_delta, lon + lon_positive_delta
-    elif selector <= 0.75:
-        return lat + lat_positive_delta, lon + lon_negative_delta
-    else:
-        return lat + lat_positive_delta, lon + lon_positive_delta
+    return {"type": "Feature", "geometry": {"type": "Point", "coordinates": [lon, lat]},
+            "properties": {**GEOJSON_POINT_TEMPLATE["properties"], "marker-color": marker_color,
+                           "marker-size": marker_size, "marker-symbol": marker_symbol, **(props or {})}}
+
+
+def render_geojson_points(lat: np.ndarray, lon: np.ndarray, marker_color: Sequence[str],
+                          marker_size: Union[str, Sequence[str]] = "small", marker_symbol: str = "bank",
+                          props: Sequence[Dict[str, Any]] = ()) -> List[Dict[str, Any]]:
+    """Batch version of render_geojson_point, taking column per attribute"""
+    lat, lon = np.asarray(lat, dtype=np.float64).tolist(), np.asarray(lon, dtype=np.float64).tolist()
+    sizes = [marker_size] * len(lat) if isinstance(marker_size, str) else marker_size
+    props = props or [{}] * len(lat)
+    template = GEOJSON_POINT_TEMPLATE["properties"]
+    return [{"type": "Feature", "geometry": {"type": "Point", "coordinates": [lon_, lat_]},
+             "properties": {**template, "marker-color": color, "marker-size": size, "marker-symbol": marker_symbol,
+                            **props_}}
+            for lat_, lon_, color, size, props_ in zip(lat, lon, marker_color, sizes, props)]
+
+
+def round_coordinates(coordinates: Any, precision: int = 6) -> Any:
+    if isinstance(coordinates, (list, tuple)):
+        return [round_coordinates(c, precision) for c in coordinates]
+    return round(coordinates, precision) if isinstance(coordinates, float) else coordinates
+
+
+class GeoJsonWriter:
+    """Writes FeatureCollection one feature at a time; compact mode drops whitespace and rounds coordinates"""
+
+    def __init__(self, output_file: str, compact: bool = False, precision: int = 6,
+                 members: Optional[Dict[str, Any]] = None):
+        self.output_file = output_file
+        self.compact = compact
+        self.precision = precision
+        self.members = members or {}
+        self.count = 0
+        self._file: Optional[IO] = None
+
+    def __enter__(self) -> 'GeoJsonWriter':
+        self._file = open(self.output_file, "w")
+        if self.compact:
+            self._file.write('{"type":"FeatureCollection",' + "".join(
+                f'{json.dumps(k)}:{json.dumps(v, ensure_ascii=False, separators=(",", ":"))},'
+                for k, v in self.members.items()) + '"features":[')
+        else:
+            self._file.write('{\n  "type": "FeatureCollection",' + "".join(
+                f'\n  {json.dumps(k)}: ' + json.dumps(v, ensure_ascii=False, indent=2).replace("\n", "\n  ") + ","
+                for k, v in self.members.items()) + '\n  "features": [')
+        return self
+
+    def write(self, feature: Dict[str, Any]) -> None:
+        if self.compact:
+            geometry = feature.get("geometry")
+            if geometry and "coordinates" in geometry:
+                feature = {**feature, "geometry": {**geometry, "coordinates": round_coordinates(
+                    geometry["coordinates"], self.precision)}}
+            self._file.write(("," if self.count else "")
+                             + json.dumps(feature, ensure_ascii=False, separators=(",", ":")))
+        else:
+            # same layout as the whole collection dumped with indent=2
+            indented = json.dumps(feature, ensure_ascii=False, indent=2).replace("\n", "\n    ")
+            self._file.write(("," if self.count else "") + "\n    " + indented)
+        self.count += 1
+
+    def write_all(self, features: Iterable[Dict[str, Any]]) -> None:
+        for feature in features:
+            self.write(feature)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._file.write("]}" if self.compact else ("\n  ]\n}" if self.count else "]\n}"))
+        self._file.close()
+
+
+def save_geojson(features: Iterable[Dict[str, Any]], output_file: str, compact: bool = False) -> None:
+    with GeoJsonWriter(output_file, compact) as writer:
+        writer.write_all(features)
+
+
+class _JsonStream:
+    """Reads JSON text piecewise out of a file, decoding one value at a time"""
+
+    def __init__(self, file: IO, chunk_size: int = 1 << 16):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer, self.offset, self.eof = "", 0, False
+
+    def _fill(self) -> bool:
+        chunk = self.file.read(self.chunk_size)
+        self.buffer, self.offset, self.eof = self.buffer[self.offset:] + chunk, 0, not chunk
+        return bool(chunk)
+
+    def peek(self) -> str:
+        while True:
+            while self.offset < len(self.buffer) and self.buffer[self.offset].isspace():
+                self.offset += 1
+            if self.offset < len(self.buffer):
+                return self.buffer[self.offset]
+            if not self._fill():
+                raise ValueError(f"Unexpected end of JSON in {self.file.name}")
+
+    def take(self, chars: str) -> str:
+        char = self.peek()
+        if char not in chars:
+            raise ValueError(f"Expected one of {chars} in {self.file.name}, got: {char}")
+        self.offset += 1
+        return char
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.offset)
+                # value ending with the buffer may be a number cut in half
+                if end < len(self.buffer) or self.eof:
+                    self.offset = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+
+def iter_geojson(geojson_file: str) -> Generator[Tuple[str, Any], None, None]:
+    """Yields (member, value) pairs of GeoJSON FeatureCollection, ("features", feature) once per feature, without
+    loading the whole file"""
+    with open(geojson_file, "r", encoding="utf-8-sig") as f_:
+        stream = _JsonStream(f_)
+        stream.take("{")
+        while stream.peek() != "}":
+            key = stream.value()
+            stream.take(":")
+            if key != "features":
+                yield key, stream.value()
+            elif stream.take("[") and stream.peek() != "]":
+                while True:
+                    yield key, stream.value()
+                    if stream.take(",]") == "]":
+                        break
+            else:
+                stream.take("]")
+            if stream.take(",}") == "}":
+                break
+
+
+def read_geojson_features(geojson_file: str) -> Iterator[Dict[str, Any]]:
+    """Yields features of GeoJSON FeatureCollection one by one, without loading the whole file"""
+    return (value for member, value in iter_geojson(geojson_file) if member == "features")
+
+
+def _seed_uniforms(keys: Sequence[str], count: int) -> np.ndarray:
+    """Returns count pseudo-random numbers in [0, 1) per key, same for the same key on every run (splitmix64)"""
+    state = np.array([int.from_bytes(hashlib.blake2b(str(k).encode("utf-8"), digest_size=8).digest(), "little")
+                      for k in keys], dtype=np.uint64).reshape(-1, 1)
+    z = state + np.arange(1, count + 1, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+    return (z >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+
+def jitter_coordinates(lat: np.ndarray, lon: np.ndarray, keys: Sequence[str],
+                       delta: float = 0.006) -> Tuple[np.ndarray, np.ndarray]:
+    """Moves each point by delta/3 to delta in random direction per axis, seeded with the point key for stable reruns"""
+    lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+    lat_delta, lon_delta, lat_sign, lon_sign = _seed_uniforms(keys, 4).T
+    lat_delta = np.where(lat_sign < 0.5, -1., 1.) * (delta / 3 + lat_delta * (delta - delta / 3))
+    lon_delta = np.where(lon_sign < 0.5, -1., 1.) * (delta / 3 + lon_delta * (delta - delta / 3))
+    return lat + lat_delta, lon + lon_delta
+
+
+def value_classes(values: np.ndarray, low: float, high: float, classes: int = 10) -> np.ndarray:
+    """Maps values onto classes-1 (at or below low) down to 0 (at or above high)"""
+    value = np.clip((np.asarray(values, dtype=np.float64) - low) / (high - low), 0., 1.)
+    return np.round((1 - value) * (classes - 1)).astype(np.intp)
 
 
 def color_gradient(start_color: str, end_color: str, count: int) -> List[str]:
@@ -78,13 +230,78 @@ def list_csv_files(dir_path: str) -> List[str]:
                    and path.splitext(f)[-1].lower() == ".csv"])
 
 
+def list_csv_sources(dir_path: str) -> List[str]:
+    """Lists CSV files and CSV members of .csv.zip archives in given directory, members named <archive>!<member>"""
+    sources = list_csv_files(dir_path)
+    for f in sorted(os.listdir(dir_path)):
+        archive = path.join(dir_path, f)
+        if f.lower().endswith(".csv.zip") and path.isfile(archive):
+            with zipfile.ZipFile(archive) as zip_f:
+                sources.extend(f"{archive}{ZIP_MEMBER_SEPARATOR}{m.filename}" for m in zip_f.infolist()
+                               if not m.is_dir() and m.filename.lower().endswith(".csv"))
+    return sorted(sources, key=path.basename)
+
+
+def _split_source(source: str) -> Tuple[str, Optional[str]]:
+    archive, sep, member = source.partition(ZIP_MEMBER_SEPARATOR)
+    return (archive, member) if sep and archive.lower().endswith(".zip") else (source, None)
+
+
+@contextmanager
+def open_source(source: str, binary: bool = False, encoding: Optional[str] = None) -> Iterator[IO]:
+    """Opens CSV file or streams CSV member of zip archive given as <archive>!<member>, without unpacking it"""
+    archive, member = _split_source(source)
+    if member is None:
+        with (open(source, "rb") if binary else open(source, "r", encoding=encoding, newline="")) as source_f:
+            yield source_f
+    else:
+        with zipfile.ZipFile(archive) as zip_f, zip_f.open(member) as member_f:
+            yield member_f if binary else io.TextIOWrapper(member_f, encoding=encoding or "utf-8", newline="")
+
+
+def source_size_mtime(source: str) -> Tuple[int, float]:
+    archive, member = _split_source(source)
+    if member is None:
+        stat = os.stat(source)
+        return stat.st_size, stat.st_mtime
+    with zipfile.ZipFile(archive) as zip_f:
+        info = zip_f.getinfo(member)
+        return info.file_size, time.mktime(info.date_time + (0, 0, -1))
+
+
+def source_sha1(source: str) -> str:
+    digest = hashlib.sha1()
+    with open_source(source, binary=True) as source_:
+        for block in iter(lambda: source_.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
 def read_csv(csv_file: str, delimiter: str = ',') -> Generator[List[str], None, None]:
-    with open(csv_file, "r") as csv_f:
+    with open_source(csv_file) as csv_f:
         for line in csv.reader(csv_f, delimiter=delimiter, quotechar='"', quoting=csv.QUOTE_MINIMAL):
             if line:
                 yield line
 
 
+def read_csv_columns(csv_file: str, columns: Sequence[str], delimiter: str = ',',
+                     types: Optional[Sequence[Callable[[str], Any]]] = None) -> Generator[Tuple[Any, ...], None, None]:
+    """Yields tuples of given header columns only, converted with given types; skips BOM, header and short rows"""
+    with open_source(csv_file, encoding="utf-8-sig") as csv_f:
+        reader = csv.reader(csv_f, delimiter=delimiter, quotechar='"')
+        header = next(reader, None) or []
+        missing = [c for c in columns if c not in header]
+        if missing:
+            raise ValueError(f"CSV file {csv_file} lacks columns: {', '.join(missing)}")
+        indices = [header.index(c) for c in columns]
+        width = max(indices) + 1
+        project = itemgetter(*indices) if len(indices) > 1 else lambda fields: (fields[indices[0]],)
+        for fields in reader:
+            if len(fields) >= width:
+                values = project(fields)
+                yield tuple(t(v) for t, v in zip(types, values)) if types else values
+
+
 def write_csv(csv_file: str, rows: Iterable[List[str]], delimiter: str = ','):
     with open(csv_file, "w") as csv_f:
         writer = csv.writer(csv_f, delimiter=delimiter, quotechar='"', quoting=csv.QUOTE_MINIMAL)
@@ -1,3 +1,12 @@
+CREATE TABLE IF NOT EXISTS import_manifest
+(
+    path     VARCHAR PRIMARY KEY,
+    size     INTEGER                     NOT NULL,
+    mtime    FLOAT                       NOT NULL,
+    sha1     VARCHAR(40)                 NOT NULL,
+    imported TIMESTAMP WITHOUT TIME ZONE NOT NULL
+);
+
 CREATE TABLE IF NOT EXISTS place
 (
     location VARCHAR PRIMARY KEY,
@@ -10,14 +19,15 @@ CREATE TABLE IF NOT EXISTS place
 CREATE INDEX IF NOT EXISTS city_ix ON place (city);
 CREATE INDEX IF NOT EXISTS postcode_ix ON place (postcode);
 
-CREATE TABLE IF NOT EXISTS time_to_wroclaw
+DROP TABLE IF EXISTS time_to_wroclaw;
+CREATE TABLE IF NOT EXISTS drive_time
 (
-    city            VARCHAR,
-    time_to_wroclaw INTEGER
+    origin   VARCHAR NOT NULL,
+    location VARCHAR NOT NULL,
+    time_min INTEGER,
+    CONSTRAINT drive_time_pk PRIMARY KEY (origin, location)
 );
 
-CREATE INDEX IF NOT EXISTS time_to_wroclaw_city_ix ON time_to_wroclaw (city);
-
 CREATE TABLE IF NOT EXISTS parcel_offer
 (
     ident     VARCHAR                             NOT NULL,
@@ -33,29 +43,105 @@ CREATE TABLE IF NOT EXISTS parcel_offer
 CREATE INDEX IF NOT EXISTS title_ix ON parcel_offer (title);
 CREATE INDEX IF NOT EXISTS area_ix ON parcel_offer (area_m2);
 CREATE INDEX IF NOT EXISTS price_ix ON parcel_offer (price_pln);
-CREATE INDEX IF NOT EXISTS timestamp_ix ON parcel_offer (timestamp);
+DROP INDEX IF EXISTS timestamp_ix;
+CREATE INDEX IF NOT EXISTS offer_day_ix ON parcel_offer (timestamp, location, ident, url, price_pln, area_m2);
+
+CREATE TABLE IF NOT EXISTS offer_history
+(
+    ident         VARCHAR PRIMARY KEY,
+    first_offer   TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    last_offer    TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    highest_price FLOAT                       NOT NULL,
+    lowest_price  FLOAT                       NOT NULL,
+    area_m2       INT                         NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS offer_by_url
+(
+    url       VARCHAR(2000) PRIMARY KEY,
+    ident     VARCHAR                     NOT NULL,
+    timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    price_pln FLOAT                       NOT NULL,
+    area_m2   INT                         NOT NULL,
+    location  VARCHAR                     NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS offer_by_url_location_ix ON offer_by_url (location);
+
+CREATE TABLE IF NOT EXISTS city_avg_price
+(
+    city             VARCHAR PRIMARY KEY NOT NULL,
+    avg_price_per_m2 FLOAT               NOT NULL,
+    offer_count      INTEGER             NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS city_price_sum
+(
+    city             VARCHAR PRIMARY KEY NOT NULL,
+    price_per_m2_sum FLOAT               NOT NULL,
+    row_count        INTEGER             NOT NULL,
+    offer_count      INTEGER             NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS summary_refresh
+(
+    summary    VARCHAR PRIMARY KEY,
+    last_rowid INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS broadband_county
+(
+    id   INTEGER PRIMARY KEY,
+    name VARCHAR(40) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS broadband_city
+(
+    id   INTEGER PRIMARY KEY,
+    name VARCHAR(100) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS broadband_provider
+(
+    id   INTEGER PRIMARY KEY,
+    name VARCHAR(100) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS broadband_medium
+(
+    id   INTEGER PRIMARY KEY,
+    name VARCHAR(100) NOT NULL UNIQUE
+);
 
 CREATE TABLE IF NOT EXISTS broadband
 (
-    ident     VARCHAR(10)  NOT NULL,
-    planned   DATE         NULL,
-    county    VARCHAR(40)  NOT NULL,
-    city      VARCHAR(100) NOT NULL,
-    street    VARCHAR(200) NULL,
-    number    VARCHAR(20)  NULL,
-    provider  VARCHAR(100) NOT NULL,
-    medium    VARCHAR(100) NOT NULL,
-    bandwidth INTEGER      NOT NULL
+    ident       VARCHAR(10)  NOT NULL,
+    planned     DATE         NULL,
+    county_id   INTEGER      NOT NULL REFERENCES broadband_county (id),
+    city_id     INTEGER      NOT NULL REFERENCES broadband_city (id),
+    street      VARCHAR(200) NULL,
+    number      VARCHAR(20)  NULL,
+    provider_id INTEGER      NOT NULL REFERENCES broadband_provider (id),
+    medium_id   INTEGER      NOT NULL REFERENCES broadband_medium (id),
+    bandwidth   INTEGER      NOT NULL,
+    lat         FLOAT        NULL,
+    lon         FLOAT        NULL
 );
 
-CREATE INDEX IF NOT EXISTS broadband_city_ix ON broadband (city);
-CREATE INDEX IF NOT EXISTS broadband_street_ix ON broadband (street);
-CREATE INDEX IF NOT EXISTS broadband_number_ix ON broadband (number);
-CREATE INDEX IF NOT EXISTS broadband_provider_ix ON broadband (provider);
-CREATE INDEX IF NOT EXISTS broadband_medium_ix ON broadband (medium);
-CREATE INDEX IF NOT EXISTS broadband_bandwidth_ix ON broadband (bandwidth);
+CREATE INDEX IF NOT EXISTS broadband_city_ix ON broadband (city_id, provider_id, bandwidth);
+
+CREATE TABLE IF NOT EXISTS location_broadband
+(
+    location    VARCHAR PRIMARY KEY,
+    ap_count    INTEGER NOT NULL,
+    fiber_count INTEGER NOT NULL,
+    bw_min      INTEGER NOT NULL,
+    bw_avg      INTEGER NOT NULL,
+    bw_max      INTEGER NOT NULL
+);
 
-CREATE VIEW IF NOT EXISTS daily_price_avg AS
+DROP VIEW IF EXISTS daily_price_avg;
+CREATE VIEW daily_price_avg AS
 SELECT date(timestamp)                 AS "Date",
        round(avg(price_pln / area_m2)) AS "PricePerM2",
        count(DISTINCT ident)           AS "OfferCount"
@@ -65,8 +151,9 @@ WHERE area_m2 >= 800
 GROUP BY date(timestamp)
 ORDER BY date(timestamp);
 
-CREATE VIEW IF NOT EXISTS "city_broadband" AS
-SELECT broadband.city        AS City,
+DROP VIEW IF EXISTS "city_broadband";
+CREATE VIEW "city_broadband" AS
+SELECT city.name             AS City,
        count(*)              AS IspApCount,
        min(bandwidth)        AS BwMin,
        round(avg(bandwidth)) AS BwAvg,
@@ -74,108 +161,78 @@ SELECT broadband.city        AS City,
        p.lat                 AS "Lat",
        p.lon                 AS "Lon"
 FROM broadband
-         INNER JOIN place p on broadband.city = p.city
-WHERE (provider LIKE 'Orange%'
-    OR provider LIKE 'Netia%')
-GROUP BY broadband.city
-ORDER BY broadband.City;
+         INNER JOIN broadband_city city on broadband.city_id = city.id
+         INNER JOIN place p on city.name = p.city
+WHERE broadband.provider_id IN (SELECT id
+                                FROM broadband_provider
+                                WHERE name LIKE 'Orange%'
+                                   OR name LIKE 'Netia%')
+GROUP BY city.name
+ORDER BY city.name;
 
 
-CREATE VIEW IF NOT EXISTS latest_offers AS
-SELECT CAST(JulianDay(max(o.timestamp)) - JulianDay(min(OfferHistory."FirstOffer")) AS INTEGER) AS "Age",
+DROP VIEW IF EXISTS latest_offers;
+CREATE VIEW latest_offers AS
+SELECT CAST(JulianDay(max(o.timestamp)) - JulianDay(min(OfferHistory.first_offer)) AS INTEGER)  AS "Age",
        min(p.city)                                                                              AS "City",
        min(o.location)                                                                          AS "Location",
        round(min(o.price_pln) / min(o.area_m2))                                                 AS "PricePerSqM",
        round(min(o.area_m2) / 100)                                                              AS "Area",
-       max(CityAvgPrice."AvgPricePerM2") - round(min(o.price_pln) / min(o.area_m2))             AS "CheaperThanCityAvg",
-       round(max(OfferHistory."HighestPrice") - min(o.price_pln))                               AS "PriceDrop",
+       max(CityAvgPrice.avg_price_per_m2) - round(min(o.price_pln) / min(o.area_m2))            AS "CheaperThanCityAvg",
+       round(max(OfferHistory.highest_price) - min(o.price_pln))                                AS "PriceDrop",
        min(o.ident)                                                                             AS "ID",
        o.url                                                                                    AS "URL",
        min(p.lat)                                                                               AS "Lat",
        min(p.lon)                                                                               AS "Lon",
-       ttw.time_to_wroclaw                                                                      AS "TimeToWroclawMin",
-       inet.IspApCount                                                                          AS "NetApCount",
-       inet.BwMin                                                                               AS "NetBwMin",
-       inet.BwAvg                                                                               AS "NetBwAvg",
-       inet.BwMax                                                                               AS "NetBwMax"
+       ttw.time_min                                                                             AS "TimeToWroclawMin",
+       inet.ap_count                                                                            AS "NetApCount",
+       inet.bw_min                                                                              AS "NetBwMin",
+       inet.bw_avg                                                                              AS "NetBwAvg",
+       inet.bw_max                                                                              AS "NetBwMax",
+       inet.fiber_count                                                                         AS "NetFiberCount"
 FROM parcel_offer AS o
          LEFT JOIN place p on o.location = p.location
-         LEFT JOIN city_broadband AS inet ON p.city = inet.City
-         LEFT JOIN (SELECT city,
-                           round(avg(price_pln / area_m2)) AS "AvgPricePerM2"
-                    FROM parcel_offer
-                             LEFT JOIN place ON parcel_offer.location = place.location
-                    WHERE price_pln / area_m2 < 1000
-                      AND price_pln / area_m2 > 10
-                    GROUP BY city
-                    HAVING count(DISTINCT ident) >= 2
-                    ORDER BY round(avg(price_pln / area_m2)) DESC) AS CityAvgPrice ON p.city = CityAvgPrice.city
-         LEFT JOIN time_to_wroclaw AS ttw ON p.city = ttw.city
-         LEFT JOIN (SELECT ident,
-                           MIN(url),
-                           MIN(timestamp) AS "FirstOffer",
-                           MAX(timestamp) AS "LastOffer",
-                           MAX(price_pln) AS "HighestPrice",
-                           MIN(price_pln) AS "LowestPrice",
-                           MIN(area_m2)   AS "Area"
-                    FROM parcel_offer
-                    GROUP BY ident) AS OfferHistory ON o.ident = OfferHistory.ident
-WHERE date(o.timestamp) = CURRENT_DATE
+         LEFT JOIN location_broadband AS inet ON o.location = inet.location
+         LEFT JOIN city_avg_price AS CityAvgPrice ON p.city = CityAvgPrice.city
+         LEFT JOIN drive_time AS ttw ON ttw.origin = 'wroclaw' AND o.location = ttw.location
+         LEFT JOIN offer_history AS OfferHistory ON o.ident = OfferHistory.ident
+WHERE o.timestamp >= CURRENT_DATE
+  AND o.timestamp < date(CURRENT_DATE, '+1 day')
 GROUP BY o.url
 ORDER BY min(p.city), round(min(o.price_pln) / min(o.area_m2));
 
-CREATE VIEW IF NOT EXISTS last_10days_offers AS
-SELECT CAST(JulianDay(max(o.timestamp)) - JulianDay(min(OfferHistory."FirstOffer")) AS INTEGER) AS "Age",
+DROP VIEW IF EXISTS last_10days_offers;
+CREATE VIEW last_10days_offers AS
+SELECT CAST(JulianDay(max(o.timestamp)) - JulianDay(min(OfferHistory.first_offer)) AS INTEGER)  AS "Age",
        min(p.city)                                                                              AS "City",
        min(o.location)                                                                          AS "Location",
        round(min(o.price_pln) / min(o.area_m2))                                                 AS "PricePerSqM",
        round(min(o.area_m2) / 100)                                                              AS "Area",
-       max(CityAvgPrice."AvgPricePerM2") - round(min(o.price_pln) / min(o.area_m2))             AS "CheaperThanCityAvg",
-       round(max(OfferHistory."HighestPrice") - min(o.price_pln))                               AS "PriceDrop",
+       max(CityAvgPrice.avg_price_per_m2) - round(min(o.price_pln) / min(o.area_m2))            AS "CheaperThanCityAvg",
+       round(max(OfferHistory.highest_price) - min(o.price_pln))                                AS "PriceDrop",
        min(o.ident)                                                                             AS "ID",
        o.url                                                                                    AS "URL",
        min(p.lat)                                                                               AS "Lat",
        min(p.lon)                                                                               AS "Lon"
 FROM parcel_offer AS o
          LEFT JOIN place p on o.location = p.location
-         LEFT JOIN (SELECT city,
-                           round(avg(price_pln / area_m2)) AS "AvgPricePerM2"
-                    FROM parcel_offer
-                             LEFT JOIN place ON parcel_offer.location = place.location
-                    WHERE price_pln / area_m2 < 1000
-                      AND price_pln / area_m2 > 10
-                    GROUP BY city
-                    HAVING count(DISTINCT ident) >= 2
-                    ORDER BY round(avg(price_pln / area_m2)) DESC) AS CityAvgPrice ON p.city = CityAvgPrice.city
-         LEFT JOIN (SELECT ident,
-                           MIN(url),
-                           MIN(timestamp) AS "FirstOffer",
-                           MAX(timestamp) AS "LastOffer",
-                           MAX(price_pln) AS "HighestPrice",
-                           MIN(price_pln) AS "LowestPrice",
-                           MIN(area_m2)   AS "Area"
-                    FROM parcel_offer
-                    GROUP BY ident) AS OfferHistory ON o.ident = OfferHistory.ident
-WHERE date(o.timestamp) = CURRENT_DATE
+         LEFT JOIN city_avg_price AS CityAvgPrice ON p.city = CityAvgPrice.city
+         LEFT JOIN offer_history AS OfferHistory ON o.ident = OfferHistory.ident
+WHERE o.timestamp >= CURRENT_DATE
+  AND o.timestamp < date(CURRENT_DATE, '+1 day')
 GROUP BY o.url
-HAVING CAST(JulianDay(max(o.timestamp)) - JulianDay(min(OfferHistory."FirstOffer")) AS INTEGER) <= 10
+HAVING CAST(JulianDay(max(o.timestamp)) - JulianDay(min(OfferHistory.first_offer)) AS INTEGER) <= 10
    AND round(min(o.price_pln) / min(o.area_m2)) <= 150
 ORDER BY min(p.city), round(min(o.price_pln) / min(o.area_m2));
 
-CREATE VIEW IF NOT EXISTS "avg_city_price" AS
+DROP VIEW IF EXISTS "avg_city_price";
+CREATE VIEW "avg_city_price" AS
 SELECT city                            AS "City",
        round(avg(price_pln / area_m2)) AS "AvgPricePerM2",
        count(url)                      AS "OfferCount",
        min(lat)                        AS "Lat",
        min(lon)                        AS "Lon"
-FROM (SELECT url,
-             min(ident)     "ident",
-             max(timestamp) "timestamp",
-             min(price_pln) "price_pln",
-             min(area_m2)   "area_m2",
-             min(location)  "location"
-      FROM parcel_offer
-      GROUP BY url) AS offer
+FROM offer_by_url AS offer
          LEFT JOIN place ON offer.location = place.location
 WHERE offer.price_pln / offer.area_m2 < 1000
   AND offer.price_pln / offer.area_m2 > 5
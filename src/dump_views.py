@@ -2,65 +2,112 @@
 
 import argparse
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from logging import getLogger
 from os import path
-from typing import List, Optional
+from pathlib import Path
+from threading import local, Lock
+from typing import List, Optional, Dict, Iterator, Any
 
 from common import write_csv, setup_log
 
+DEFAULT_VIEWS = ("city_broadband", "latest_offers", "avg_city_price", "daily_price_avg", "last_10days_offers")
+FETCH_SIZE = 1000
 
-def main(sqlite_db: str, output_path: str, headers: bool = False):
+
+class ReadOnlyConnectionPool:
+    """Hands out one read-only connection per thread, reused for all queries executed by that thread"""
+
+    def __init__(self, sqlite_db: str):
+        self.db_uri = f"{Path(sqlite_db).resolve().as_uri()}?mode=ro"
+        self._thread_local = local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = Lock()
+
+    def get(self) -> sqlite3.Connection:
+        db_conn = getattr(self._thread_local, "db_conn", None)
+        if db_conn is None:
+            db_conn = sqlite3.connect(self.db_uri, uri=True, check_same_thread=False)
+            self._thread_local.db_conn = db_conn
+            with self._lock:
+                self._connections.append(db_conn)
+        return db_conn
+
+    def close(self):
+        with self._lock:
+            for db_conn in self._connections:
+                db_conn.close()
+            self._connections.clear()
+
+
+def main(sqlite_db: str, output_path: str, headers: bool = False, views: Optional[List[str]] = None,
+         queries: Optional[Dict[str, str]] = None, workers: int = 4):
     setup_log()
-    _export_query(sqlite_db, "SELECT * FROM city_broadband", path.join(output_path, "city_broadband.csv"),
-                  header_table="city_broadband" if headers else None)
-    _export_query(sqlite_db, "SELECT * FROM latest_offers", path.join(output_path, "latest_offers.csv"),
-                  header_table="latest_offers" if headers else None)
-    _export_query(sqlite_db, "SELECT * FROM avg_city_price", path.join(output_path, "avg_city_price.csv"),
-                  header_table="avg_city_price" if headers else None)
-    _export_query(sqlite_db, "SELECT * FROM daily_price_avg", path.join(output_path, "daily_price_avg.csv"),
-                  header_table="daily_price_avg" if headers else None)
-    _export_query(sqlite_db, "SELECT * FROM last_10days_offers", path.join(output_path, "last_10days_offers.csv"),
-                  header_table="last_10days_offers" if headers else None)
-
-
-def _export_query(sqlite_db: str, query: str, output_csv: str, header_table: Optional[str] = None):
     log = getLogger()
-    db_conn: sqlite3.Connection = sqlite3.connect(sqlite_db)
+    if views is None:
+        views = [] if queries else list(DEFAULT_VIEWS)
+    exports = {view: f"SELECT * FROM {view}" for view in views}
+    exports.update(queries or {})
 
-    col_names = []
+    pool = ReadOnlyConnectionPool(sqlite_db)
     try:
-        if header_table:
-            col_names = [_get_col_names(db_conn, header_table)]
-    except (OSError, sqlite3.DatabaseError) as e:
-        log.error(f"Could not dump table column names from DB {sqlite_db}/{header_table}: {e}")
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            futures = [executor.submit(export_query, pool, query, path.join(output_path, f"{name}.csv"), headers)
+                       for name, query in exports.items()]
+            exported = sum(f.result() for f in futures)
+    finally:
+        pool.close()
+    log.info(f"Exported {exported} out of {len(exports)} queries from {sqlite_db} into {output_path}")
+
 
-    cursor = db_conn.cursor()
+def export_query(pool: ReadOnlyConnectionPool, query: str, output_csv: str, headers: bool = False) -> bool:
+    log = getLogger()
+    cursor = pool.get().cursor()
     try:
         cursor.execute(query)
-        rows = cursor.fetchall()
-        col_names.extend(rows)
-        write_csv(csv_file=output_csv, rows=col_names)
+        write_csv(csv_file=output_csv, rows=stream_rows(cursor, headers))
+        log.info(f"Exported query {query} into {output_csv}")
+        return True
     except (OSError, sqlite3.DatabaseError) as e:
-        log.error(f"Could not dump query {query} from DB {sqlite_db}: {e}")
+        log.error(f"Could not dump query {query} from DB {pool.db_uri}: {e}")
+        return False
+    finally:
         cursor.close()
-        db_conn.close()
 
 
-def _get_col_names(db_conn: sqlite3.Connection, table: str) -> List[str]:
-    return [col[1] for col in db_conn.execute(f"pragma table_info('{table}')")]
+def stream_rows(cursor: sqlite3.Cursor, headers: bool = False) -> Iterator[List[Any]]:
+    if headers:
+        yield [col[0] for col in cursor.description]
+    rows = cursor.fetchmany(FETCH_SIZE)
+    while rows:
+        yield from rows
+        rows = cursor.fetchmany(FETCH_SIZE)
+
+
+def _parse_query(name_and_query: str) -> Dict[str, str]:
+    name, sep, query = name_and_query.partition("=")
+    if not sep or not name.strip() or not query.strip():
+        raise argparse.ArgumentTypeError(f"Expected NAME=QUERY, got: {name_and_query}")
+    return {name.strip(): query.strip()}
 
 
 def _parse_args() -> argparse.Namespace:
-    parser = argparse.ArgumentParser(description='Merges base isochrone map with given additional GeoJSON features')
+    parser = argparse.ArgumentParser(description='Export DB views and queries into CSV files')
     parser.add_argument('db', type=str, help='Path to populated sqlite3 DB')
     parser.add_argument('output', type=str, help='Path to directory where CSV files should be written to')
     parser.add_argument('--headers', action='store_true', help='Add header row with column names')
+    parser.add_argument('--views', nargs='+', default=None,
+                        help=f'Views to export into <view>.csv, defaults to: {", ".join(DEFAULT_VIEWS)}')
+    parser.add_argument('--query', type=_parse_query, action='append', default=[],
+                        help='Additional query to export into <name>.csv, given as NAME=QUERY')
+    parser.add_argument('--workers', type=int, default=4, help='Number of views exported concurrently')
     return parser.parse_args()
 
 
 def cli_main():
     args = _parse_args()
-    main(args.db, args.output, args.headers)
+    queries = {name: query for q in args.query for name, query in q.items()}
+    main(args.db, args.output, args.headers, args.views, queries, args.workers)
 
 
 if __name__ == '__main__':
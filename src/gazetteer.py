@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+import argparse
+import re
+from collections import Counter, defaultdict
+from difflib import get_close_matches
+from logging import getLogger, Logger
+from typing import Dict, Tuple, Optional, List, Iterable
+
+from common import setup_log, read_csv, read_csv_columns, write_csv, list_csv_files
+from model import Place
+from place_resolver import MapQuestClient, build_resolve_name
+
+_STREET_RE = re.compile(r"(?:ul\.|ul |ulica |al\.|al |aleja |pl\.|plac |os\.|osiedle )\s*(.+)", re.IGNORECASE)
+
+Coordinates = Tuple[float, float, str]
+
+
+def _key(name: Optional[str]) -> str:
+    return " ".join(name.lower().split()) if name else ""
+
+
+def _street_key(street: Optional[str]) -> str:
+    match = _STREET_RE.match(street.strip()) if street else None
+    return _key(match.group(1) if match else street)
+
+
+class Gazetteer:
+    """Index of town (optionally county- or street-qualified) names to WGS84 coordinates and city name"""
+
+    def __init__(self, entries: Iterable[Tuple[str, str, str, float, float, str]]):
+        self.by_town_county: Dict[Tuple[str, str], Coordinates] = {}
+        self.by_town_street: Dict[Tuple[str, str, str], Coordinates] = {}
+        by_town: Dict[str, List[Coordinates]] = defaultdict(list)
+        by_street: Dict[Tuple[str, str], List[Coordinates]] = defaultdict(list)
+        for town, county, street, lat, lon, city in entries:
+            if street:
+                if (town, county, street) not in self.by_town_street:
+                    self.by_town_street[(town, county, street)] = (lat, lon, city)
+                    by_street[(town, street)].append((lat, lon, city))
+            elif (town, county) not in self.by_town_county:
+                self.by_town_county[(town, county)] = (lat, lon, city)
+                by_town[town].append((lat, lon, city))
+        # town names shared by several counties are only resolvable with the county given
+        self.by_town = {town: coords[0] for town, coords in by_town.items() if len(coords) == 1}
+        self._by_street = {key: coords[0] for key, coords in by_street.items() if len(coords) == 1}
+        self._town_names = sorted(self.by_town_county.keys())
+
+    def __len__(self):
+        return len(self.by_town_county) + len(self.by_town_street)
+
+    def locate(self, town: str, county: Optional[str] = None, street: Optional[str] = None,
+               fuzzy_cutoff: float = 0.85) -> Optional[Coordinates]:
+        town, county, street = _key(town), _key(county), _street_key(street)
+        found = (street and county and self.by_town_street.get((town, county, street))) \
+                or (street and self._by_street.get((town, street))) \
+                or (county and self.by_town_county.get((town, county))) \
+                or self.by_town.get(town)
+        if found or fuzzy_cutoff >= 1.:
+            return found
+        if county:
+            candidates = [t for t, c in self._town_names if c == county]
+            for close_town in get_close_matches(town, candidates, n=1, cutoff=fuzzy_cutoff):
+                return self.by_town_county[(close_town, county)]
+        for close_town in get_close_matches(town, self.by_town.keys(), n=1, cutoff=fuzzy_cutoff):
+            return self.by_town[close_town]
+        return None
+
+    def rows(self) -> List[List[str]]:
+        return sorted([[t, c, "", lat, lon, city] for (t, c), (lat, lon, city) in self.by_town_county.items()]
+                      + [[t, c, s, lat, lon, city] for (t, c, s), (lat, lon, city) in self.by_town_street.items()])
+
+    @classmethod
+    def load(cls, gazetteer_csv: str) -> 'Gazetteer':
+        return cls((r[0], r[1], r[2], float(r[3]), float(r[4]), r[5]) for r in read_csv(gazetteer_csv))
+
+    def save(self, gazetteer_csv: str):
+        write_csv(gazetteer_csv, self.rows())
+
+    @classmethod
+    def build(cls, place_cache: str, popc_files: List[str]) -> 'Gazetteer':
+        entries = list(_entries_from_place_cache(place_cache))
+        entries.extend(_entries_from_popc(popc_files))
+        return cls(entries)
+
+
+def _entries_from_place_cache(place_cache: str) -> Iterable[Tuple[str, str, str, float, float, str]]:
+    for place in filter(None, map(Place.from_csv_row, read_csv(place_cache))):
+        if place.city:
+            query_parts = build_resolve_name(None, place.location).split(", ")
+            if _key(query_parts[0]) == _key(place.city):
+                county = query_parts[1] if len(query_parts) > 1 else ""
+                yield _key(place.city), _key(county), "", place.lat, place.lon, place.city
+
+
+def _entries_from_popc(popc_files: List[str]) -> Iterable[Tuple[str, str, str, float, float, str]]:
+    town_points: Dict[Tuple[str, str, str], List[Tuple[float, float]]] = defaultdict(list)
+    town_names: Dict[Tuple[str, str], str] = {}
+    for popc_file in popc_files:
+        for county_name, town_name, street, x84, y84 in read_csv_columns(
+                popc_file, ("powiat", "miejscowosc", "ulica", "x84", "y84"), delimiter=';'):
+            try:
+                lon, lat = float(x84.replace(",", ".")), float(y84.replace(",", "."))
+            except ValueError:
+                continue
+            town, county = _key(town_name), _key(county_name)
+            town_names.setdefault((town, county), town_name.strip().title())
+            town_points[(town, county, "")].append((lat, lon))
+            if street.strip():
+                town_points[(town, county, _street_key(street))].append((lat, lon))
+    for (town, county, street), points in town_points.items():
+        lat, lon = sum(p[0] for p in points) / len(points), sum(p[1] for p in points) / len(points)
+        yield town, county, street, round(lat, 7), round(lon, 7), town_names[(town, county)]
+
+
+class OfflineGeocoder:
+    """Drop-in replacement for MapQuestClient answering from Gazetteer, falling back to given client on misses"""
+
+    def __init__(self, gazetteer: Gazetteer, log: Logger, fallback: Optional[MapQuestClient] = None):
+        self.gazetteer = gazetteer
+        self.log = log
+        self.fallback = fallback
+        self.stats = Counter()
+
+    def resolve(self, query_address: str, location: str) -> Optional[Place]:
+        query_parts = [p.strip() for p in query_address.split(",")]
+        street = next((p for p in location.split(",") if _STREET_RE.match(p.strip())), None)
+        found = self.gazetteer.locate(query_parts[0], query_parts[1] if len(query_parts) > 1 else None, street)
+        if found:
+            self.stats["offline"] += 1
+            lat, lon, city = found
+            return Place(location, city, None, lat, lon)
+        self.stats["fallback"] += 1
+        return self.fallback.resolve(query_address, location) if self.fallback else None
+
+    def close(self):
+        if self.fallback:
+            self.fallback.close()
+
+
+def main(place_cache: str, popc_path: str, output: str):
+    setup_log()
+    log = getLogger()
+    log.info(f"Building gazetteer from {place_cache} and UKE POPC files under {popc_path}...")
+    gazetteer = Gazetteer.build(place_cache, list_csv_files(popc_path))
+    log.info(f"Writing gazetteer with {len(gazetteer.by_town_county)} towns and {len(gazetteer.by_town_street)} "
+             f"streets into {output}")
+    gazetteer.save(output)
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Build offline gazetteer out of places cache and UKE POPC data')
+    parser.add_argument('place_cache', type=str, help='Path to places cache CSV file')
+    parser.add_argument('popc', type=str, help='Path to directory containing UKE POPC CSV files')
+    parser.add_argument('output', type=str, help='Path to output gazetteer CSV file')
+    return parser.parse_args()
+
+
+def cli_main():
+    args = _parse_args()
+    main(args.place_cache, args.popc, args.output)
+
+
+if __name__ == '__main__':
+    cli_main()
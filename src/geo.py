@@ -0,0 +1,83 @@
+from typing import Tuple
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+
+# PUWG-1992 (EPSG:2180): transverse Mercator on GRS80, central meridian 19°E
+_GRS80_A = 6378137.
+_GRS80_F = 1 / 298.257222101
+_PUWG92_K0 = 0.9993
+_PUWG92_LON0 = np.radians(19.)
+_PUWG92_FALSE_EASTING = 500000.
+_PUWG92_FALSE_NORTHING = -5300000.
+
+_N = _GRS80_F / (2 - _GRS80_F)
+_RECTIFYING_RADIUS = _GRS80_A / (1 + _N) * (1 + _N ** 2 / 4 + _N ** 4 / 64)
+_BETA = (_N / 2 - 2 * _N ** 2 / 3 + 37 * _N ** 3 / 96 - _N ** 4 / 360,
+         _N ** 2 / 48 + _N ** 3 / 15 - 437 * _N ** 4 / 1440,
+         17 * _N ** 3 / 480 - 37 * _N ** 4 / 840,
+         4397 * _N ** 4 / 161280)
+_DELTA = (2 * _N - 2 * _N ** 2 / 3 - 2 * _N ** 3 + 116 * _N ** 4 / 45,
+          7 * _N ** 2 / 3 - 8 * _N ** 3 / 5 - 227 * _N ** 4 / 45,
+          56 * _N ** 3 / 15 - 136 * _N ** 4 / 35,
+          4279 * _N ** 4 / 630)
+
+
+def puwg92_to_wgs84(x92: np.ndarray, y92: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Converts PUWG-1992 easting (x92 in UKE data) and northing (y92) into WGS84 latitude and longitude in degrees"""
+    xi = (np.asarray(y92, dtype=np.float64) - _PUWG92_FALSE_NORTHING) / (_PUWG92_K0 * _RECTIFYING_RADIUS)
+    eta = (np.asarray(x92, dtype=np.float64) - _PUWG92_FALSE_EASTING) / (_PUWG92_K0 * _RECTIFYING_RADIUS)
+    xi_prim, eta_prim = xi.copy(), eta.copy()
+    for j, beta in enumerate(_BETA, start=1):
+        xi_prim -= beta * np.sin(2 * j * xi) * np.cosh(2 * j * eta)
+        eta_prim -= beta * np.cos(2 * j * xi) * np.sinh(2 * j * eta)
+    chi = np.arcsin(np.sin(xi_prim) / np.cosh(eta_prim))
+    lat = chi + sum(delta * np.sin(2 * j * chi) for j, delta in enumerate(_DELTA, start=1))
+    lon = _PUWG92_LON0 + np.arctan2(np.sinh(eta_prim), np.cos(xi_prim))
+    return np.degrees(lat), np.degrees(lon)
+
+
+class PointGrid:
+    """Buckets points into square cells for radius queries, distances taken on local equirectangular projection"""
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, cell_m: float = 200.):
+        lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+        self.cell_m = cell_m
+        self.cos_lat = np.cos(np.radians(np.mean(lat))) if len(lat) else 1.
+        x, y = self._project(lat, lon)
+        keys = self._cell_key(np.floor(x / cell_m), np.floor(y / cell_m))
+        self.order = np.argsort(keys, kind="stable")
+        self.keys, self.x, self.y = keys[self.order], x[self.order], y[self.order]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _project(self, lat: np.ndarray, lon: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return EARTH_RADIUS_M * np.radians(lon) * self.cos_lat, EARTH_RADIUS_M * np.radians(lat)
+
+    @staticmethod
+    def _cell_key(cell_x: np.ndarray, cell_y: np.ndarray) -> np.ndarray:
+        return cell_x.astype(np.int64) * (1 << 32) + cell_y.astype(np.int64)
+
+    def within(self, lat: np.ndarray, lon: np.ndarray, radius_m: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns query index, point index and distance in meters for all point pairs no further than radius_m"""
+        lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+        x, y = self._project(lat, lon)
+        reach = int(np.ceil(radius_m / self.cell_m))
+        cell_x, cell_y = np.floor(x / self.cell_m), np.floor(y / self.cell_m)
+        queries, points, distances = [], [], []
+        for dx in range(-reach, reach + 1):
+            for dy in range(-reach, reach + 1):
+                keys = self._cell_key(cell_x + dx, cell_y + dy)
+                start = np.searchsorted(self.keys, keys, side="left")
+                counts = np.searchsorted(self.keys, keys, side="right") - start
+                query = np.repeat(np.arange(len(keys)), counts)
+                offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+                point = np.repeat(start, counts) + offsets
+                distance = np.hypot(self.x[point] - x[query], self.y[point] - y[query])
+                close = distance <= radius_m
+                queries.append(query[close])
+                points.append(self.order[point[close]])
+                distances.append(distance[close])
+        return np.concatenate(queries), np.concatenate(points), np.concatenate(distances)
@@ -2,15 +2,95 @@
 
 import argparse
 import sqlite3
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime
+from functools import lru_cache
+from math import isnan
 from logging import getLogger, Logger
-from typing import List, Optional, Iterable
+from os import path
+from typing import List, Optional, Iterable, Iterator, Sequence, Any, Dict, Tuple, Callable, Deque
 
+import numpy as np
 from more_itertools import chunked
 
-from common import setup_log, read_csv, list_csv_files
+from common import setup_log, read_csv, read_csv_columns, list_csv_files, list_csv_sources, source_size_mtime, \
+    source_sha1
+from geo import puwg92_to_wgs84, PointGrid
 from model import Place, ParcelOffer, BroadbandAccess
 
+CHUNK_SIZE = 500
+BULK_CHUNK_SIZE = 5000
+BULK_LOAD_PRAGMAS = ("PRAGMA journal_mode = MEMORY",
+                     "PRAGMA synchronous = OFF",
+                     "PRAGMA cache_size = -65536",
+                     "PRAGMA temp_store = MEMORY")
+# INSERT ... ON CONFLICT (UPSERT) used by inserts and summary refreshes appeared in SQLite 3.24
+MIN_SQLITE_VERSION = (3, 24, 0)
+ON_CONFLICT_IGNORE = "ignore"
+ON_CONFLICT_REPLACE = "replace"
+BROADBAND_RADIUS_M = 200.
+FIBER_MEDIUM = "Światłowodowe"
+# providers counted around places, same as in city_broadband view
+BROADBAND_PROVIDER_PATTERNS = ("Orange%", "Netia%")
+BROADBAND_DIMENSIONS = ((2, "broadband_county"), (3, "broadband_city"), (6, "broadband_provider"),
+                        (7, "broadband_medium"))
+INCREMENTAL_SUMMARY_QUERIES = {
+    "offer_history": """INSERT INTO offer_history
+                        SELECT ident, min(timestamp), max(timestamp), max(price_pln), min(price_pln), min(area_m2)
+                        FROM parcel_offer
+                        WHERE rowid > ? AND rowid <= ?
+                        GROUP BY ident
+                        ON CONFLICT (ident) DO UPDATE SET first_offer   = min(first_offer, excluded.first_offer),
+                                                          last_offer    = max(last_offer, excluded.last_offer),
+                                                          highest_price = max(highest_price, excluded.highest_price),
+                                                          lowest_price  = min(lowest_price, excluded.lowest_price),
+                                                          area_m2       = min(area_m2, excluded.area_m2)""",
+    "offer_by_url": """INSERT INTO offer_by_url
+                       SELECT url, min(ident), max(timestamp), min(price_pln), min(area_m2), min(location)
+                       FROM parcel_offer
+                       WHERE rowid > ? AND rowid <= ?
+                       GROUP BY url
+                       ON CONFLICT (url) DO UPDATE SET ident     = min(ident, excluded.ident),
+                                                       timestamp = max(timestamp, excluded.timestamp),
+                                                       price_pln = min(price_pln, excluded.price_pln),
+                                                       area_m2   = min(area_m2, excluded.area_m2),
+                                                       location  = min(location, excluded.location)""",
+    # offer counts once per city, in the first refresh which sees it there
+    "city_price_sum": """INSERT INTO city_price_sum
+                         SELECT place.city, sum(o.price_pln / o.area_m2), count(*),
+                                count(DISTINCT CASE
+                                    WHEN NOT EXISTS(SELECT 1
+                                                    FROM parcel_offer AS seen
+                                                             INNER JOIN place AS seen_place
+                                                                        ON seen.location = seen_place.location
+                                                    WHERE seen.ident = o.ident
+                                                      AND seen.rowid <= ?1
+                                                      AND seen_place.city = place.city
+                                                      AND seen.price_pln / seen.area_m2 < 1000
+                                                      AND seen.price_pln / seen.area_m2 > 10)
+                                        THEN o.ident END)
+                         FROM parcel_offer AS o
+                                  INNER JOIN place ON o.location = place.location
+                         WHERE o.rowid > ?1 AND o.rowid <= ?2
+                           AND o.price_pln / o.area_m2 < 1000
+                           AND o.price_pln / o.area_m2 > 10
+                           AND place.city IS NOT NULL
+                         GROUP BY place.city
+                         ON CONFLICT (city) DO UPDATE SET price_per_m2_sum = price_per_m2_sum
+                                                                             + excluded.price_per_m2_sum,
+                                                          row_count        = row_count + excluded.row_count,
+                                                          offer_count      = offer_count + excluded.offer_count"""
+}
+# summaries joining offers with places, rebuilt when places cache is reimported
+PLACE_SUMMARIES = ("city_price_sum",)
+CITY_AVG_PRICE_QUERY = """INSERT INTO city_avg_price
+                          SELECT city, round(price_per_m2_sum / row_count), offer_count
+                          FROM city_price_sum
+                          WHERE offer_count >= 2"""
+
 
 def _init_tables(db_conn, ddl_script):
     with open(ddl_script, "r") as ddl_f:
@@ -27,100 +107,367 @@ def _parse_bandwidth(bandwidth: str) -> Optional[int]:
         return None
 
 
-def _filter_fields_from_curr_inet_csv_row(row: List[str]) -> Optional[List[str]]:
-    if len(row) > 12:
-        bandwidth = _parse_bandwidth(row[12])
-        return [row[0].strip(), None, row[3].strip().title(), row[5].strip().title(), row[7].strip().title() or None,
-                row[8].strip().title() or None, row[11].strip().title(), row[13].strip().title(), bandwidth] \
-            if bandwidth else None
-    else:
+def _parse_coordinate(coordinate: str) -> Optional[float]:
+    try:
+        return float(coordinate.replace(",", "."))
+    except ValueError:
         return None
 
 
-def _filter_fields_from_planned_inet_csv_row(row: List[str]) -> Optional[List[str]]:
-    if len(row) > 15:
-        bandwidth = _parse_bandwidth(row[5])
-        return [row[0].strip(), datetime.strptime(row[4], "%Y%m%d").date().isoformat(),
-                row[8].strip().title(), row[12].strip().title() or None, row[14].strip().title() or None,
-                row[15].strip().title(), row[1].strip().title(), row[3].strip().title(), bandwidth] \
-            if bandwidth else None
-    else:
+@lru_cache(maxsize=1 << 16)
+def _title(value: str) -> Optional[str]:
+    return value.strip().title() or None
+
+
+def _parse_planned_date(planned: str) -> Optional[str]:
+    try:
+        return datetime.strptime(planned, "%Y%m%d").date().isoformat()
+    except ValueError:
         return None
 
 
-def main(db_file: str, ddl_script: str, place_cache: str, time_to_wro: str, offers_path: str, inet_curr: str,
-         inet_popc: str):
+# UKE header columns projected into broadband rows: ident, planned, county, city, street, number, provider, medium,
+# bandwidth and PUWG-1992 x, y coordinates
+CURR_INET_COLUMNS = ("id", "powiat", "miejscowosc", "ulica", "nr_domu", "nazwa_podmiotu", "medium",
+                     "maksymalna_predkosc", "x92", "y92")
+CURR_INET_TYPES = (str.strip, _title, _title, _title, _title, _title, _title, _parse_bandwidth, _parse_coordinate,
+                   _parse_coordinate)
+PLANNED_INET_COLUMNS = ("id_pa", "plan_data_oddania", "powiat", "miejscowosc", "ulica", "numer_porzadkowy",
+                        "nazwa_podmiotu", "medium", "przepustowosc", "x92", "y92")
+PLANNED_INET_TYPES = (str.strip, _parse_planned_date, _title, _title, _title, _title, _title, _title, _parse_bandwidth,
+                      _parse_coordinate, _parse_coordinate)
+
+
+def _filter_fields_from_curr_inet_csv_row(row: Tuple[Any, ...]) -> Optional[List[Any]]:
+    ident, county, city, street, number, provider, medium, bandwidth, x92, y92 = row
+    return [ident, None, county, city, street, number, provider, medium, bandwidth, x92, y92] if bandwidth else None
+
+
+def _filter_fields_from_planned_inet_csv_row(row: Tuple[Any, ...]) -> Optional[List[Any]]:
+    return list(row) if row[8] and row[1] else None
+
+
+def _is_imported(db_conn: sqlite3.Connection, source_file: str) -> bool:
+    size, mtime = source_size_mtime(source_file)
+    entry = db_conn.execute("SELECT size, mtime, sha1 FROM import_manifest WHERE path = ?",
+                            (path.normpath(source_file),)).fetchone()
+    if entry is None or entry[0] != size:
+        return False
+    elif entry[1] == mtime:
+        return True
+    elif entry[2] == source_sha1(source_file):
+        _mark_imported(db_conn, source_file)
+        return True
+    else:
+        return False
+
+
+def _mark_imported(db_conn: sqlite3.Connection, source_file: str):
+    size, mtime = source_size_mtime(source_file)
+    db_conn.execute("INSERT OR REPLACE INTO import_manifest VALUES (?,?,?,?,?)",
+                    (path.normpath(source_file), size, mtime, source_sha1(source_file),
+                     datetime.utcnow().replace(microsecond=0).isoformat()))
+
+
+def _needs_import(db_conn: sqlite3.Connection, source_files: List[str], incremental: bool) -> bool:
+    return not incremental or not all(_is_imported(db_conn, f) for f in source_files)
+
+
+def _drop_indexes(db_conn: sqlite3.Connection) -> List[str]:
+    indexes = db_conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL").fetchall()
+    for name, _ in indexes:
+        db_conn.execute(f"DROP INDEX {name}")
+    return [sql for _, sql in indexes]
+
+
+def _create_indexes(db_conn: sqlite3.Connection, index_ddl: List[str], log: Logger):
+    start = time.perf_counter()
+    for ddl in index_ddl:
+        db_conn.execute(ddl)
+    db_conn.commit()
+    log.info(f"Built {len(index_ddl)} indexes in {time.perf_counter() - start:.2f}s")
+
+
+def _insert_query(db_conn: sqlite3.Connection, table: str, on_conflict: str) -> str:
+    columns = db_conn.execute(f"PRAGMA table_info('{table}')").fetchall()
+    query = f"INSERT INTO {table} VALUES ({','.join('?' * len(columns))})"
+    key_columns = [col[1] for col in sorted(columns, key=lambda col: col[5]) if col[5]]
+    if not key_columns:
+        return query
+    elif on_conflict == ON_CONFLICT_REPLACE:
+        updates = ", ".join(f"{col[1]} = excluded.{col[1]}" for col in columns if not col[5])
+        return f"{query} ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {updates}"
+    else:
+        return f"{query} ON CONFLICT DO NOTHING"
+
+
+def _insert_rows(db_conn: sqlite3.Connection, table: str, rows: Iterable[Sequence[Any]], log: Logger,
+                 bulk: bool = False, on_conflict: str = ON_CONFLICT_IGNORE) -> Counter:
+    """Inserts rows in chunks, returns total, inserted, duplicate and rejected row counts; rows overwritten with
+    replace conflict policy count as inserted"""
+    query = _insert_query(db_conn, table, on_conflict)
+    stats, start = Counter(), time.perf_counter()
+    if bulk and not db_conn.in_transaction:
+        # otherwise releasing the savepoint of each chunk would commit it
+        db_conn.execute("BEGIN")
+    for rows_chunk in chunked(rows, BULK_CHUNK_SIZE if bulk else CHUNK_SIZE):
+        stats["total"] += len(rows_chunk)
+        db_conn.execute("SAVEPOINT insert_chunk")
+        changes_before = db_conn.total_changes
+        try:
+            db_conn.executemany(query, rows_chunk)
+        except sqlite3.IntegrityError:
+            # constraint other than the conflict key failed, so undo the partial chunk and isolate offending rows
+            db_conn.execute("ROLLBACK TO insert_chunk")
+            changes_before = db_conn.total_changes
+            for row in rows_chunk:
+                try:
+                    db_conn.execute(query, row)
+                except sqlite3.IntegrityError as e:
+                    stats["rejected"] += 1
+                    log.debug(f"Rejected row {row} for {table}: {e}")
+        stats["inserted"] += db_conn.total_changes - changes_before
+        db_conn.execute("RELEASE insert_chunk")
+        if not bulk:
+            db_conn.commit()
+    db_conn.commit()
+    elapsed = time.perf_counter() - start
+    stats["duplicate"] = stats["total"] - stats["inserted"] - stats["rejected"]
+    log.info(f"Inserted {stats['inserted']} rows into {table} in {elapsed:.2f}s "
+             f"({stats['total'] / max(elapsed, 1e-6):.0f} rows/s), "
+             f"{stats['duplicate']} duplicate, {stats['rejected']} rejected")
+    return stats
+
+
+def _with_wgs84_coordinates(rows: List[List[Any]]) -> List[List[Any]]:
+    """Replaces trailing PUWG-1992 x92, y92 coordinates of broadband rows with WGS84 latitude and longitude"""
+    x92 = np.array([r[-2] if r[-2] is not None else np.nan for r in rows], dtype=np.float64)
+    y92 = np.array([r[-1] if r[-1] is not None else np.nan for r in rows], dtype=np.float64)
+    lat, lon = puwg92_to_wgs84(x92, y92)
+    for row, row_lat, row_lon in zip(rows, lat.tolist(), lon.tolist()):
+        row[-2], row[-1] = (round(row_lat, 7), round(row_lon, 7)) if not isnan(row_lat) else (None, None)
+    return rows
+
+
+def _parse_curr_inet_csv(inet_curr_csv: str) -> List[List[Any]]:
+    inet_curr_csv_rows = read_csv_columns(inet_curr_csv, CURR_INET_COLUMNS, delimiter=';', types=CURR_INET_TYPES)
+    inet_curr_rows = filter(None, map(_filter_fields_from_curr_inet_csv_row, inet_curr_csv_rows))
+    inet_curr_rows = _with_wgs84_coordinates(list(inet_curr_rows))
+    return [ba.to_sql_row() for ba in filter(None, map(BroadbandAccess.from_csv_row, inet_curr_rows))]
+
+
+def _parse_planned_inet_csv(inet_popc_csv: str) -> List[List[Any]]:
+    inet_popc_csv_rows = read_csv_columns(inet_popc_csv, PLANNED_INET_COLUMNS, delimiter=';', types=PLANNED_INET_TYPES)
+    inet_popc_rows = filter(None, map(_filter_fields_from_planned_inet_csv_row, inet_popc_csv_rows))
+    inet_popc_rows = _with_wgs84_coordinates(list(inet_popc_rows))
+    return [ba.to_sql_row() for ba in filter(None, map(BroadbandAccess.from_csv_row, inet_popc_rows))]
+
+
+def _parse_offer_csv(offers_csv: str) -> List[List[Any]]:
+    return [o.to_sql_row() for o in filter(None, map(ParcelOffer.from_csv_row, read_csv(offers_csv)))]
+
+
+def _parse_files(parse_tasks: List[Tuple[Callable[[str], List[List[Any]]], str]],
+                 executor: Optional[Executor], queue_size: int = 2) -> Iterator[Tuple[str, List[List[Any]]]]:
+    """Yields parsed rows per source file in task order, keeping at most queue_size files parsed ahead"""
+    if executor is None:
+        yield from ((source_file, parse(source_file)) for parse, source_file in parse_tasks)
+        return
+    pending: Deque[Tuple[str, Future]] = deque()
+    for parse, source_file in parse_tasks:
+        pending.append((source_file, executor.submit(parse, source_file)))
+        if len(pending) >= queue_size:
+            done_file, parsed = pending.popleft()
+            yield done_file, parsed.result()
+    while pending:
+        done_file, parsed = pending.popleft()
+        yield done_file, parsed.result()
+
+
+def _parsed_rows(parsed_files: Iterable[Tuple[str, List[List[Any]]]], log: Logger) -> Iterator[List[Any]]:
+    for source_file, rows in parsed_files:
+        log.info(f"Inserting {len(rows)} rows parsed from {source_file} into DB...")
+        yield from rows
+
+
+def _refresh_summaries(db_conn: sqlite3.Connection, log: Logger, full: bool = False, places_changed: bool = False):
+    start = time.perf_counter()
+    max_rowid = db_conn.execute("SELECT coalesce(max(rowid), 0) FROM parcel_offer").fetchone()[0]
+    for summary, query in INCREMENTAL_SUMMARY_QUERIES.items():
+        refreshed = db_conn.execute("SELECT last_rowid FROM summary_refresh WHERE summary = ?", (summary,)).fetchone()
+        rebuild = full or (places_changed and summary in PLACE_SUMMARIES)
+        last_rowid = refreshed[0] if refreshed and not rebuild and refreshed[0] <= max_rowid else 0
+        if last_rowid == 0:
+            db_conn.execute(f"DELETE FROM {summary}")
+        db_conn.execute(query, (last_rowid, max_rowid))
+        db_conn.execute("INSERT OR REPLACE INTO summary_refresh VALUES (?,?)", (summary, max_rowid))
+        log.info(f"Refreshed {summary} with {max_rowid - last_rowid} offer rows")
+    # one row per city, cheap to rebuild from running sums
+    db_conn.execute("DELETE FROM city_avg_price")
+    db_conn.execute(CITY_AVG_PRICE_QUERY)
+    db_conn.commit()
+    log.info(f"Refreshed offer summary tables in {time.perf_counter() - start:.2f}s")
+
+
+class _Dimension:
+    """String to id cache of a dimension table, inserting names not seen before"""
+
+    def __init__(self, db_conn: sqlite3.Connection, table: str):
+        self.db_conn = db_conn
+        self.table = table
+        self.ids: Dict[str, int] = {name: id_ for id_, name in db_conn.execute(f"SELECT id, name FROM {table}")}
+
+    def encode(self, name: Optional[str]) -> Optional[int]:
+        if name is None:
+            return None
+        id_ = self.ids.get(name)
+        if id_ is None:
+            id_ = self.ids[name] = self.db_conn.execute(f"INSERT INTO {self.table} (name) VALUES (?)",
+                                                        (name,)).lastrowid
+        return id_
+
+
+def _encode_broadband_rows(db_conn: sqlite3.Connection, rows: Iterable[List[Any]]) -> Iterator[List[Any]]:
+    """Replaces county, city, provider and medium names of broadband rows with ids of their dimension tables"""
+    dimensions = [(column, _Dimension(db_conn, table)) for column, table in BROADBAND_DIMENSIONS]
+    for row in rows:
+        for column, dimension in dimensions:
+            row[column] = dimension.encode(row[column])
+        yield row
+
+
+def _drop_outdated_broadband(db_conn: sqlite3.Connection, log: Logger) -> bool:
+    """Drops broadband table created before current schema, returns whether it needs to be reloaded"""
+    columns = {column[1] for column in db_conn.execute("PRAGMA table_info(broadband)")}
+    if not columns or {"lat", "provider_id"} <= columns:
+        return False
+    log.info("Dropping broadband table created with outdated schema, it will be reloaded...")
+    db_conn.execute("DROP TABLE broadband")
+    return True
+
+
+def _refresh_location_broadband(db_conn: sqlite3.Connection, log: Logger, radius_m: float = BROADBAND_RADIUS_M):
+    start = time.perf_counter()
+    places = db_conn.execute("SELECT location, lat, lon FROM place "
+                             "WHERE lat IS NOT NULL AND lon IS NOT NULL").fetchall()
+    providers = " OR ".join("name LIKE ?" for _ in BROADBAND_PROVIDER_PATTERNS)
+    access_points = db_conn.execute("SELECT lat, lon, bandwidth, medium.name = ? FROM broadband "
+                                    "INNER JOIN broadband_medium medium ON broadband.medium_id = medium.id "
+                                    "WHERE lat IS NOT NULL AND lon IS NOT NULL "
+                                    f"AND provider_id IN (SELECT id FROM broadband_provider WHERE {providers})",
+                                    (FIBER_MEDIUM, *BROADBAND_PROVIDER_PATTERNS)).fetchall()
+    db_conn.execute("DELETE FROM location_broadband")
+    if places and access_points:
+        ap_lat, ap_lon, bandwidth, fiber = (np.array(column) for column in zip(*access_points))
+        place_lat, place_lon = np.array([p[1] for p in places]), np.array([p[2] for p in places])
+        place_ix, ap_ix, _ = PointGrid(ap_lat, ap_lon, cell_m=radius_m).within(place_lat, place_lon, radius_m)
+        ap_count = np.bincount(place_ix, minlength=len(places))
+        fiber_count = np.bincount(place_ix, weights=fiber[ap_ix], minlength=len(places))
+        bw_sum = np.bincount(place_ix, weights=bandwidth[ap_ix], minlength=len(places))
+        bw_min, bw_max = np.full(len(places), np.iinfo(np.int64).max), np.zeros(len(places), dtype=np.int64)
+        np.minimum.at(bw_min, place_ix, bandwidth[ap_ix])
+        np.maximum.at(bw_max, place_ix, bandwidth[ap_ix])
+        rows = [(places[i][0], int(ap_count[i]), int(fiber_count[i]), int(bw_min[i]), round(bw_sum[i] / ap_count[i]),
+                 int(bw_max[i])) for i in np.flatnonzero(ap_count)]
+        db_conn.executemany("INSERT INTO location_broadband VALUES (?, ?, ?, ?, ?, ?)", rows)
+    db_conn.commit()
+    log.info(f"Computed broadband access within {radius_m:.0f}m of {len(places)} places out of {len(access_points)} "
+             f"access points of {', '.join(BROADBAND_PROVIDER_PATTERNS)} in {time.perf_counter() - start:.2f}s")
+
+
+def main(db_file: str, ddl_script: str, place_cache: str, drive_time: str, offers_path: str, inet_curr: str,
+         inet_popc: str, incremental: bool = False, bulk: bool = False,
+         on_conflict: str = ON_CONFLICT_IGNORE, workers: int = 1, broadband_radius_m: float = BROADBAND_RADIUS_M):
     setup_log()
     log = getLogger()
+    if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+        raise RuntimeError(f"SQLite {'.'.join(map(str, MIN_SQLITE_VERSION))} or newer is required, "
+                           f"found {sqlite3.sqlite_version}")
     db_conn: sqlite3.Connection = sqlite3.connect(db_file)
+    broadband_outdated = _drop_outdated_broadband(db_conn, log)
     _init_tables(db_conn, ddl_script)
 
-    log.info(f"Inserting Places cache {place_cache} into sqlite3 DB {db_file}...")
-    places = filter(None, map(Place.from_csv_row, read_csv(place_cache)))
-    for places_chunk in chunked(map(lambda p: p.to_sql_row(), places), 50):
-        try:
-            c = db_conn.cursor()
-            c.executemany("INSERT INTO place VALUES (?,?,?,?,?)", places_chunk)
-            c.close()
-            db_conn.commit()
-        except sqlite3.IntegrityError as e:
-            log.warning(f"Could not insert {len(places_chunk)} rows [{places_chunk[0]}, ..., {places_chunk[-1]}]: {e}")
+    table_stats: Dict[str, Counter] = defaultdict(Counter)
+    index_ddl, restore_pragmas = [], []
+    if bulk:
+        for pragma in BULK_LOAD_PRAGMAS:
+            name = pragma.split()[1]
+            restore_pragmas.append(f"PRAGMA {name} = {db_conn.execute(f'PRAGMA {name}').fetchone()[0]}")
+            db_conn.execute(pragma)
+        index_ddl = _drop_indexes(db_conn)
+        log.info(f"Bulk load mode: deferred building of {len(index_ddl)} indexes")
 
-    log.info(f"Inserting time-to-wroclaw data from {time_to_wro} into DB...")
-    time_to_wro_iter = ((r[0], int(r[1]) if r[1] else None) for r in read_csv(time_to_wro))
-    for row_chunk in chunked(time_to_wro_iter, 50):
+    with ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as executor:
+        # indexes and durability are restored even if loading fails, views rely on the indexes
         try:
-            c = db_conn.cursor()
-            c.executemany("INSERT INTO time_to_wroclaw VALUES (?,?)", row_chunk)
-            c.close()
-            db_conn.commit()
-        except sqlite3.IntegrityError as e:
-            log.warning(f"Could not insert {len(row_chunk)} rows [{row_chunk[0]}, ..., {row_chunk[-1]}]: {e}")
-
-    for inet_curr_csv in list_csv_files(inet_curr):
-        log.info(f"Inserting current broadband data from CSVs under {inet_curr_csv} into DB...")
-        inet_curr_rows = filter(None,
-                                map(_filter_fields_from_curr_inet_csv_row,
-                                    read_csv(inet_curr_csv, delimiter=';')))
-        broadband_accesses = filter(None, map(BroadbandAccess.from_csv_row, inet_curr_rows))
-        _insert_broadband_access_obj(broadband_accesses, db_conn, log)
-
-    for inet_popc_csv in list_csv_files(inet_popc):
-        log.info(
-            f"Inserting planned broadband expansion data from CSVs under {inet_popc_csv} into DB...")
-        inet_curr_rows = filter(None,
-                                map(_filter_fields_from_planned_inet_csv_row, read_csv(inet_popc_csv, delimiter=';')))
-        broadband_accesses = filter(None, map(BroadbandAccess.from_csv_row, inet_curr_rows))
-        _insert_broadband_access_obj(broadband_accesses, db_conn, log)
-
-    for offers_csv in list_csv_files(offers_path):
-        log.info(f"Inserting Offers from CSV {offers_csv} into sqlite3 DB {db_file}...")
-        offers = filter(None, map(ParcelOffer.from_csv_row, read_csv(offers_csv)))
-        for offers_chunk in chunked(map(lambda p: p.to_sql_row(), offers), 50):
-            try:
-                c = db_conn.cursor()
-                c.executemany("INSERT INTO parcel_offer VALUES (?,?,?,?,?,?,?)", offers_chunk)
-                c.close()
+            places_changed = _needs_import(db_conn, [place_cache], incremental)
+            if places_changed:
+                log.info(f"Inserting Places cache {place_cache} into sqlite3 DB {db_file}...")
+                db_conn.execute("DELETE FROM place")
+                places = filter(None, map(Place.from_csv_row, read_csv(place_cache)))
+                place_rows = (p.to_sql_row() for p in places)
+                table_stats["place"] = _insert_rows(db_conn, "place", place_rows, log, bulk, on_conflict)
+                _mark_imported(db_conn, place_cache)
                 db_conn.commit()
-            except sqlite3.IntegrityError as e:
-                log.warning(
-                    f"Could not insert {len(offers_chunk)} rows [{offers_chunk[0]}, ..., {offers_chunk[-1]}]: {e}")
+            else:
+                log.info(f"Places cache {place_cache} already imported, skipping")
 
-    db_conn.close()
-    log.info("Done inserting Places cache and Offers into sqlite3 DB")
+            if _needs_import(db_conn, [drive_time], incremental):
+                log.info(f"Inserting drive time data from {drive_time} into DB...")
+                db_conn.execute("DELETE FROM drive_time")
+                drive_time_iter = ((r[0], r[1], int(r[2]) if r[2] else None) for r in read_csv(drive_time))
+                table_stats["drive_time"] = _insert_rows(db_conn, "drive_time", drive_time_iter, log, bulk, on_conflict)
+                _mark_imported(db_conn, drive_time)
+                db_conn.commit()
+            else:
+                log.info(f"Drive time data {drive_time} already imported, skipping")
 
+            inet_curr_files, inet_popc_files = list_csv_files(inet_curr), list_csv_files(inet_popc)
+            if broadband_outdated or _needs_import(db_conn, inet_curr_files + inet_popc_files, incremental):
+                db_conn.execute("DELETE FROM broadband")
+                parse_tasks = [(_parse_curr_inet_csv, f) for f in inet_curr_files] \
+                              + [(_parse_planned_inet_csv, f) for f in inet_popc_files]
+                broadband_rows = _parsed_rows(_parse_files(parse_tasks, executor, 2 * workers), log)
+                broadband_rows = _encode_broadband_rows(db_conn, broadband_rows)
+                table_stats["broadband"] = _insert_rows(db_conn, "broadband", broadband_rows, log, bulk, on_conflict)
+                for inet_csv in inet_curr_files + inet_popc_files:
+                    _mark_imported(db_conn, inet_csv)
+                db_conn.commit()
+            else:
+                log.info(f"Broadband data under {inet_curr} and {inet_popc} already imported, skipping")
 
-def _insert_broadband_access_obj(broadband_accesses: Iterable[BroadbandAccess], db_conn: sqlite3.Connection,
-                                 log: Logger):
-    for access_chunk in chunked(map(lambda ba: ba.to_sql_row(), broadband_accesses), 50):
-        try:
-            c = db_conn.cursor()
-            c.executemany("INSERT INTO broadband VALUES (?,?,?,?,?,?,?,?,?)", access_chunk)
-            c.close()
-            db_conn.commit()
-        except sqlite3.IntegrityError as e:
-            log.warning(
-                f"Could not insert {len(access_chunk)} rows [{access_chunk[0]}, ..., {access_chunk[-1]}]: {e}")
+            offer_files = [f for f in list_csv_sources(offers_path) if not incremental or not _is_imported(db_conn, f)]
+            log.info(f"Found {len(offer_files)} Offer CSV files to import under {offers_path}")
+            parsed_offers = _parse_files([(_parse_offer_csv, f) for f in offer_files], executor, 2 * workers)
+            if bulk:
+                offer_rows = _parsed_rows(parsed_offers, log)
+                table_stats["parcel_offer"] = _insert_rows(db_conn, "parcel_offer", offer_rows, log, bulk, on_conflict)
+                for offers_csv in offer_files:
+                    _mark_imported(db_conn, offers_csv)
+                db_conn.commit()
+            else:
+                for offers_csv, offer_rows in parsed_offers:
+                    log.info(f"Inserting Offers from CSV {offers_csv} into sqlite3 DB {db_file}...")
+                    table_stats["parcel_offer"] += _insert_rows(db_conn, "parcel_offer", offer_rows, log, bulk,
+                                                                on_conflict)
+                    _mark_imported(db_conn, offers_csv)
+                    db_conn.commit()
+        finally:
+            if db_conn.in_transaction:
+                db_conn.rollback()
+            if index_ddl:
+                _create_indexes(db_conn, index_ddl, log)
+            for pragma in restore_pragmas:
+                db_conn.execute(pragma)
+
+    # overwritten rows may lower stored maximums, which incremental refresh cannot undo
+    _refresh_summaries(db_conn, log, full=on_conflict == ON_CONFLICT_REPLACE, places_changed=places_changed)
+    _refresh_location_broadband(db_conn, log, broadband_radius_m)
+    for table, stats in table_stats.items():
+        log.info(f"Table {table}: {stats['inserted']} inserted, {stats['duplicate']} duplicate, "
+                 f"{stats['rejected']} rejected out of {stats['total']} rows")
+    db_conn.close()
+    log.info("Done inserting Places cache and Offers into sqlite3 DB")
 
 
 def _parse_args() -> argparse.Namespace:
@@ -128,17 +475,29 @@ def _parse_args() -> argparse.Namespace:
     parser.add_argument('db', type=str, help='Path to sqlite3 DB file')
     parser.add_argument('ddl', type=str, help='Path to SQL DDL script executed before data insertion')
     parser.add_argument('place', type=str, help='Path to CSV file with Places cache')
-    parser.add_argument('time_to_wro', type=str, help='Path to CSV file with time-to-wroclaw data')
-    parser.add_argument('offer', type=str, help='Path to directory containing offer CSV files')
+    parser.add_argument('drive_time', type=str, help='Path to CSV file with drive time data')
+    parser.add_argument('offer', type=str, help='Path to directory containing offer CSV files or .csv.zip archives')
     parser.add_argument('inet_curr', type=str, help='Path to directory containing current broadband infrastructure')
     parser.add_argument('inet_popc', type=str, help='Path to directory containing planned '
                                                     'expansion of broadband network (POPC)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Keep existing DB contents and import only new or changed source files')
+    parser.add_argument('--bulk', action='store_true',
+                        help='Load each table in a single transaction with relaxed durability '
+                             'and build indexes after loading')
+    parser.add_argument('--on-conflict', choices=[ON_CONFLICT_IGNORE, ON_CONFLICT_REPLACE], default=ON_CONFLICT_IGNORE,
+                        help='Whether rows with an already existing primary key are skipped or overwrite stored ones')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes parsing offer and broadband CSV files in parallel to DB writes')
+    parser.add_argument('--broadband-radius', type=float, default=BROADBAND_RADIUS_M,
+                        help='Distance in meters within which broadband access points are counted for each place')
     return parser.parse_args()
 
 
 def cli_main():
     args = _parse_args()
-    main(args.db, args.ddl, args.place, args.time_to_wro, args.offer, args.inet_curr, args.inet_popc)
+    main(args.db, args.ddl, args.place, args.drive_time, args.offer, args.inet_curr, args.inet_popc,
+         args.incremental, args.bulk, args.on_conflict, args.workers, args.broadband_radius)
 
 
 if __name__ == '__main__':
@@ -146,7 +505,7 @@ if __name__ == '__main__':
     # main("/home/mat/proj/estate-analysis/data/offers.db",
     #      "/home/mat/proj/estate-analysis/src/ddl.sql",
     #      "/home/mat/proj/estate-analysis/data/place_cache.csv",
-    #      "/home/mat/proj/estate-analysis/data/time_to_wroclaw.csv",
+    #      "/home/mat/proj/estate-analysis/data/drive_time.csv",
     #      "/home/mat/proj/estate-analysis/offers",
     #      "/home/mat/proj/estate-analysis/data/uke/current",
     #      "/home/mat/proj/estate-analysis/data/uke/popc")
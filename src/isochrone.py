@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+import argparse
+import codecs
+import json
+import os
+from logging import getLogger
+from os import path
+from typing import List, Any, Dict, Sequence, Tuple, Optional, Union
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+from shapely.geometry.base import BaseGeometry
+
+from common import setup_log, source_sha1
+
+OUTSIDE = -1
+BOUNDARY = -2
+
+
+def read_isochrone_map(isochrone: str) -> Dict[str, Any]:
+    with codecs.open(isochrone, 'r', 'utf-8-sig') as map_:
+        return json.load(map_)
+
+
+class IsochroneIndex:
+    """Classifies points into isochrone bands; band i is the narrowest polygon containing the point, -1 if none"""
+
+    def __init__(self, polygons: Sequence[BaseGeometry], step_time_min: int = 7, nested: bool = False,
+                 band_time_min: Optional[Sequence[int]] = None):
+        self.step_time_min = step_time_min
+        self.band_time_min = np.array(band_time_min if band_time_min is not None
+                                      else [i * step_time_min for i in range(len(polygons))], dtype=np.float64)
+        # isochrone polygons are not strictly nested, cumulative unions are; first band containing a point is the same
+        self.bands: List[BaseGeometry] = list(polygons) if nested else []
+        for polygon in polygons if not nested else ():
+            self.bands.append(shapely.union(self.bands[-1], polygon) if self.bands else polygon)
+        for band in self.bands:
+            shapely.prepare(band)
+        self.bounds = self.bands[-1].bounds if self.bands else (0., 0., 0., 0.)
+
+    def __len__(self):
+        return len(self.bands)
+
+    @classmethod
+    def from_geojson(cls, isochrone_map: Dict[str, Any], step_time_min: int = 7) -> 'IsochroneIndex':
+        features = isochrone_map["features"]
+        band_time_min = None
+        if features and all("value" in f.get("properties", {}) for f in features):
+            # openrouteservice isochrones carry upper bound of the band in seconds, band starts where previous ends
+            band_time_min = [0] + [int(f["properties"]["value"]) // 60 for f in features[:-1]]
+        return cls([shape(f['geometry']) for f in features], step_time_min, band_time_min=band_time_min)
+
+    @classmethod
+    def from_file(cls, isochrone: str, step_time_min: int = 7) -> 'IsochroneIndex':
+        return cls.from_geojson(read_isochrone_map(isochrone), step_time_min)
+
+    def classify(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        """Returns band index per point, binary searching the nested bands for all points at once"""
+        lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+        band = np.full(lat.shape, OUTSIDE, dtype=np.int32)
+        min_lon, min_lat, max_lon, max_lat = self.bounds
+        candidates = np.flatnonzero((lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat))
+        if not len(self.bands) or not len(candidates):
+            return band
+        candidates = candidates[shapely.contains_xy(self.bands[-1], lon[candidates], lat[candidates])]
+        low = np.zeros(len(candidates), dtype=np.int32)
+        high = np.full(len(candidates), len(self.bands) - 1, dtype=np.int32)
+        while True:
+            searching = np.flatnonzero(low < high)
+            if not len(searching):
+                break
+            middle = (low[searching] + high[searching]) // 2
+            for i in np.unique(middle):
+                at_band = searching[middle == i]
+                points = candidates[at_band]
+                inside = shapely.contains_xy(self.bands[i], lon[points], lat[points])
+                high[at_band[inside]] = i
+                low[at_band[~inside]] = i + 1
+        band[candidates] = low
+        return band
+
+    def drive_time_min(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        """Returns drive time in minutes per point, as lower bound of the band, NaN outside of isochrone map"""
+        return band_drive_time_min(self.classify(lat, lon), self.band_time_min)
+
+
+class IsochroneGrid:
+    """Raster of isochrone bands answering lookups by array indexing, exact polygon checks only on band boundaries"""
+
+    def __init__(self, cells: np.ndarray, origin: Tuple[float, float], resolution: float, index: IsochroneIndex):
+        self.cells = cells
+        self.min_lat, self.min_lon = origin
+        self.resolution = resolution
+        self.index = index
+        self.band_time_min = index.band_time_min
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.cells.shape[0]}x{self.cells.shape[1]} cells of {self.resolution}°, " \
+               f"{np.count_nonzero(np.asarray(self.cells) == BOUNDARY)} on band boundaries)"
+
+    @classmethod
+    def rasterize(cls, index: IsochroneIndex, resolution: float = 0.005) -> 'IsochroneGrid':
+        min_lon, min_lat, max_lon, max_lat = index.bounds
+        rows = int(np.ceil((max_lat - min_lat) / resolution)) + 1
+        cols = int(np.ceil((max_lon - min_lon) / resolution)) + 1
+        row, col = np.divmod(np.arange(rows * cols), cols)
+        boxes = shapely.box(min_lon + col * resolution, min_lat + row * resolution,
+                            min_lon + (col + 1) * resolution, min_lat + (row + 1) * resolution)
+        # first band containing whole cell, first band touching the cell; cell is uniform when both are equal
+        within = np.full(len(boxes), len(index), dtype=np.int32)
+        touching = np.full(len(boxes), len(index), dtype=np.int32)
+        for i, band in reversed(list(enumerate(index.bands))):
+            within[shapely.contains_properly(band, boxes)] = i
+            touching[shapely.intersects(band, boxes)] = i
+        cells = np.where(within == touching, within, BOUNDARY)
+        cells[cells == len(index)] = OUTSIDE
+        return cls(cells.astype(np.int8).reshape(rows, cols), (min_lat, min_lon), resolution, index)
+
+    def classify(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        """Returns band index per point, like IsochroneIndex.classify"""
+        lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+        row = np.floor((lat - self.min_lat) / self.resolution)
+        col = np.floor((lon - self.min_lon) / self.resolution)
+        on_grid = (row >= 0) & (row < self.cells.shape[0]) & (col >= 0) & (col < self.cells.shape[1])
+        band = np.full(lat.shape, OUTSIDE, dtype=np.int32)
+        band[on_grid] = self.cells[row[on_grid].astype(np.intp), col[on_grid].astype(np.intp)]
+        boundary = band == BOUNDARY
+        band[boundary] = self.index.classify(lat[boundary], lon[boundary])
+        return band
+
+    @property
+    def bounds(self) -> Tuple[float, float, float, float]:
+        return self.index.bounds
+
+    def drive_time_min(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        return band_drive_time_min(self.classify(lat, lon), self.band_time_min)
+
+    def save(self, directory: str, source_sha1: str = "") -> None:
+        os.makedirs(directory, exist_ok=True)
+        np.save(path.join(directory, "cells.npy"), np.asarray(self.cells), allow_pickle=False)
+        with open(path.join(directory, "bands.wkb"), "wb") as bands_:
+            for wkb in shapely.to_wkb(self.index.bands):
+                bands_.write(len(wkb).to_bytes(4, "little") + wkb)
+        with open(path.join(directory, "grid.json"), "w") as meta_:
+            json.dump({"min_lat": self.min_lat, "min_lon": self.min_lon, "resolution": self.resolution,
+                       "step_time_min": self.index.step_time_min, "band_time_min": self.band_time_min.tolist(),
+                       "source_sha1": source_sha1}, meta_, indent=2)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> 'IsochroneGrid':
+        meta = grid_metadata(directory)
+        with open(path.join(directory, "bands.wkb"), "rb") as bands_:
+            data, bands, offset = bands_.read(), [], 0
+        while offset < len(data):
+            size = int.from_bytes(data[offset:offset + 4], "little")
+            bands.append(shapely.from_wkb(data[offset + 4:offset + 4 + size]))
+            offset += 4 + size
+        cells = np.load(path.join(directory, "cells.npy"), mmap_mode="r" if mmap else None, allow_pickle=False)
+        return cls(cells, (meta["min_lat"], meta["min_lon"]), meta["resolution"],
+                   IsochroneIndex(bands, meta["step_time_min"], nested=True, band_time_min=meta.get("band_time_min")))
+
+
+class DriveTimeClassifier:
+    """Labels points with drive time to several origins at once, each origin given its own isochrone index or grid"""
+
+    def __init__(self, origins: Dict[str, Union[IsochroneIndex, IsochroneGrid]]):
+        self.origins = origins
+        bounds = np.array([isochrone.bounds for isochrone in origins.values()]).reshape(-1, 4)
+        self.bounds = (*bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0)) if len(bounds) else (0., 0., 0., 0.)
+
+    def drive_time_min(self, lat: np.ndarray, lon: np.ndarray) -> Dict[str, np.ndarray]:
+        """Returns drive time in minutes per point for each origin, NaN where point is outside of its isochrones"""
+        lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+        min_lon, min_lat, max_lon, max_lat = self.bounds
+        candidates = np.flatnonzero((lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat))
+        lat_candidates, lon_candidates = lat[candidates], lon[candidates]
+        drive_times = {}
+        for origin, isochrone in self.origins.items():
+            drive_times[origin] = np.full(lat.shape, np.nan)
+            drive_times[origin][candidates] = isochrone.drive_time_min(lat_candidates, lon_candidates)
+        return drive_times
+
+
+def band_drive_time_min(band: np.ndarray, band_time_min: np.ndarray) -> np.ndarray:
+    return np.where(band >= 0, band_time_min[np.maximum(band, 0)], np.nan) if len(band_time_min) \
+        else np.full(band.shape, np.nan)
+
+
+def grid_metadata(directory: str) -> Dict[str, Any]:
+    with open(path.join(directory, "grid.json"), "r") as meta_:
+        return json.load(meta_)
+
+
+def load_isochrone(isochrone: str, step_time_min: int = 7):
+    """Loads isochrone grid if given a directory built with this script, isochrone GeoJSON map otherwise"""
+    if path.isdir(isochrone):
+        return IsochroneGrid.load(isochrone)
+    return IsochroneIndex.from_file(isochrone, step_time_min)
+
+
+def main(isochrone: str, output: str, resolution: float = 0.005, step_time_min: int = 7):
+    setup_log()
+    log = getLogger()
+    isochrone_sha1 = source_sha1(isochrone)
+    if path.isfile(path.join(output, "grid.json")):
+        meta = grid_metadata(output)
+        if (meta.get("source_sha1"), meta.get("resolution"), meta.get("step_time_min")) == \
+                (isochrone_sha1, resolution, step_time_min):
+            log.info(f"Isochrone grid at {output} is up to date with {isochrone}, skipping")
+            return
+    log.info(f"Rasterizing isochrone map {isochrone} with resolution {resolution}° ...")
+    grid = IsochroneGrid.rasterize(IsochroneIndex.from_file(isochrone, step_time_min), resolution)
+    log.info(f"Writing {grid} into {output}")
+    grid.save(output, isochrone_sha1)
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Rasterize isochrone map into grid for fast drive time lookups')
+    parser.add_argument('isochrone', type=str, help='Path to isochrone map')
+    parser.add_argument('output', type=str, help='Path to directory where grid is stored')
+    parser.add_argument('--resolution', type=float, default=0.005, help='Grid cell size in degrees')
+    parser.add_argument('--step', type=int, default=7, help='Drive time difference between isochrones in minutes')
+    return parser.parse_args()
+
+
+def cli_main():
+    args = _parse_args()
+    main(args.isochrone, args.output, args.resolution, args.step)
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -1,10 +1,12 @@
-from copy import deepcopy
 from datetime import datetime, date
+from sys import intern
 from typing import Any, Dict, Optional, List
-from urllib.parse import urlparse
+from urllib.parse import urlsplit
 
 
 class Model:
+    __slots__ = ()
+
     @classmethod
     def from_csv_row(cls, row: List[str]) -> Optional['Model']:
         raise NotImplementedError
@@ -28,16 +30,19 @@ class Model:
 
 
 class ParcelOffer(Model):
+    __slots__ = ("timestamp", "ident", "url", "location", "area_m2", "price_pln", "title", "domain")
 
     def __init__(self, timestamp: datetime, ident: str, url: str, location: Optional[str], area_m2: float,
                  price_pln: float, title: Optional[str]) -> None:
-        self.timestamp = timestamp.replace(microsecond=0)
+        self.timestamp = timestamp.replace(microsecond=0) if timestamp.microsecond else timestamp
         self.ident = ident
         self.url = url
         self.location = location
         self.area_m2 = area_m2
         self.price_pln = price_pln
         self.title = title
+        hostname = urlsplit(url).hostname
+        self.domain: str = intern(hostname) if hostname else hostname
 
     def __repr__(self):
         return f"{self.__class__.__name__}({self.ident}, {self.timestamp}, {self.url}, {self.location}, {self.area_m2}, {self.price_pln}, {self.title})"
@@ -45,10 +50,6 @@ class ParcelOffer(Model):
     def __str__(self):
         return f"{self.__class__.__name__}({self.domain}, {self.ident}, {self.location}, {self.timestamp})"
 
-    @property
-    def domain(self) -> str:
-        return urlparse(self.url).hostname
-
     def __hash__(self):
         return hash((self.ident, self.domain))
 
@@ -72,9 +73,8 @@ class ParcelOffer(Model):
             return None
 
     def to_json(self) -> Dict[str, Any]:
-        json_dict = deepcopy(self.__dict__)
-        json_dict["timestamp"] = json_dict["timestamp"].isoformat()
-        return json_dict
+        return {"timestamp": self.timestamp.isoformat(), "ident": self.ident, "url": self.url,
+                "location": self.location, "area_m2": self.area_m2, "price_pln": self.price_pln, "title": self.title}
 
     @classmethod
     def from_json(cls, json_dict: Dict[str, Any]) -> Optional['ParcelOffer']:
@@ -102,6 +102,7 @@ class ParcelOffer(Model):
 
 
 class Place(Model):
+    __slots__ = ("location", "city", "postcode", "lat", "lon")
 
     def __init__(self, location: str, city: Optional[str], postcode: Optional[str], lat: Optional[float],
                  lon: Optional[float]):
@@ -128,7 +129,7 @@ class Place(Model):
         return self.lat is not None and self.lon is not None
 
     def to_json(self) -> Dict[str, Any]:
-        return deepcopy(self.__dict__)
+        return {attr: getattr(self, attr) for attr in self.__slots__}
 
     @classmethod
     def from_json(cls, json_dict: Dict[str, Any]) -> Optional['Place']:
@@ -160,9 +161,12 @@ class Place(Model):
 
 
 class BroadbandAccess(Model):
+    __slots__ = ("ident", "planned", "county", "city", "street", "number", "provider", "medium", "bandwidth", "lat",
+                 "lon")
+
     def __init__(self, ident: str, planned: Optional[date],
                  county: str, city: str, street: Optional[str], number: Optional[str],
-                 provider: str, medium: str, bandwidth: int):
+                 provider: str, medium: str, bandwidth: int, lat: Optional[float] = None, lon: Optional[float] = None):
         self.ident = ident
         self.planned = planned
         self.county = county
@@ -172,6 +176,8 @@ class BroadbandAccess(Model):
         self.provider = provider
         self.medium = medium
         self.bandwidth = bandwidth
+        self.lat = lat
+        self.lon = lon
 
     def __hash__(self):
         return hash(self.ident)
@@ -190,7 +196,7 @@ class BroadbandAccess(Model):
         return self.to_sql_row()
 
     def to_json(self) -> Dict[str, Any]:
-        return deepcopy(self.__dict__)
+        return {attr: getattr(self, attr) for attr in self.__slots__}
 
     @classmethod
     def from_json(cls, json_dict: Dict[str, Any]) -> Optional['BroadbandAccess']:
@@ -203,11 +209,11 @@ class BroadbandAccess(Model):
     def from_sql_row(cls, row: List[Any]) -> Optional['BroadbandAccess']:
         try:
             row[1] = date.fromisoformat(row[1]) if isinstance(row[1], str) else None
-            return cls(*(r or None for r in row)) if len(row) == 9 else None
+            return cls(*(r or None for r in row)) if len(row) in (9, 11) else None
         except (TypeError, ValueError):
             return None
 
     def to_sql_row(self) -> List[Any]:
         return [self.ident, self.planned.isoformat() if self.planned else None,
                 self.county, self.city, self.street, self.number,
-                self.provider, self.medium, self.bandwidth]
+                self.provider, self.medium, self.bandwidth, self.lat, self.lon]
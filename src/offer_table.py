@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+from logging import getLogger
+from os import path
+from typing import Iterable, Dict, Optional, Tuple, List, Any
+
+import numpy as np
+
+from common import setup_log, read_csv, list_csv_sources, write_csv
+from model import ParcelOffer, Place
+
+COLUMNS = ("timestamp", "area_m2", "price_pln", "ident_code", "domain_code", "location_code")
+DICTIONARIES = ("idents", "domains", "locations")
+
+
+class _Dictionary:
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+
+    def encode(self, value: Optional[str]) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.codes)
+        return code
+
+    def values(self) -> np.ndarray:
+        return np.array([v or "" for v in self.codes.keys()], dtype=str)
+
+
+class OfferTable:
+    """Columnar, dictionary-encoded store of offer snapshots, one array element per ParcelOffer"""
+
+    def __init__(self, timestamp: np.ndarray, area_m2: np.ndarray, price_pln: np.ndarray, ident_code: np.ndarray,
+                 domain_code: np.ndarray, location_code: np.ndarray, idents: np.ndarray, domains: np.ndarray,
+                 locations: np.ndarray):
+        self.timestamp = timestamp
+        self.area_m2 = area_m2
+        self.price_pln = price_pln
+        self.ident_code = ident_code
+        self.domain_code = domain_code
+        self.location_code = location_code
+        self.idents = idents
+        self.domains = domains
+        self.locations = locations
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self)} offers, {len(self.idents)} idents, " \
+               f"{len(self.locations)} locations)"
+
+    @classmethod
+    def from_offers(cls, offers: Iterable[ParcelOffer]) -> 'OfferTable':
+        idents, domains, locations = _Dictionary(), _Dictionary(), _Dictionary()
+        timestamp, area_m2, price_pln, ident_code, domain_code, location_code = [], [], [], [], [], []
+        for o in offers:
+            timestamp.append(o.timestamp)
+            area_m2.append(o.area_m2)
+            price_pln.append(o.price_pln)
+            ident_code.append(idents.encode(o.ident))
+            domain_code.append(domains.encode(o.domain))
+            location_code.append(locations.encode(o.location))
+        return cls(timestamp=np.array(timestamp, dtype="datetime64[s]"),
+                   area_m2=np.array(area_m2, dtype=np.float64),
+                   price_pln=np.array(price_pln, dtype=np.float64),
+                   ident_code=np.array(ident_code, dtype=np.int32),
+                   domain_code=np.array(domain_code, dtype=np.int32),
+                   location_code=np.array(location_code, dtype=np.int32),
+                   idents=idents.values(), domains=domains.values(), locations=locations.values())
+
+    @classmethod
+    def from_csv_files(cls, csv_files: Iterable[str]) -> 'OfferTable':
+        return cls.from_offers(o for csv_file in csv_files
+                               for o in filter(None, map(ParcelOffer.from_csv_row, read_csv(csv_file))))
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        for name in COLUMNS + DICTIONARIES:
+            np.save(path.join(directory, f"{name}.npy"), getattr(self, name), allow_pickle=False)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> 'OfferTable':
+        mmap_mode = "r" if mmap else None
+        arrays = {name: np.load(path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False)
+                  for name in COLUMNS + DICTIONARIES}
+        return cls(**arrays)
+
+    def filter(self, mask: np.ndarray) -> 'OfferTable':
+        return OfferTable(self.timestamp[mask], self.area_m2[mask], self.price_pln[mask], self.ident_code[mask],
+                          self.domain_code[mask], self.location_code[mask], self.idents, self.domains, self.locations)
+
+    def where_area(self, min_m2: float, max_m2: float) -> 'OfferTable':
+        return self.filter((self.area_m2 >= min_m2) & (self.area_m2 <= max_m2))
+
+    def where_price_per_m2(self, min_price: float, max_price: float) -> 'OfferTable':
+        price_per_m2 = self.price_per_m2
+        return self.filter((price_per_m2 > min_price) & (price_per_m2 < max_price))
+
+    @property
+    def price_per_m2(self) -> np.ndarray:
+        return self.price_pln / self.area_m2
+
+    @property
+    def day(self) -> np.ndarray:
+        return self.timestamp.astype("datetime64[D]")
+
+    def price_per_m2_by_day(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns days, average price per square meter and distinct offer count, akin to daily_price_avg view"""
+        days, day_code = np.unique(self.day, return_inverse=True)
+        avg_price, offer_count = self._group_avg(day_code, len(days))
+        return days, avg_price, offer_count
+
+    def price_per_m2_by_city(self, location_city: Dict[str, Optional[str]]) -> Tuple[np.ndarray, np.ndarray,
+                                                                                      np.ndarray]:
+        """Returns cities, average price per square meter and distinct offer count; unresolved locations are skipped"""
+        location_to_city = np.array([location_city.get(loc) or "" for loc in self.locations], dtype=str)
+        cities, city_code_per_location = np.unique(location_to_city, return_inverse=True)
+        city_code = city_code_per_location.reshape(-1)[self.location_code]
+        avg_price, offer_count = self._group_avg(city_code, len(cities))
+        resolved = cities != ""
+        return cities[resolved], avg_price[resolved], offer_count[resolved]
+
+    def _group_avg(self, group_code: np.ndarray, group_count: int) -> Tuple[np.ndarray, np.ndarray]:
+        group_code, ident_count = group_code.reshape(-1), max(len(self.idents), 1)
+        price_sum = np.bincount(group_code, weights=self.price_per_m2, minlength=group_count)
+        row_count = np.bincount(group_code, minlength=group_count)
+        distinct_offers = np.unique(group_code.astype(np.int64) * ident_count + self.ident_code)
+        offer_count = np.bincount(distinct_offers // ident_count, minlength=group_count)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.round(price_sum / row_count), offer_count
+
+
+def location_city_map(place_cache: str) -> Dict[str, Optional[str]]:
+    return {p.location: p.city for p in filter(None, map(Place.from_csv_row, read_csv(place_cache)))}
+
+
+def main(offers_path: str, output: str, place_cache: Optional[str] = None):
+    setup_log()
+    log = getLogger()
+    log.info(f"Building offer table from CSV files under {offers_path}...")
+    table = OfferTable.from_csv_files(list_csv_sources(offers_path))
+    log.info(f"Storing {table} at {output}")
+    table.save(output)
+
+    days, avg_price, offer_count = table.where_area(800, 3000).price_per_m2_by_day()
+    for day, price, count in list(zip(days, avg_price, offer_count))[-7:]:
+        log.info(f"{day}: {price:.0f} zł/m2 across {count} offers")
+    write_csv(path.join(output, "daily_price_avg.csv"),
+              [["Date", "PricePerM2", "OfferCount"]] + _rows(days.astype(str), avg_price, offer_count))
+    if place_cache:
+        cities, avg_price, offer_count = table.where_price_per_m2(10, 1000).price_per_m2_by_city(
+            location_city_map(place_cache))
+        # same cities as city_avg_price table of the DB, ones with at least 2 distinct offers
+        enough_offers = offer_count >= 2
+        write_csv(path.join(output, "city_avg_price.csv"), [["city", "avg_price_per_m2", "offer_count"]] + _rows(
+            cities[enough_offers], avg_price[enough_offers], offer_count[enough_offers]))
+        log.info(f"Written average price per m2 of {int(enough_offers.sum())} cities into {output}")
+    log.info("Done")
+
+
+def _rows(*columns: np.ndarray) -> List[List[Any]]:
+    return [list(row) for row in zip(*(c.tolist() for c in columns))]
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Build columnar offer table out of offer CSV files')
+    parser.add_argument('offers', type=str, help='Path to directory containing offer CSV files or .csv.zip archives')
+    parser.add_argument('output', type=str, help='Path to directory where offer table columns are stored')
+    parser.add_argument('--place-cache', type=str, default=None, help='Path to places cache CSV file')
+    return parser.parse_args()
+
+
+def cli_main():
+    args = _parse_args()
+    main(args.offers, args.output, args.place_cache)
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -1,36 +1,105 @@
-from collections import OrderedDict
+import re
+import sqlite3
+import time
+from collections import OrderedDict, Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from copy import copy
-from functools import partial
+from datetime import datetime, timedelta
+from functools import lru_cache
 from logging import Logger
-from threading import RLock
-from typing import Dict, Any, Optional, List
+from threading import RLock, Lock
+from typing import Dict, Any, Optional, List, Tuple, Iterable, Iterator
 from urllib import parse
+
 import requests
+from requests.adapters import HTTPAdapter
 
 from common import read_csv, write_csv
 from model import Place, ParcelOffer
 
 
+class TokenBucket:
+    """Thread-safe token bucket allowing on average rate acquisitions per second, with bursts of up to capacity"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.:
+                    self._tokens -= 1.
+                    return
+                wait_sec = (1. - self._tokens) / self.rate
+            time.sleep(wait_sec)
+
+
 class MapQuestClient:
     BASE_API_URL_FMT = "http://open.mapquestapi.com/nominatim/v1/search.php?format=json&addressdetails=1&limit=1&countrycodes=PL&key={}&q={}"
 
-    def __init__(self, api_key: str, log: Logger):
+    def __init__(self, api_key: str, log: Logger, rate_limit: float = 5., timeout_sec: float = 10.,
+                 max_retries: int = 3, backoff_sec: float = 1., pool_size: int = 8,
+                 base_url_fmt: str = BASE_API_URL_FMT):
         self.api_key = api_key
         self.log = log
+        self.timeout_sec = timeout_sec
+        self.max_retries = max_retries
+        self.backoff_sec = backoff_sec
+        self.base_url_fmt = base_url_fmt
+        self.rate_limiter = TokenBucket(rate_limit)
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        # api_call counts queries sent to MapQuest, request every HTTP request including retries
+        self.stats = Counter()
+        self._stats_lock = Lock()
 
-    def resolve(self, query_address: str, location: str) -> Place:
-        resolve_url = self.BASE_API_URL_FMT.format(self.api_key, parse.quote(copy(query_address)))
-        r = requests.get(url=resolve_url)
-        if r.ok:
-            json_resp = r.json()
-            if len(json_resp):
-                return self._parse(location, json_resp)
+    def resolve(self, query_address: str, location: str) -> Optional[Place]:
+        resolve_url = self.base_url_fmt.format(self.api_key, parse.quote(copy(query_address)))
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.backoff_sec * 2 ** (attempt - 1))
+            self.rate_limiter.acquire()
+            with self._stats_lock:
+                self.stats["request"] += 1
+                if not attempt:
+                    self.stats["api_call"] += 1
+            try:
+                r = self.session.get(url=resolve_url, timeout=self.timeout_sec)
+            except requests.RequestException as e:
+                self.log.warning(f"MapQuest request for {query_address} failed (attempt {attempt + 1}): {e}")
+                continue
+            if r.status_code == 429 or r.status_code >= 500:
+                self.log.warning(f"MapQuest returned {r.status_code} for {query_address} (attempt {attempt + 1})")
+                continue
+            elif r.ok:
+                try:
+                    json_resp = r.json()
+                except ValueError:
+                    # e.g. HTML error page of a proxy
+                    self.log.warning(f"MapQuest returned non-JSON response for {query_address} "
+                                     f"(attempt {attempt + 1}): {r.content[:100]}")
+                    continue
+                if len(json_resp):
+                    return self._parse(location, json_resp)
+                else:
+                    self.log.warning(f"No response for {query_address}: {r.status_code} {r.content}")
+                    return Place(location, None, None, None, None)
             else:
-                self.log.warning(f"No response for {query_address}: {r.status_code} {r.content}")
-                return Place(location, None, None, None, None)
-        else:
-            self.log.warning(f"MapQuest returned error for query {query_address}: {r.status_code} {r.content}")
-            return Place(location, None, None, None, None)
+                self.log.warning(f"MapQuest returned error for query {query_address}: {r.status_code} {r.content}")
+                return None
+        self.log.error(f"Giving up resolving {query_address} after {self.max_retries + 1} attempts")
+        return None
+
+    def close(self):
+        self.session.close()
 
     def _parse(self, location: str, json_resp: Dict[str, Any]) -> Place:
         return Place(location=location, city=json_resp[0].get("address", {}).get("city", None),
@@ -38,60 +107,186 @@ class MapQuestClient:
                      lon=float(json_resp[0]["lon"]))
 
 
+class SqlitePlaceCache:
+    """
+    Two-level place cache stored in sqlite3: raw offer location -> normalized query -> geocoded place.
+    Places without coordinates are negative entries, considered missing once older than negative_ttl.
+    """
+
+    def __init__(self, db_file: str = ":memory:", negative_ttl: timedelta = timedelta(days=30)):
+        self.db_conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.negative_ttl = negative_ttl
+        self.db_conn.executescript("""
+            CREATE TABLE IF NOT EXISTS place_query (query VARCHAR PRIMARY KEY, city VARCHAR, postcode VARCHAR,
+                                                    lat FLOAT, lon FLOAT, updated TIMESTAMP NOT NULL);
+            CREATE TABLE IF NOT EXISTS place_location (location VARCHAR PRIMARY KEY, query VARCHAR NOT NULL);""")
+
+    def __len__(self):
+        return self.db_conn.execute("SELECT count(*) FROM place_location").fetchone()[0]
+
+    def get(self, location: str) -> Tuple[bool, Optional[Place]]:
+        row = self.db_conn.execute("SELECT q.city, q.postcode, q.lat, q.lon, q.updated FROM place_location l "
+                                   "INNER JOIN place_query q ON l.query = q.query WHERE l.location = ?",
+                                   (location,)).fetchone()
+        return self._to_place(location, row)
+
+    def get_query(self, query: str, location: str) -> Tuple[bool, Optional[Place]]:
+        row = self.db_conn.execute("SELECT city, postcode, lat, lon, updated FROM place_query WHERE query = ?",
+                                   (query,)).fetchone()
+        return self._to_place(location, row)
+
+    def _to_place(self, location: str, row: Optional[Tuple]) -> Tuple[bool, Optional[Place]]:
+        if row is None:
+            return False, None
+        elif row[2] is None or row[3] is None:
+            expired = datetime.fromisoformat(row[4]) < datetime.utcnow() - self.negative_ttl
+            return not expired, None
+        else:
+            return True, Place(location, *row[:4])
+
+    def put(self, place: Place, query: str, locations: Iterable[str] = ()):
+        updated = datetime.utcnow().replace(microsecond=0).isoformat()
+        self.db_conn.execute("INSERT OR REPLACE INTO place_query VALUES (?,?,?,?,?,?)",
+                             [query] + place.to_sql_row()[1:] + [updated])
+        self.map_locations(query, [place.location, *locations])
+
+    def map_locations(self, query: str, locations: Iterable[str]):
+        self.db_conn.executemany("INSERT OR REPLACE INTO place_location VALUES (?,?)",
+                                 ((location, query) for location in locations))
+        self.db_conn.commit()
+
+    def put_many(self, places: Iterable[Tuple[Place, str, Optional[str]]]):
+        """Stores places already resolved for their raw location under given normalized query and update time (now if
+        not given), e.g. imported from CSV cache; entries already cached are kept"""
+        now = datetime.utcnow().replace(microsecond=0).isoformat()
+        for place, query, updated in places:
+            row = place.to_sql_row()[1:] + [updated or now]
+            self.db_conn.execute("INSERT OR IGNORE INTO place_query VALUES (?,?,?,?,?,?)", [query] + row)
+            stored = self.db_conn.execute("SELECT lat, lon FROM place_query WHERE query = ?", (query,)).fetchone()
+            if stored != (place.lat, place.lon):
+                # location resolved elsewhere than other spellings of its query keeps its own place
+                query = place.location
+                self.db_conn.execute("INSERT OR IGNORE INTO place_query VALUES (?,?,?,?,?,?)", [query] + row)
+            self.db_conn.execute("INSERT OR IGNORE INTO place_location VALUES (?,?)", (place.location, query))
+        self.db_conn.commit()
+
+    def places(self) -> Iterator[Place]:
+        return (place for place, _ in self.entries())
+
+    def entries(self) -> Iterator[Tuple[Place, str]]:
+        """Yields cached places with the time they were looked up at"""
+        for row in self.db_conn.execute("SELECT l.location, q.city, q.postcode, q.lat, q.lon, q.updated "
+                                        "FROM place_location l INNER JOIN place_query q ON l.query = q.query "
+                                        "ORDER BY l.location"):
+            yield Place(*row[:5]), row[5]
+
+    def close(self):
+        self.db_conn.close()
+
+
 class PlaceResolver:
-    def __init__(self, map_quest_client: MapQuestClient, log: Logger):
+    def __init__(self, map_quest_client: MapQuestClient, log: Logger, cache: Optional[SqlitePlaceCache] = None):
         self.client = map_quest_client
         self.log = log
         self._cache_lock = RLock()
-        self.cache: Dict[str, Optional[Place]] = {}
+        self.cache = cache if cache is not None else SqlitePlaceCache()
+        self.stats = Counter()
 
     def load(self, csv_cache):
         with self._cache_lock:
-            for line in read_csv(csv_cache):
-                self.cache[line[0]] = Place.from_csv_row(line)
+            # CSV cache does not keep offer domains, locations are normalized as of any non-morizon domain
+            self.cache.put_many((p, build_resolve_name("", p.location), updated)
+                                for p, updated in map(self._from_csv_row, read_csv(csv_cache)))
 
     def save(self, csv_cache):
         with self._cache_lock:
-            row_gen = [r.to_csv_row() for r in self.cache.values() if r]
-            row_gen.sort(key=lambda r: r[0])
-            write_csv(csv_cache, row_gen)
+            # negative entries carry the time of their lookup, so their TTL survives CSV round trips
+            write_csv(csv_cache, (p.to_csv_row() + ([] if p.resolved else [updated])
+                                  for p, updated in self.cache.entries()))
+
+    @staticmethod
+    def _from_csv_row(line: List[str]) -> Tuple[Place, Optional[str]]:
+        place = Place.from_csv_row(line)
+        if place is not None:
+            return place, None
+        return Place(line[0], None, None, None, None), line[5] if len(line) > 5 and line[5] else None
 
     def get(self, offer: ParcelOffer) -> Optional[Place]:
+        if not offer.location:
+            return None
         with self._cache_lock:
-            if offer.location in self.cache:
-                return self.cache.get(offer.location)
-            else:
-                address = build_resolve_name(offer.domain, offer.location)
-                if address != offer.location:
-                    self.log.info(f"Resolving {offer.location} -> {address}")
-                resolved = self.client.resolve(address, offer.location)
-                self.cache[offer.location] = resolved
-                return resolved
+            cached, place, query = self._get_cached(offer.domain, offer.location)
+        return place if cached else self._resolve(query, [offer.location])
+
+    def resolve_many(self, offers: Iterable[ParcelOffer], workers: int = 8) -> Dict[str, Optional[Place]]:
+        """Resolves distinct locations of given offers, calling the client once per distinct normalized query"""
+        return self.resolve_locations(((offer.domain, offer.location) for offer in offers), workers)
+
+    def resolve_locations(self, locations: Iterable[Tuple[str, str]], workers: int = 8) -> Dict[str, Optional[Place]]:
+        """Like resolve_many, given (domain, location) pairs; location is resolved as in its first pair"""
+        resolved: Dict[str, Optional[Place]] = {}
+        unknown: Dict[str, List[str]] = defaultdict(list)
+        with self._cache_lock:
+            for domain, location in locations:
+                if not location or location in resolved:
+                    continue
+                cached, place, query = self._get_cached(domain, location)
+                resolved[location] = place
+                if not cached:
+                    unknown[query].append(location)
+        if unknown:
+            unknown_locations = sum(len(locations) for locations in unknown.values())
+            self.log.info(f"Resolving {unknown_locations} unknown locations as {len(unknown)} distinct queries "
+                          f"(dedup ratio {unknown_locations / len(unknown):.2f}) using {workers} workers...")
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for locations, place in zip(unknown.values(), executor.map(self._resolve, unknown.keys(),
+                                                                           unknown.values())):
+                    resolved.update((location, self._with_location(place, location)) for location in locations)
+        return resolved
+
+    def _get_cached(self, domain: str, location: str) -> Tuple[bool, Optional[Place], Optional[str]]:
+        cached, place = self.cache.get(location)
+        if cached:
+            self.stats["hit"] += 1
+            return True, place, None
+        query = build_resolve_name(domain, location)
+        cached, place = self.cache.get_query(query, location)
+        if cached:
+            self.stats["query_hit"] += 1
+            self.cache.map_locations(query, [location])
+            return True, place, query
+        self.stats["miss"] += 1
+        return False, None, query
+
+    def _resolve(self, query: str, locations: List[str]) -> Optional[Place]:
+        if query != locations[0]:
+            self.log.info(f"Resolving {locations[0]} -> {query}")
+        resolved = self.client.resolve(query, locations[0])
+        with self._cache_lock:
+            self.stats["lookup"] += 1
+            if resolved is not None:
+                self.cache.put(resolved, query, locations[1:])
+        return resolved if resolved is not None and resolved.resolved else None
 
+    @staticmethod
+    def _with_location(place: Optional[Place], location: str) -> Optional[Place]:
+        return Place(location, place.city, place.postcode, place.lat, place.lon) if place else None
 
+
+_OMITTED_PART_RE = re.compile(r"(ul\.|ul |ulica |al\.|al |aleja |ok\.|ok |okolice|miasto |gmina |gm\.)", re.IGNORECASE)
+_VOIVODESHIP_RE = re.compile(r"(dolnośląski|wielkopolski)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1 << 16)
 def build_resolve_name(domain: str, location: str) -> str:
-    name_parts: List[str] = [p.strip() for p in location.split(",") if p.strip()]
-    condition = partial(lambda p: not p.lower().startswith("ul.")
-                                  and not p.lower().startswith("ul ")
-                                  and not p.lower().startswith("ulica ")
-                                  and not p.lower().startswith("al.")
-                                  and not p.lower().startswith("al ")
-                                  and not p.lower().startswith("aleja ")
-                                  and not p.lower().startswith("ok.")
-                                  and not p.lower().startswith("ok ")
-                                  and not p.lower().startswith("okolice")
-                                  and not p.lower().startswith("miasto ")
-                                  and not p.lower().startswith("gmina ")
-                                  and not p.lower().startswith("gm.")
-                        )
-    name_parts_wout_street = list(filter(condition, name_parts))
-    name_parts_wout_dupl = list(OrderedDict.fromkeys(name_parts_wout_street))
-
-    if name_parts_wout_dupl[0].lower().startswith("dolnośląski") \
-            or name_parts_wout_dupl[0].lower().startswith("wielkopolski"):
+    name_parts = [p for p in (p.strip() for p in location.split(",")) if p and not _OMITTED_PART_RE.match(p)]
+    name_parts_wout_dupl = list(OrderedDict.fromkeys(name_parts))
+    if not name_parts_wout_dupl:
+        return location.strip()
+
+    if _VOIVODESHIP_RE.match(name_parts_wout_dupl[0]):
         name_parts_wout_dupl = name_parts_wout_dupl[::-1]
-    if name_parts_wout_dupl[-1].lower().startswith("dolnośląski") \
-            or name_parts_wout_dupl[-1].lower().startswith("wielkopolski"):
+    if _VOIVODESHIP_RE.match(name_parts_wout_dupl[-1]):
         name_parts_wout_dupl = name_parts_wout_dupl[:-1]
 
     if domain == "www.morizon.pl":
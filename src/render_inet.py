@@ -1,19 +1,13 @@
 import argparse
-from logging import getLogger
+from logging import getLogger, Logger
+from typing import Iterable, Sequence, Any, List, Dict
 
-from common import read_csv, render_geojson_point, setup_log, save_geojson, color_gradient, randomize_coordinates
+import numpy as np
 
+from common import read_csv, render_geojson_points, setup_log, save_geojson, color_gradient, jitter_coordinates
 
-def calc_class(avg_bandwidth: float, avg_bw_lower_bound: float = 4., avg_bw_upper_bound: int = 64.,
-               classes: int = 4) -> int:
-    # value = min(max(avg_bandwidth - avg_bw_lower_bound, 0) / (avg_bw_upper_bound - avg_bw_lower_bound), 1.)
-    # return round(value * classes)
-    if avg_bandwidth < 8.:
-        return 0
-    elif avg_bandwidth < 25.:
-        return 1
-    else:
-        return 2
+# average bandwidth in Mbps starting 2nd and 3rd bandwidth class
+BANDWIDTH_CLASS_BOUNDS = (8., 25.)
 
 
 def _parse_args() -> argparse.Namespace:
@@ -23,28 +17,35 @@ def _parse_args() -> argparse.Namespace:
     return parser.parse_args()
 
 
-def main(broadband_city_csv: str, geojson: str):
-    setup_log()
-    log = getLogger()
+def render_points(rows: Iterable[Sequence[Any]], log: Logger) -> List[Dict[str, Any]]:
     colors = color_gradient("#737373", "#F2F2F2", 3)
-    points = []
-    for i, cells in enumerate(read_csv(broadband_city_csv)):
-        if i == 0 or not cells:
+    parsed = []
+    for cells in rows:
+        if not cells:
             continue
         try:
-            city, ap_count = cells[0], int(cells[1])
-            min_bw, avg_bw, max_bw = int(cells[2]), float(cells[3]), int(cells[4])
-            lat, lon = randomize_coordinates(float(cells[5]), float(cells[6]), delta=0.004)
-            color_class = calc_class(avg_bandwidth=avg_bw) if max_bw < 100 else 2
-            point = render_geojson_point(lat=lat, lon=lon, marker_color=colors[color_class], marker_symbol='star',
-                                         props={'title': city,
-                                                'min-bandwidth': min_bw,
-                                                'avg-bandwidth': avg_bw,
-                                                'max-bandwidth': max_bw,
-                                                'bandwidth-class': color_class})
-            points.append(point)
+            parsed.append((cells[0], int(cells[1]), int(cells[2]), float(cells[3]), int(cells[4]),
+                           float(cells[5]), float(cells[6])))
         except (TypeError, ValueError, LookupError) as e:
             log.warning(f"Could not parse: {e}, cells: {cells}")
+    if not parsed:
+        return []
+    city, ap_count, min_bw, avg_bw, max_bw, lat, lon = zip(*parsed)
+    lat, lon = jitter_coordinates(lat, lon, city, delta=0.004)
+    color_class = np.where(np.array(max_bw) < 100, np.digitize(avg_bw, BANDWIDTH_CLASS_BOUNDS), 2).tolist()
+    return render_geojson_points(lat, lon, marker_color=[colors[c] for c in color_class], marker_symbol='star',
+                                 props=[{'title': c,
+                                         'min-bandwidth': min_,
+                                         'avg-bandwidth': avg,
+                                         'max-bandwidth': max_,
+                                         'bandwidth-class': cls}
+                                        for c, min_, avg, max_, cls in zip(city, min_bw, avg_bw, max_bw, color_class)])
+
+
+def main(broadband_city_csv: str, geojson: str):
+    setup_log()
+    log = getLogger()
+    points = render_points((cells for i, cells in enumerate(read_csv(broadband_city_csv)) if i > 0), log)
     if points:
         save_geojson(points, geojson)
 
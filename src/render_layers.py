@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import argparse
+import csv
+import sqlite3
+import time
+from collections import Counter
+from logging import getLogger, Logger
+from os import path
+from typing import List, Dict, Any, Callable, Iterable, Sequence, Tuple, Optional, Iterator
+
+import city_avg_geojson
+import render_inet
+import render_new_offers
+from common import setup_log, save_geojson
+from dump_views import ReadOnlyConnectionPool, export_query, stream_rows
+
+RenderPoints = Callable[[Iterable[Sequence[Any]], Logger], List[Dict[str, Any]]]
+
+# view rendered into GeoJSON layer file, and function building layer points out of view rows
+LAYERS: Dict[str, Tuple[str, RenderPoints]] = {
+    "avg_city_price": ("avg_city_prices.json", city_avg_geojson.render_points),
+    "last_10days_offers": ("recent_offers.json", render_new_offers.render_points),
+    "city_broadband": ("city_broadband.json", render_inet.render_points),
+}
+
+
+def main(sqlite_db: str, output_path: str, csv_views: Sequence[str] = (), headers: bool = True,
+         compact: bool = False):
+    setup_log()
+    log = getLogger()
+    pool = ReadOnlyConnectionPool(sqlite_db)
+    try:
+        for view, (geojson_file, render_points) in LAYERS.items():
+            start = time.perf_counter()
+            cursor = pool.get().execute(f"SELECT * FROM {view}")
+            csv_file = path.join(output_path, f"{view}.csv") if view in csv_views else None
+            row_count = Counter()
+            try:
+                points = render_points(_view_rows(cursor, csv_file, headers, row_count), log)
+            finally:
+                cursor.close()
+            # written even when empty, so a layer left from a previous run does not outlive its rows
+            save_geojson(points, path.join(output_path, geojson_file), compact)
+            log.info(f"Rendered {len(points)} points out of {row_count['rows']} rows of view {view} into "
+                     f"{geojson_file} in {time.perf_counter() - start:.2f}s")
+        for view in csv_views:
+            if view not in LAYERS:
+                export_query(pool, f"SELECT * FROM {view}", path.join(output_path, f"{view}.csv"), headers)
+    finally:
+        pool.close()
+    log.info(f"Done rendering {len(LAYERS)} layers from {sqlite_db} into {output_path}")
+
+
+def _view_rows(cursor: sqlite3.Cursor, csv_file: Optional[str], headers: bool, row_count: Counter) -> Iterator[Sequence[Any]]:
+    """Streams rows of executed view query, copying them into csv_file as they are read if given"""
+    if csv_file is None:
+        for row in stream_rows(cursor):
+            row_count["rows"] += 1
+            yield row
+        return
+    with open(csv_file, "w") as csv_f:
+        writer = csv.writer(csv_f, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        rows = stream_rows(cursor, headers)
+        if headers:
+            writer.writerow(next(rows))
+        for row in rows:
+            writer.writerow(row)
+            row_count["rows"] += 1
+            yield row
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Render GeoJSON map layers straight out of DB views')
+    parser.add_argument('db', type=str, help='Path to populated sqlite3 DB')
+    parser.add_argument('output', type=str, help='Path to directory where GeoJSON (and CSV) files are written to')
+    parser.add_argument('--csv-views', nargs='+', default=[],
+                        help='Views to additionally export into <view>.csv files')
+    parser.add_argument('--no-headers', action='store_true', help='Omit header row with column names in CSV files')
+    parser.add_argument('--compact', action='store_true',
+                        help='Write GeoJSON without whitespace and with coordinates rounded to 6 decimal places')
+    return parser.parse_args()
+
+
+def cli_main():
+    args = _parse_args()
+    main(args.db, args.output, args.csv_views, not args.no_headers, args.compact)
+
+
+if __name__ == '__main__':
+    cli_main()
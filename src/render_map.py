@@ -1,68 +1,109 @@
 #!/usr/bin/env python3
 
 import argparse
-import codecs
-import json
 import logging
+from contextlib import ExitStack
 from os import path
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 from colour import Color
 
-from common import setup_log
+from common import setup_log, GeoJsonWriter, read_geojson_features, iter_geojson
+from simplify_isochrone import SIMPLIFIED_MEMBER
+from tiles import write_tiles
 
 
 def _read_isochrone_map(map_path: str, narrowest_color: str = "green", broadest_color: str = "red",
-                        time_steps_min: int = 7) -> Dict[str, Any]:
-    with codecs.open(map_path, 'r', 'utf-8-sig') as map_:
-        map_path = json.load(map_)
-    polygon_count = len(map_path["features"])
-    map_path["features"] = map_path["features"][::-1]
+                        time_steps_min: int = 7) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Returns top-level members other than type and features, and features of isochrone map styled for rendering"""
+    members, features = {}, []
+    for member, value in iter_geojson(map_path):
+        if member == "features":
+            features.append(value)
+        elif member != "type":
+            members[member] = value
+    polygon_count = len(features)
+    features = features[::-1]
     colors = [c.hex for c in Color(broadest_color).range_to(Color(narrowest_color), polygon_count)]
-    for i, (f, c) in enumerate(zip(map_path["features"], colors)):
+    for i, (f, c) in enumerate(zip(features, colors)):
         f["properties"]["fill"] = colors[-1]
         f["properties"]["fill-opacity"] = 0.03
         f["properties"]["stroke"] = c
         f["properties"]["stroke-opacity"] = 0.8
         f["properties"]["drive-time"] = f"{(polygon_count - i - 1) * time_steps_min}-{(polygon_count - i) * time_steps_min}min"
-    return map_path
+    return members, features
 
 
 def _parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description='Merges base isochrone map with given additional GeoJSON features')
     parser.add_argument('base', type=str, help='Path to base isochrone map from maps.openrouteservice.org')
-    parser.add_argument('tgt', type=str, help='Path where to store rendered map')
+    parser.add_argument('tgt', type=str, help='Path where to store rendered map, or tile directory with --tiles')
     parser.add_argument('layers', nargs='+', help='Paths to more GeoJSON files')
     parser.add_argument('-v', '--verbose', action='store_true', help='Enable more verbose logging')
-    return parser.parse_args()
-
-
-def main(tgt_map: str, isochrone_map: str, debug: bool, *layers_files) -> None:
+    parser.add_argument('--compact', action='store_true',
+                        help='Write map without whitespace and with coordinates rounded to 6 decimal places')
+    parser.add_argument('--tiles', type=int, nargs=2, metavar=('MIN_ZOOM', 'MAX_ZOOM'),
+                        help='Cut map into z/x/y GeoJSON tiles of given zoom levels instead of single file')
+    parser.add_argument('--map', nargs='+', action='append', default=[], metavar=('TGT', 'LAYER'), dest='maps',
+                        help='Another map rendered in the same pass out of given layers, layers shared between maps '
+                             'are read once')
+    args = parser.parse_args()
+    if args.tiles and args.maps:
+        parser.error("--map cannot be combined with --tiles")
+    return args
+
+
+def main(tgt_map: str, isochrone_map: str, debug: bool, *layers_files, compact: bool = False,
+         zooms: Optional[Sequence[int]] = None, other_maps: Optional[Dict[str, Sequence[str]]] = None) -> None:
     setup_log(logging.DEBUG if debug else logging.INFO)
     log = logging.getLogger("estate")
 
-    base_map = _read_isochrone_map(isochrone_map)
-
-    log.info(f"Applying {len(layers_files)} layers on top of {isochrone_map}")
-    for lf in layers_files:
-        lf = path.abspath(lf)
+    members, base_features = _read_isochrone_map(isochrone_map)
+    if zooms:
+        _write_tiles(tgt_map, base_features, layers_files, zooms, log)
+        return
+
+    maps = {tgt_map: [path.abspath(lf) for lf in layers_files]}
+    maps.update((tgt, [path.abspath(lf) for lf in layers]) for tgt, layers in (other_maps or {}).items())
+    log.info(f"Writing layers on top of {isochrone_map} into {', '.join(maps)}")
+    # top-level members of the base map, such as crs, name or bbox, are carried over into the final map, except for
+    # cache key of simplified isochrone map
+    members.pop(SIMPLIFIED_MEMBER, None)
+    with ExitStack() as stack:
+        writers = {tgt: stack.enter_context(GeoJsonWriter(tgt, compact, members=members)) for tgt in maps}
+        for writer in writers.values():
+            writer.write_all(base_features)
+        # layers are written in order of their first appearance across maps
+        for lf in dict.fromkeys(lf for layers in maps.values() for lf in layers):
+            if not path.isfile(lf):
+                log.warning(f"GeoJSON file {lf} does not exist, omitting the layer")
+                continue
+            layer_writers = [writers[tgt] for tgt, layers in maps.items() if lf in layers]
+            for feature in read_geojson_features(lf):
+                for writer in layer_writers:
+                    writer.write(feature)
+
+    for tgt, writer in writers.items():
+        log.info(f"Done writing final map with {writer.count} features at {tgt}")
+
+
+def _write_tiles(tgt_dir: str, base_features: List[Dict[str, Any]], layers_files: Sequence[str], zooms: Sequence[int],
+                 log: logging.Logger) -> None:
+    features = list(base_features)
+    for lf in map(path.abspath, layers_files):
         if path.isfile(lf):
-            with open(lf, "r") as lf_:
-                layer_map = json.load(lf_)
-            base_map["features"].extend(layer_map["features"])
+            features.extend(read_geojson_features(lf))
         else:
             log.warning(f"GeoJSON file {lf} does not exist, omitting the layer")
-
-    log.info(f"Writing final map at {tgt_map}")
-    with open(tgt_map, "w") as tgt:
-        json.dump(base_map, tgt, ensure_ascii=False, indent=2)
-
-    log.info(f"Done writing final map at {tgt_map}")
+    log.info(f"Cutting {len(features)} features into tiles of zoom {zooms[0]}-{zooms[-1]} at {tgt_dir}")
+    index = write_tiles(features, tgt_dir, zooms[0], zooms[-1], log)
+    log.info(f"Done writing {sum(len(t) for t in index['zooms'].values())} tiles at {tgt_dir}")
 
 
 def cli_main():
     args = _parse_args()
-    main(args.tgt, args.base, args.verbose, *tuple(args.layers))
+    main(args.tgt, args.base, args.verbose, *tuple(args.layers), compact=args.compact, zooms=args.tiles,
+         other_maps={tgt_and_layers[0]: tgt_and_layers[1:] for tgt_and_layers in args.maps})
 
 
 if __name__ == '__main__':
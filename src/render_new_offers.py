@@ -2,33 +2,38 @@
 
 import argparse
 from logging import getLogger, Logger
-from typing import List, Any, Dict, Optional
+from typing import List, Any, Dict, Optional, Iterable, Sequence, Tuple
 
-from common import setup_log, read_csv, render_geojson_point, save_geojson, color_gradient, randomize_coordinates
+import numpy as np
 
+from common import setup_log, read_csv, render_geojson_points, save_geojson, color_gradient, jitter_coordinates, \
+    value_classes
 
-def _calc_value(price_per_sqm: int, min_price: int = 30, max_price: int = 180) -> int:
-    value = min(max(price_per_sqm - min_price, 0) / (max_price - min_price), 1.)
-    return round((1 - value) * 9)
 
-
-def row_to_point(row: List[str], colors: List[str], log: Logger) -> Optional[Dict[str, Any]]:
+def _parse_row(row: Sequence[Any], log: Logger) -> Optional[Tuple[Any, ...]]:
     try:
-        offer_age_days = int(row[0])
-        price_per_sqm = round(float(row[3]))
-        marker_color = colors[_calc_value(price_per_sqm, max_price=150)]
-        lat, lon = randomize_coordinates(float(row[9]), float(row[10]))
-        return render_geojson_point(lat=lat, lon=lon,
-                                    marker_size="large" if offer_age_days <= 2 else "small",
-                                    marker_color=marker_color,
-                                    props={"title": row[2], "url": row[8], "age": offer_age_days,
-                                           "area": round(float(row[4])), "city": row[1],
-                                           "price_per_sqm": f"{price_per_sqm} zł/m2"})
+        return (str(row[7]), int(row[0]), round(float(row[3])), round(float(row[4])), float(row[9]), float(row[10]),
+                row[2], row[8], row[1])
     except (LookupError, ValueError, TypeError) as e:
-        log.warning(f"Could not render CSV row {row} as GeoJSON: {e}")
+        log.warning(f"Could not render row {row} as GeoJSON: {e}")
         return None
 
 
+def render_points(rows: Iterable[Sequence[Any]], log: Logger) -> List[Dict[str, Any]]:
+    colors = color_gradient("red", "green", 10)
+    parsed = list(filter(None, [_parse_row(t, log) for t in rows if t[0] not in (None, "")]))
+    if not parsed:
+        return []
+    ident, age, price_per_sqm, area, lat, lon, title, url, city = zip(*parsed)
+    lat, lon = jitter_coordinates(lat, lon, ident)
+    return render_geojson_points(lat, lon,
+                                 marker_color=[colors[c] for c in value_classes(price_per_sqm, 30, 150)],
+                                 marker_size=np.where(np.array(age) <= 2, "large", "small").tolist(),
+                                 props=[{"title": t, "url": u, "age": a, "area": ar, "city": c,
+                                         "price_per_sqm": f"{p} zł/m2"}
+                                        for t, u, a, ar, c, p in zip(title, url, age, area, city, price_per_sqm)])
+
+
 def main(avg_city_prices_csv: str, output_geojson: str, headers: bool = False) -> None:
     setup_log()
     log = getLogger()
@@ -36,8 +41,7 @@ def main(avg_city_prices_csv: str, output_geojson: str, headers: bool = False) -
     csv_lines = list(read_csv(avg_city_prices_csv))
     if headers:
         _ = csv_lines.pop(0)
-    colors = color_gradient("red", "green", 10)
-    points = list(filter(None, [row_to_point(t, colors, log) for t in csv_lines if t[0]]))
+    points = render_points(csv_lines, log)
     log.info(f"Rendering GeoJSON out of {len(points)} points...")
     save_geojson(points, output_geojson)
     log.info(f"Done rendering file {output_geojson}")
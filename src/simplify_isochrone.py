@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+from collections import defaultdict
+from logging import getLogger
+from os import path
+from typing import List, Any, Dict, Tuple, Sequence, Set
+
+import shapely
+
+from common import setup_log, GeoJsonWriter, source_sha1
+from isochrone import read_isochrone_map
+
+# foreign member of simplified map holding its cache key
+SIMPLIFIED_MEMBER = "simplified"
+
+Point = Tuple[float, float]
+Arc = List[Point]
+
+
+def _quantize_ring(ring: Sequence[Sequence[float]], precision: int) -> Arc:
+    """Snaps ring coordinates to grid of 10^-precision degrees, dropping repeated points and closing point"""
+    points: Arc = []
+    for x, y in ring:
+        point = (round(x, precision), round(y, precision))
+        if not points or points[-1] != point:
+            points.append(point)
+    return points[:-1] if len(points) > 1 and points[0] == points[-1] else points
+
+
+def _rings(geometry: Dict[str, Any]) -> List[Sequence[Sequence[float]]]:
+    if geometry["type"] == "Polygon":
+        return geometry["coordinates"]
+    if geometry["type"] == "MultiPolygon":
+        return [ring for polygon in geometry["coordinates"] for ring in polygon]
+    raise ValueError(f"Expected Polygon or MultiPolygon isochrone, got: {geometry['type']}")
+
+
+def _junctions(rings: Sequence[Arc]) -> Set[Point]:
+    """Points where rings meet or part: ones seen with more than one pair of neighbours"""
+    neighbours: Dict[Point, Set[frozenset]] = defaultdict(set)
+    for ring in rings:
+        for i, point in enumerate(ring):
+            neighbours[point].add(frozenset((ring[i - 1], ring[(i + 1) % len(ring)])))
+    return {point for point, pairs in neighbours.items() if len(pairs) > 1}
+
+
+class Topology:
+    """Polygon rings cut into arcs at junctions, arcs shared between rings stored once (as in TopoJSON)"""
+
+    def __init__(self, rings: Sequence[Arc]):
+        self.arcs: List[Arc] = []
+        self.rings: List[List[int]] = []  # arc indices, ~i standing for arc i reversed
+        self._arc_index: Dict[Tuple[Point, ...], int] = {}
+        junctions = _junctions(rings)
+        for ring in rings:
+            self.rings.append([self._add_arc(arc) for arc in self._cut(ring, junctions)])
+
+    @staticmethod
+    def _cut(ring: Arc, junctions: Set[Point]) -> List[Arc]:
+        cuts = [i for i, point in enumerate(ring) if point in junctions]
+        if not cuts:
+            # ring without junctions starts at its lowest point, so the same ring is the same arc in both polygons
+            start = ring.index(min(ring))
+            return [ring[start:] + ring[:start + 1]]
+        ring = ring[cuts[0]:] + ring[:cuts[0] + 1]
+        cuts = [i - cuts[0] for i in cuts] + [len(ring) - 1]
+        return [ring[start:end + 1] for start, end in zip(cuts, cuts[1:])]
+
+    def _add_arc(self, arc: Arc) -> int:
+        key = tuple(arc)
+        if key in self._arc_index:
+            return self._arc_index[key]
+        if key[::-1] in self._arc_index:
+            return ~self._arc_index[key[::-1]]
+        self._arc_index[key] = len(self.arcs)
+        self.arcs.append(arc)
+        return len(self.arcs) - 1
+
+    def simplify(self, tolerance: float) -> 'Topology':
+        """Simplifies each arc once, keeping its ends, so rings sharing an arc keep sharing it"""
+        lines = shapely.simplify([shapely.LineString(arc) for arc in self.arcs], tolerance, preserve_topology=True)
+        self.arcs = [[tuple(point) for point in coords.tolist()] for coords in map(shapely.get_coordinates, lines)]
+        return self
+
+    def ring(self, i: int) -> Arc:
+        """Returns points of i-th ring, without the closing point"""
+        points: Arc = []
+        for arc in self.rings[i]:
+            points.extend((self.arcs[arc] if arc >= 0 else self.arcs[~arc][::-1])[1 if points else 0:])
+        return points[:-1]
+
+    def vertex_count(self) -> int:
+        return sum(len(arc) for arc in self.arcs)
+
+
+def simplify_features(features: Sequence[Dict[str, Any]], tolerance: float = 0.0002, precision: int = 5,
+                      drop_collapsed: bool = False) -> Tuple[List[Dict[str, Any]], Topology]:
+    """Returns polygon features quantized and simplified over shared arcs, with the topology used; features whose
+    every polygon collapses keep their original geometry, or get empty one if drop_collapsed"""
+    shapes = []
+    for feature in features:
+        geometry = feature["geometry"]
+        polygons = [geometry["coordinates"]] if geometry["type"] == "Polygon" else geometry["coordinates"]
+        shapes.append([len(polygon) for polygon in polygons])
+    quantized = [_quantize_ring(ring, precision) for feature in features for ring in _rings(feature["geometry"])]
+    topology = Topology(quantized).simplify(tolerance)
+
+    simplified, ring_i = [], 0
+    for feature, ring_counts in zip(features, shapes):
+        polygons = []
+        for ring_count in ring_counts:
+            rings = [topology.ring(i) for i in range(ring_i, ring_i + ring_count)]
+            ring_i += ring_count
+            # rings collapsed below a triangle are dropped, polygons with collapsed outer ring as well
+            if len(set(rings[0])) >= 3:
+                polygons.append([[list(p) for p in ring + ring[:1]] for ring in rings if len(set(ring)) >= 3])
+        if not polygons:
+            geometry = {"type": "MultiPolygon", "coordinates": []} if drop_collapsed else feature["geometry"]
+        elif len(polygons) == 1:
+            geometry = {"type": "Polygon", "coordinates": polygons[0]}
+        else:
+            geometry = {"type": "MultiPolygon", "coordinates": polygons}
+        simplified.append({**feature, "geometry": geometry})
+    return simplified, topology
+
+
+def simplified_metadata(output: str) -> Dict[str, Any]:
+    with open(output, "r", encoding="utf-8") as output_:
+        return json.load(output_).get(SIMPLIFIED_MEMBER, {})
+
+
+def main(isochrone: str, output: str, tolerance: float = 0.0002, precision: int = 5):
+    setup_log()
+    log = getLogger()
+    params = {"source_sha1": source_sha1(isochrone), "tolerance": tolerance, "precision": precision}
+    if path.isfile(output) and simplified_metadata(output) == params:
+        log.info(f"Simplified isochrone map at {output} is up to date with {isochrone}, skipping")
+        return
+    features = read_isochrone_map(isochrone)["features"]
+    source_vertices = sum(len(ring) for f in features for ring in _rings(f["geometry"]))
+    log.info(f"Simplifying {len(features)} isochrones of {source_vertices} vertices from {isochrone} "
+             f"with tolerance {tolerance}° and precision {precision} ...")
+    simplified, topology = simplify_features(features, tolerance, precision)
+    # cache key goes into foreign member of the collection, ignored by GeoJSON readers
+    with GeoJsonWriter(output, compact=True, precision=precision, members={SIMPLIFIED_MEMBER: params}) as writer:
+        writer.write_all(simplified)
+    log.info(f"Written {len(topology.arcs)} arcs of {topology.vertex_count()} vertices into {output}: "
+             f"{path.getsize(isochrone)} -> {path.getsize(output)} bytes")
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Simplify and quantize isochrone map for rendering, keeping '
+                                                 'boundaries shared between isochrones shared')
+    parser.add_argument('isochrone', type=str, help='Path to isochrone map')
+    parser.add_argument('output', type=str, help='Path to simplified GeoJSON isochrone map')
+    parser.add_argument('--tolerance', type=float, default=0.0002,
+                        help='Max distance of simplified boundary from the original in degrees')
+    parser.add_argument('--precision', type=int, default=5, help='Decimal places of coordinates')
+    return parser.parse_args()
+
+
+def cli_main():
+    args = _parse_args()
+    main(args.isochrone, args.output, args.tolerance, args.precision)
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -0,0 +1,105 @@
+import json
+import zipfile
+from os import path
+
+import numpy as np
+import pytest
+
+from common import read_csv_columns, list_csv_sources, read_csv, source_size_mtime, save_geojson, \
+    read_geojson_features, jitter_coordinates, render_geojson_points, value_classes, iter_geojson, GeoJsonWriter
+
+
+def test_should_project_typed_columns_skipping_bom_and_header(tmp_path):
+    csv_file = tmp_path / "uke.csv"
+    csv_file.write_text('﻿id;nazwa;medium;predkosc\n'
+                        '1;"""TVK"" SP. Z O.O.";światłowodowe;100\n'
+                        '2;ORANGE;miedziane;20\n'
+                        '3;ORANGE\n'
+                        '4;"NETIA\nS.A.";miedziane;30\n', encoding="utf-8")
+    with zipfile.ZipFile(tmp_path / "uke.csv.zip", "w") as zip_f:
+        zip_f.write(csv_file, "uke.csv")
+
+    rows = list(read_csv_columns(str(csv_file), ("predkosc", "nazwa", "id"), delimiter=';', types=(int, str, str)))
+    zipped_rows = list(read_csv_columns(str(tmp_path / "uke.csv.zip!uke.csv"), ("predkosc", "nazwa", "id"),
+                                        delimiter=';', types=(int, str, str)))
+
+    assert rows == zipped_rows == [(100, '"TVK" SP. Z O.O.', "1"), (20, "ORANGE", "2"), (30, "NETIA\nS.A.", "4")]
+    with pytest.raises(ValueError):
+        list(read_csv_columns(str(csv_file), ("x92",), delimiter=';'))
+
+
+def test_should_stream_csv_members_of_zip_archives(tmp_path):
+    (tmp_path / "offers_1.csv").write_text("a,1\n", encoding="utf-8")
+    with zipfile.ZipFile(tmp_path / "offers_2.csv.zip", "w") as zip_f:
+        zip_f.writestr("offers_2.csv", "b,2\nc,\"3\"\n")
+        zip_f.writestr("readme.txt", "not a CSV")
+
+    sources = list_csv_sources(str(tmp_path))
+
+    assert [path.basename(s) for s in sources] == ["offers_1.csv", "offers_2.csv.zip!offers_2.csv"]
+    assert [row for s in sources for row in read_csv(s)] == [["a", "1"], ["b", "2"], ["c", "3"]]
+    assert source_size_mtime(sources[1])[0] == len("b,2\nc,\"3\"\n")
+
+
+def test_should_write_geojson_like_json_dump_and_stream_it_back(tmp_path):
+    features = [{"type": "Feature", "geometry": {"type": "Point", "coordinates": [17.0123456789, 51.1]},
+                 "properties": {"title": "Wrocław", "price": 1200}},
+                {"type": "Feature", "geometry": {"type": "Polygon", "coordinates": [[[17., 51.], [17.5, 51.25]]]},
+                 "properties": {}}]
+    pretty, compact, empty = tmp_path / "pretty.json", tmp_path / "compact.json", tmp_path / "empty.json"
+
+    save_geojson(iter(features), str(pretty))
+    save_geojson(features, str(compact), compact=True)
+    save_geojson([], str(empty))
+
+    assert pretty.read_text() == json.dumps({"type": "FeatureCollection", "features": features},
+                                            ensure_ascii=False, indent=2)
+    assert empty.read_text() == json.dumps({"type": "FeatureCollection", "features": []}, indent=2)
+    assert list(read_geojson_features(str(pretty))) == features
+    assert list(read_geojson_features(str(empty))) == []
+    compact_features = list(read_geojson_features(str(compact)))
+    assert compact_features[0]["geometry"]["coordinates"] == [17.012346, 51.1]
+    assert compact_features[1] == features[1]
+    assert len(compact.read_text()) < len(pretty.read_text())
+
+
+def test_should_stream_geojson_members_around_features(tmp_path):
+    features = [{"type": "Feature", "geometry": {"type": "Point", "coordinates": [17., 51.]}, "properties": {}}] * 3
+    members = {"name": "isochrones", "crs": {"type": "name", "properties": {"name": "EPSG:4326"}}}
+    geojson = tmp_path / "members.json"
+    with GeoJsonWriter(str(geojson), members=members) as writer:
+        writer.write_all(features)
+    geojson.write_text(geojson.read_text()[:-1] + ', "bbox": [16, 50, 18, 52]}')
+
+    items = list(iter_geojson(str(geojson)))
+
+    assert items == [("type", "FeatureCollection"), ("name", "isochrones"), ("crs", members["crs"])] \
+           + [("features", f) for f in features] + [("bbox", [16, 50, 18, 52])]
+
+
+def test_should_jitter_points_the_same_way_for_the_same_keys():
+    keys = [f"offer-{i}" for i in range(1000)]
+    lat, lon = np.full(1000, 51.), np.full(1000, 17.)
+
+    jittered_lat, jittered_lon = jitter_coordinates(lat, lon, keys)
+    reversed_lat, reversed_lon = jitter_coordinates(lat, lon, keys[::-1])
+
+    assert np.array_equal(jittered_lat, reversed_lat[::-1]) and np.array_equal(jittered_lon, reversed_lon[::-1])
+    for delta in (np.abs(jittered_lat - lat), np.abs(jittered_lon - lon)):
+        assert delta.min() >= 0.002 - 1e-12 and delta.max() <= 0.006 + 1e-12
+    assert 0.4 < np.mean(jittered_lat > lat) < 0.6 and 0.4 < np.mean(jittered_lon > lon) < 0.6
+    assert value_classes([0, 30, 105, 180, 200], 30, 180).tolist() == [9, 9, 4, 0, 0]
+
+
+def test_should_build_point_features_in_batch():
+    count = 1000
+    rng = np.random.default_rng(0)
+    keys = [str(i) for i in range(count)]
+    prices = rng.uniform(10, 200, count)
+
+    lat, lon = jitter_coordinates(rng.uniform(50, 52, count), rng.uniform(16, 18, count), keys)
+    features = render_geojson_points(lat, lon, marker_color=[str(c) for c in value_classes(prices, 30, 150)],
+                                     props=[{"title": k} for k in keys])
+
+    assert len(features) == count
+    assert features[7]["properties"]["title"] == "7" and features[7]["geometry"]["coordinates"] == [lon[7], lat[7]]
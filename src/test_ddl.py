@@ -0,0 +1,39 @@
+import sqlite3
+from datetime import datetime, timedelta
+from logging import getLogger
+from os import path
+
+from import_into_db import _init_tables, _refresh_summaries
+
+DDL_SCRIPT = path.join(path.dirname(path.realpath(__file__)), "ddl.sql")
+TODAY_OFFER_VIEWS = ("latest_offers", "last_10days_offers")
+
+
+def _db_with_schema() -> sqlite3.Connection:
+    db_conn = sqlite3.connect(":memory:")
+    _init_tables(db_conn, DDL_SCRIPT)
+    return db_conn
+
+
+def test_today_offer_views_should_range_scan_offers():
+    db_conn = _db_with_schema()
+    for view in TODAY_OFFER_VIEWS:
+        plan = [row[-1] for row in db_conn.execute(f"EXPLAIN QUERY PLAN SELECT * FROM {view}")]
+
+        assert "SEARCH o USING COVERING INDEX offer_day_ix (timestamp>? AND timestamp<?)" in plan, plan
+        assert not [step for step in plan if step.startswith("SCAN o") or step.startswith("SCAN parcel_offer")], plan
+
+
+def test_today_offer_views_should_only_include_offers_seen_today():
+    db_conn = _db_with_schema()
+    now = datetime.utcnow().replace(microsecond=0)
+    db_conn.execute("INSERT INTO place VALUES ('Gajków, wrocławski', 'Gajków', NULL, 51.1, 17.1)")
+    db_conn.executemany("INSERT INTO parcel_offer VALUES (?,?,?,?,?,?,?)",
+                        [("1", (now - timedelta(days=1)).isoformat(), "https://www.olx.pl/1.html", "Offer 1",
+                          "Gajków, wrocławski", 1000, 100000),
+                         ("2", now.isoformat(), "https://www.olx.pl/2.html", "Offer 2",
+                          "Gajków, wrocławski", 1000, 100000)])
+    _refresh_summaries(db_conn, getLogger())
+
+    for view in TODAY_OFFER_VIEWS:
+        assert [row[7] for row in db_conn.execute(f"SELECT * FROM {view}")] == ["2"]
@@ -0,0 +1,42 @@
+from logging import getLogger
+
+from gazetteer import Gazetteer, OfflineGeocoder
+from model import Place
+from test_place_resolver import StubClient
+
+GAZETTEER = Gazetteer([("wilkszyn", "średzki", "", 51.19, 16.88, "Wilkszyn"),
+                       ("wilkszyn", "", "wiśniowa", 51.191, 16.881, "Wilkszyn"),
+                       ("pawłowice", "wrocławski", "", 51.17, 17.11, "Pawłowice"),
+                       ("pawłowice", "średzki", "", 51.21, 16.61, "Pawłowice")])
+
+
+def test_should_resolve_offline_and_fall_back_on_misses():
+    fallback = StubClient(Place("", "Gajków", None, 51.03, 17.15))
+    geocoder = OfflineGeocoder(GAZETTEER, getLogger(), fallback)
+
+    street = geocoder.resolve("Wilkszyn, średzki", "ul. Wiśniowa, Wilkszyn, średzki, Dolnośląskie")
+    fuzzy = geocoder.resolve("Wilkszyń", "Wilkszyń")
+    county = geocoder.resolve("Pawłowice, wrocławski", "Pawłowice, wrocławski, Dolnośląskie")
+    ambiguous = geocoder.resolve("Pawłowice", "Pawłowice")
+
+    assert (street.city, street.lat, street.lon) == ("Wilkszyn", 51.191, 16.881)
+    assert (fuzzy.city, fuzzy.lat, fuzzy.lon) == ("Wilkszyn", 51.19, 16.88)
+    assert (county.city, county.lat, county.lon) == ("Pawłowice", 51.17, 17.11)
+    assert ambiguous.city == "Gajków"
+    assert fallback.queries == ["Pawłowice"]
+    assert (geocoder.stats["offline"], geocoder.stats["fallback"]) == (3, 1)
+
+
+def test_should_locate_street_of_town_in_county_given(tmp_path):
+    built = Gazetteer([("nowa wieś", "oleśnicki", "", 51.2, 17.4, "Nowa Wieś"),
+                       ("nowa wieś", "oleśnicki", "polna", 51.21, 17.41, "Nowa Wieś"),
+                       ("nowa wieś", "średzki", "polna", 51.11, 16.71, "Nowa Wieś"),
+                       ("nowa wieś", "średzki", "", 51.1, 16.7, "Nowa Wieś"),
+                       ("nowa wieś", "średzki", "lipowa", 51.12, 16.72, "Nowa Wieś")])
+    built.save(str(tmp_path / "gazetteer.csv"))
+    gazetteer = Gazetteer.load(str(tmp_path / "gazetteer.csv"))
+
+    assert gazetteer.locate("Nowa Wieś", "średzki", "ul. Polna")[:2] == (51.11, 16.71)
+    assert gazetteer.locate("Nowa Wieś", "oleśnicki", "ul. Polna")[:2] == (51.21, 17.41)
+    assert gazetteer.locate("Nowa Wieś", None, "ul. Lipowa")[:2] == (51.12, 16.72)
+    assert gazetteer.locate("Nowa Wieś", None, "ul. Polna") is None
@@ -0,0 +1,23 @@
+import numpy as np
+
+from geo import puwg92_to_wgs84, PointGrid
+
+
+def test_should_convert_puwg92_into_wgs84():
+    # x92/y92 and x84/y84 coordinates of the same UKE POPC address point
+    lat, lon = puwg92_to_wgs84(np.array([384014.]), np.array([354531.]))
+
+    assert abs(lat[0] - 51.045865) < 1e-5
+    assert abs(lon[0] - 17.344885) < 1e-5
+
+
+def test_should_find_points_within_radius():
+    lat = np.array([51.1, 51.1009, 51.1, 51.11])
+    lon = np.array([17.0, 17.0, 17.0028, 17.0])
+    grid = PointGrid(lat, lon, cell_m=150.)
+
+    query, point, distance = grid.within(np.array([51.1, 52.]), np.array([17., 17.]), radius_m=200.)
+
+    assert query.tolist() == [0, 0, 0]
+    assert sorted(point.tolist()) == [0, 1, 2]
+    assert np.all(distance <= 200.)
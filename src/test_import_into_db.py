@@ -0,0 +1,249 @@
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from logging import getLogger
+from os import path
+
+import pytest
+
+import import_into_db
+from common import write_csv
+from import_into_db import _insert_rows, _encode_broadband_rows, ON_CONFLICT_REPLACE, BROADBAND_DIMENSIONS, \
+    _init_tables, _refresh_summaries, main, _is_imported, _mark_imported, _needs_import, _parse_files, \
+    _parse_offer_csv, _parse_curr_inet_csv
+from model import ParcelOffer
+
+DDL_SCRIPT = path.join(path.dirname(path.realpath(__file__)), "ddl.sql")
+DATA_DIR = path.join(path.dirname(path.realpath(__file__)), "..", "data")
+PARCEL_OFFER_DDL = """CREATE TABLE parcel_offer
+(
+    ident     VARCHAR NOT NULL,
+    timestamp VARCHAR NOT NULL,
+    title     VARCHAR NOT NULL,
+    price_pln FLOAT   NOT NULL,
+    CONSTRAINT parcel_offer_pk PRIMARY KEY (ident, timestamp)
+)"""
+
+
+def _offer_rows(count: int):
+    return [[str(i), "2020-04-16T18:43:48", f"Offer {i}", 1000. * i] for i in range(count)]
+
+
+def test_should_keep_valid_rows_of_chunk_with_duplicate_and_invalid_row():
+    db_conn = sqlite3.connect(":memory:")
+    db_conn.execute(PARCEL_OFFER_DDL)
+    rows = _offer_rows(50)
+    rows.insert(10, rows[3])
+    rows.insert(20, ["invalid", "2020-04-16T18:43:48", None, 1000.])
+
+    stats = _insert_rows(db_conn, "parcel_offer", rows, getLogger())
+
+    assert (stats["inserted"], stats["duplicate"], stats["rejected"]) == (50, 1, 1)
+    assert db_conn.execute("SELECT count(*) FROM parcel_offer").fetchone()[0] == 50
+
+
+def test_should_overwrite_duplicates_on_replace_conflict_policy():
+    db_conn = sqlite3.connect(":memory:")
+    db_conn.execute(PARCEL_OFFER_DDL)
+    _insert_rows(db_conn, "parcel_offer", _offer_rows(5), getLogger())
+    updated_row = ["3", "2020-04-16T18:43:48", "Updated offer", 1.]
+
+    stats = _insert_rows(db_conn, "parcel_offer", [updated_row], getLogger(), on_conflict=ON_CONFLICT_REPLACE)
+
+    # overwritten row is written again, so it counts as inserted
+    assert (stats["inserted"], stats["duplicate"], stats["rejected"]) == (1, 0, 0)
+    assert db_conn.execute("SELECT title FROM parcel_offer WHERE ident = '3'").fetchone()[0] == "Updated offer"
+    assert db_conn.execute("SELECT count(*) FROM parcel_offer").fetchone()[0] == 5
+
+
+def test_should_not_insert_rows_of_failed_chunk_twice_into_table_without_key():
+    db_conn = sqlite3.connect(":memory:")
+    db_conn.execute("CREATE TABLE broadband (ident VARCHAR NOT NULL, bandwidth INTEGER NOT NULL)")
+    rows = [[str(i), 100] for i in range(10)] + [["10", None]]
+
+    stats = _insert_rows(db_conn, "broadband", rows, getLogger())
+
+    assert (stats["inserted"], stats["duplicate"], stats["rejected"]) == (10, 0, 1)
+    assert db_conn.execute("SELECT count(*) FROM broadband").fetchone()[0] == 10
+
+
+def test_should_encode_broadband_names_into_dimension_ids():
+    db_conn = sqlite3.connect(":memory:")
+    for _, table in BROADBAND_DIMENSIONS:
+        db_conn.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL UNIQUE)")
+    rows = [["1", None, "Średzki", "Wilkszyn", None, "1", "Orange Polska S.A.", "Światłowodowe", 100, None, None],
+            ["2", None, "Średzki", "Miękinia", None, "2", "Orange Polska S.A.", "Światłowodowe", 100, None, None]]
+
+    encoded_again = list(_encode_broadband_rows(db_conn, [list(rows[1])]))
+    encoded = list(_encode_broadband_rows(db_conn, rows))
+
+    assert [r[2:4] + r[6:8] for r in encoded] == [[1, 2, 1, 1], [1, 1, 1, 1]]
+    assert encoded_again[0] == encoded[1]
+    assert db_conn.execute("SELECT count(*) FROM broadband_city").fetchone()[0] == 2
+
+
+def test_should_refresh_city_avg_price_incrementally_as_full_rebuild():
+    db_conn = sqlite3.connect(":memory:")
+    _init_tables(db_conn, DDL_SCRIPT)
+    db_conn.executemany("INSERT INTO place VALUES (?, ?, NULL, NULL, NULL)",
+                        [("a1", "A"), ("a2", "A"), ("b1", "B"), ("c1", "C"), ("x1", None)])
+    batches = [[("1", "a1", 100., 1), ("2", "a2", 300., 3), ("3", "b1", 50., 1), ("4", "x1", 50., 1),
+                ("5", "c1", 1., 1)],
+               [("1", "a1", 90., 1), ("3", "b1", 60., 1), ("5", "c1", 40., 1), ("6", "b1", 20., 1)],
+               [("5", "c1", 45., 1), ("7", "c1", 30., 1), ("3", "a2", 80., 1)]]
+    full_query = """SELECT city, round(avg(price_pln / area_m2)), count(DISTINCT ident)
+                    FROM parcel_offer INNER JOIN place ON parcel_offer.location = place.location
+                    WHERE price_pln / area_m2 < 1000 AND price_pln / area_m2 > 10 AND city IS NOT NULL
+                    GROUP BY city HAVING count(DISTINCT ident) >= 2 ORDER BY city"""
+
+    for day, batch in enumerate(batches):
+        db_conn.executemany("INSERT INTO parcel_offer VALUES (?, ?, 'url', 'title', ?, ?, ?)",
+                            [(ident, f"2020-04-1{day}", location, area, price) for ident, location, price, area in batch])
+        _refresh_summaries(db_conn, getLogger())
+
+        assert db_conn.execute("SELECT * FROM city_avg_price ORDER BY city").fetchall() == \
+               db_conn.execute(full_query).fetchall()
+    assert db_conn.execute("SELECT city FROM city_avg_price ORDER BY city").fetchall() == [("A",), ("B",), ("C",)]
+
+
+def _head(source: str, target, lines: int):
+    with open(source, "rb") as source_:
+        target.write_bytes(b"".join(line for _, line in zip(range(lines), source_)))
+
+
+def _sources(tmp_path):
+    """Writes small place cache, drive time, offer and UKE broadband sources, returns main arguments"""
+    places = [["Gajków, wrocławski, Dolnośląskie", "Gajków", "", 51.03, 17.15],
+              ["Milicz, milicki, Dolnośląskie", "Milicz", "", 51.53, 17.27]]
+    write_csv(str(tmp_path / "places.csv"), places)
+    write_csv(str(tmp_path / "drive_time.csv"), [["wroclaw", location, 20] for location, *_ in places])
+    (tmp_path / "offers").mkdir()
+    for day in range(3):
+        offers = [ParcelOffer(datetime(2020, 4, 16 + day, 12), f"{i}", f"https://www.olx.pl/{i}.html",
+                              places[i % 2][0], 1000, 100000 - day * 1000, f"Offer {i}") for i in range(20)]
+        write_csv(str(tmp_path / "offers" / f"offers_{day}.csv"), (o.to_csv_row() for o in offers))
+    for uke_dir, uke_file in (("current", "0215_zasiegi.csv"), ("popc", "0214_POPC.csv")):
+        (tmp_path / uke_dir).mkdir()
+        _head(path.join(DATA_DIR, "uke", uke_dir, uke_file), tmp_path / uke_dir / uke_file, 50)
+    return (str(tmp_path / "places.csv"), str(tmp_path / "drive_time.csv"), str(tmp_path / "offers"),
+            str(tmp_path / "current"), str(tmp_path / "popc"))
+
+
+def _table_counts(db_file: str):
+    db_conn = sqlite3.connect(db_file)
+    try:
+        tables = ("place", "drive_time", "parcel_offer", "broadband", "offer_history", "city_avg_price")
+        return {table: db_conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0] for table in tables}
+    finally:
+        db_conn.close()
+
+
+def _indexes(db_file: str):
+    db_conn = sqlite3.connect(db_file)
+    try:
+        return sorted(r[0] for r in db_conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' "
+                                                    "AND sql IS NOT NULL"))
+    finally:
+        db_conn.close()
+
+
+def test_should_bulk_load_same_rows_and_rebuild_indexes(tmp_path):
+    sources = _sources(tmp_path)
+    bulk_db, regular_db = str(tmp_path / "bulk.db"), str(tmp_path / "regular.db")
+
+    main(regular_db, DDL_SCRIPT, *sources)
+    main(bulk_db, DDL_SCRIPT, *sources, bulk=True)
+
+    assert _table_counts(bulk_db) == _table_counts(regular_db)
+    assert _table_counts(bulk_db)["parcel_offer"] == 60 and _table_counts(bulk_db)["broadband"] > 0
+    assert "offer_day_ix" in _indexes(bulk_db)
+    assert _indexes(bulk_db) == _indexes(regular_db)
+
+
+def test_should_rebuild_indexes_when_bulk_load_fails(tmp_path, monkeypatch):
+    sources = _sources(tmp_path)
+    db_file = str(tmp_path / "offers.db")
+    main(db_file, DDL_SCRIPT, *sources)
+    indexes = _indexes(db_file)
+
+    def _fail(offers_csv: str):
+        raise ValueError(f"Could not parse {offers_csv}")
+
+    monkeypatch.setattr(import_into_db, "_parse_offer_csv", _fail)
+    with pytest.raises(ValueError):
+        main(db_file, DDL_SCRIPT, *sources, bulk=True)
+
+    assert _indexes(db_file) == indexes
+    assert _table_counts(db_file)["parcel_offer"] == 60
+
+
+def test_should_tell_imported_files_by_size_mtime_and_sha1(tmp_path):
+    db_conn = sqlite3.connect(":memory:")
+    _init_tables(db_conn, DDL_SCRIPT)
+    source = tmp_path / "offers.csv"
+    source.write_text("a,1\n")
+    _mark_imported(db_conn, str(source))
+    unchanged = _is_imported(db_conn, str(source))
+
+    os.utime(source, (source.stat().st_atime, source.stat().st_mtime + 60))
+    touched = _is_imported(db_conn, str(source))
+    manifest_mtime = db_conn.execute("SELECT mtime FROM import_manifest").fetchone()[0]
+    source.write_text("b,2\n")
+    os.utime(source, (source.stat().st_atime, source.stat().st_mtime + 120))
+    same_size_changed = _is_imported(db_conn, str(source))
+    source.write_text("a,1\nb,2\n")
+    os.utime(source, (source.stat().st_atime, manifest_mtime))
+    resized = _is_imported(db_conn, str(source))
+
+    assert (unchanged, touched, same_size_changed, resized) == (True, True, False, False)
+    assert manifest_mtime == source.stat().st_mtime
+    assert _needs_import(db_conn, [str(source)], incremental=True)
+    assert _needs_import(db_conn, [str(tmp_path / "places.csv")], incremental=False)
+
+
+def test_should_reload_changed_place_cache_and_drive_time_only(tmp_path):
+    places, drive_time, *sources = _sources(tmp_path)
+    db_file = str(tmp_path / "offers.db")
+    main(db_file, DDL_SCRIPT, places, drive_time, *sources, incremental=True)
+    main(db_file, DDL_SCRIPT, places, drive_time, *sources, incremental=True)
+    unchanged = _table_counts(db_file)
+
+    write_csv(places, [["Gajków, wrocławski, Dolnośląskie", "Gajków", "", 51.03, 17.15]])
+    write_csv(drive_time, [["wroclaw", "Gajków, wrocławski, Dolnośląskie", 35]])
+    main(db_file, DDL_SCRIPT, places, drive_time, *sources, incremental=True)
+
+    db_conn = sqlite3.connect(db_file)
+    assert (unchanged["place"], unchanged["drive_time"], unchanged["parcel_offer"]) == (2, 2, 60)
+    assert db_conn.execute("SELECT location FROM place").fetchall() == [("Gajków, wrocławski, Dolnośląskie",)]
+    assert db_conn.execute("SELECT time_min FROM drive_time").fetchall() == [(35,)]
+    assert db_conn.execute("SELECT count(*) FROM parcel_offer").fetchone()[0] == 60
+    db_conn.close()
+
+
+def test_should_parse_files_in_task_order_with_process_pool(tmp_path):
+    _, _, offers, inet_curr, _ = _sources(tmp_path)
+    parse_tasks = [(_parse_offer_csv, path.join(offers, f)) for f in sorted(os.listdir(offers))] \
+                  + [(_parse_curr_inet_csv, path.join(inet_curr, "0215_zasiegi.csv"))]
+
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        parsed = list(_parse_files(parse_tasks, executor, queue_size=2))
+
+    assert parsed == list(_parse_files(parse_tasks, None))
+    assert [source_file for source_file, _ in parsed] == [source_file for _, source_file in parse_tasks]
+
+
+def test_should_import_same_rows_with_parallel_workers(tmp_path):
+    sources = _sources(tmp_path)
+    single_db, parallel_db = str(tmp_path / "single.db"), str(tmp_path / "parallel.db")
+
+    main(single_db, DDL_SCRIPT, *sources, workers=1)
+    main(parallel_db, DDL_SCRIPT, *sources, workers=2)
+
+    for table in ("place", "parcel_offer", "broadband", "broadband_provider", "offer_history"):
+        rows = []
+        for db_file in (single_db, parallel_db):
+            db_conn = sqlite3.connect(db_file)
+            rows.append(db_conn.execute(f"SELECT * FROM {table} ORDER BY rowid").fetchall())
+            db_conn.close()
+        assert rows[0] == rows[1] and rows[0], table
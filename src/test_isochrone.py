@@ -0,0 +1,65 @@
+from os import path
+
+import numpy as np
+from shapely.geometry import Point, Polygon, shape
+
+from isochrone import IsochroneIndex, IsochroneGrid, DriveTimeClassifier, read_isochrone_map
+
+ISOCHRONE_MAP = path.join(path.dirname(path.realpath(__file__)), "..", "data", "isochrone_wroclaw_car_56min_7min.json")
+
+
+def _first_polygon_containing(lat: float, lon: float, polygons) -> int:
+    for i, polygon in enumerate(polygons):
+        if polygon.contains(Point(lon, lat)):
+            return i
+    return -1
+
+
+def test_should_classify_points_into_narrowest_band_of_overlapping_polygons():
+    polygons = [Polygon([(0, 0), (2, 0), (2, 2), (0, 2)]),
+                Polygon([(1, 1), (4, 1), (4, 4), (1, 4)]),
+                Polygon([(-1, -1), (5, -1), (5, 5), (-1, 5)])]
+    index = IsochroneIndex(polygons, step_time_min=7)
+    lat, lon = np.array([0.5, 3., 0.5, 4.5, 6.]), np.array([0.5, 3., 3., 4.5, 6.])
+
+    assert index.classify(lat, lon).tolist() == [0, 1, 2, 2, -1]
+    assert index.classify(lat, lon).tolist() == [_first_polygon_containing(a, o, polygons) for a, o in zip(lat, lon)]
+    assert np.array_equal(index.drive_time_min(lat, lon), [0., 7., 14., 14., np.nan], equal_nan=True)
+
+
+def test_should_classify_random_points_as_first_polygon_containing_them():
+    polygons = [shape(f["geometry"]) for f in read_isochrone_map(ISOCHRONE_MAP)["features"]]
+    index = IsochroneIndex(polygons)
+    rng = np.random.default_rng(0)
+    lat, lon = rng.uniform(50.6, 51.8, 100000), rng.uniform(16., 18., 100000)
+
+    bands = index.classify(lat, lon)
+
+    sample = slice(0, 2000)
+    assert bands[sample].tolist() == [_first_polygon_containing(a, o, polygons)
+                                      for a, o in zip(lat[sample], lon[sample])]
+
+
+def test_grid_should_match_exact_index_and_survive_roundtrip(tmp_path):
+    index = IsochroneIndex.from_file(ISOCHRONE_MAP)
+    grid = IsochroneGrid.rasterize(index, resolution=0.01)
+    grid.save(str(tmp_path))
+    loaded = IsochroneGrid.load(str(tmp_path))
+    rng = np.random.default_rng(0)
+    lat, lon = rng.uniform(50.6, 51.8, 100000), rng.uniform(16., 18., 100000)
+
+    bands = loaded.classify(lat, lon)
+
+    assert np.array_equal(bands, index.classify(lat, lon))
+    assert np.array_equal(grid.classify(lat, lon), bands)
+
+
+def test_should_label_points_with_drive_time_to_each_origin():
+    square = Polygon([(0, 0), (2, 0), (2, 2), (0, 2)])
+    classifier = DriveTimeClassifier({"a": IsochroneIndex([square, square.buffer(2)], step_time_min=10),
+                                      "b": IsochroneIndex([square.buffer(-0.5)], step_time_min=5)})
+
+    drive_times = classifier.drive_time_min(np.array([1., 3., 9.]), np.array([1., 3., 9.]))
+
+    assert np.array_equal(drive_times["a"], [0., 10., np.nan], equal_nan=True)
+    assert np.array_equal(drive_times["b"], [0., np.nan, np.nan], equal_nan=True)
@@ -55,3 +55,12 @@ def test_resolving_addresses():
     for domain, location, expected in args:
         actual = build_resolve_name(domain, location)
         assert actual.lower() == expected.lower(), f"{location} should be '{expected.lower()}', but was '{actual.lower()}'"
+
+
+def test_should_parse_offers_into_hashable_slotted_objects():
+    rows = [OFFER_CSV_ROW[:3] + [str(i)] + OFFER_CSV_ROW[4:] for i in range(1000)]
+
+    offers = [ParcelOffer.from_csv_row(r) for r in rows]
+
+    assert len(set(offers)) == len(rows)
+    assert not hasattr(offers[0], "__dict__")
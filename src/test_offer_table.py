@@ -0,0 +1,64 @@
+from datetime import datetime
+
+import numpy as np
+
+from common import write_csv, read_csv
+from model import ParcelOffer, Place
+from offer_table import OfferTable, main
+
+
+def _offer(ident: str, day: int, location: str, area_m2: int, price_pln: int) -> ParcelOffer:
+    return ParcelOffer(timestamp=datetime(2020, 4, day, 12, 0, 0), ident=ident, url=f"https://www.olx.pl/{ident}.html",
+                       location=location, area_m2=area_m2, price_pln=price_pln, title=f"Offer {ident}")
+
+
+OFFERS = [_offer("1", 16, "Gajków, wrocławski", 1000, 100000),
+          _offer("1", 17, "Gajków, wrocławski", 1000, 90000),
+          _offer("2", 17, "Milicz, milicki", 2000, 100000),
+          _offer("3", 17, "Milicz", 1000, 70000),
+          _offer("4", 17, None, 1000, 70000)]
+LOCATION_CITY = {"Gajków, wrocławski": "Gajków", "Milicz, milicki": "Milicz", "Milicz": "Milicz"}
+
+
+def test_should_group_price_per_m2_by_day():
+    days, avg_price, offer_count = OfferTable.from_offers(OFFERS).price_per_m2_by_day()
+
+    assert list(days.astype(str)) == ["2020-04-16", "2020-04-17"]
+    assert list(avg_price) == [100., 70.]
+    assert list(offer_count) == [1, 4]
+
+
+def test_should_group_price_per_m2_by_city():
+    cities, avg_price, offer_count = OfferTable.from_offers(OFFERS).price_per_m2_by_city(LOCATION_CITY)
+
+    assert list(cities) == ["Gajków", "Milicz"]
+    assert list(avg_price) == [95., 60.]
+    assert list(offer_count) == [1, 2]
+
+
+def test_should_save_and_load_memory_mapped(tmp_path):
+    table = OfferTable.from_offers(OFFERS)
+    table.save(str(tmp_path))
+
+    loaded = OfferTable.load(str(tmp_path))
+
+    assert isinstance(loaded.price_pln, np.memmap)
+    assert np.array_equal(table.timestamp, loaded.timestamp)
+    assert list(loaded.locations[loaded.location_code]) == [o.location or "" for o in OFFERS]
+    assert len(loaded.where_area(1500, 3000)) == 1
+
+
+def test_should_write_daily_and_city_averages(tmp_path):
+    offers_dir, output = tmp_path / "offers", tmp_path / "table"
+    offers_dir.mkdir()
+    write_csv(str(offers_dir / "offers.csv"), (o.to_csv_row() for o in OFFERS))
+    write_csv(str(tmp_path / "places.csv"),
+              (Place(location, city, None, 51., 17.).to_csv_row() for location, city in LOCATION_CITY.items()))
+
+    main(str(offers_dir), str(output), str(tmp_path / "places.csv"))
+
+    assert list(read_csv(str(output / "daily_price_avg.csv"))) == [["Date", "PricePerM2", "OfferCount"],
+                                                                   ["2020-04-16", "100.0", "1"],
+                                                                   ["2020-04-17", "70.0", "4"]]
+    assert list(read_csv(str(output / "city_avg_price.csv"))) == [["city", "avg_price_per_m2", "offer_count"],
+                                                                  ["Milicz", "60.0", "2"]]
@@ -0,0 +1,174 @@
+import json
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import getLogger
+from threading import Thread
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+from common import write_csv
+from model import Place, ParcelOffer
+from place_resolver import PlaceResolver, SqlitePlaceCache, MapQuestClient
+from test_model import OFFER_MODEL
+
+
+class StubClient:
+    def __init__(self, resolved_place: Optional[Place]):
+        self.resolved_place = resolved_place
+        self.queries = []
+
+    def resolve(self, query_address: str, location: str) -> Optional[Place]:
+        self.queries.append(query_address)
+        p = self.resolved_place
+        return Place(location, p.city, p.postcode, p.lat, p.lon) if p else None
+
+
+def test_should_call_api_once_per_location():
+    client = StubClient(Place(OFFER_MODEL.location, "Gajków", None, 51.03, 17.15))
+    resolver = PlaceResolver(client, getLogger())
+
+    places = [resolver.get(OFFER_MODEL) for _ in range(3)]
+
+    assert [p.city for p in places] == ["Gajków"] * 3
+    assert client.queries == ["Gajków, wrocławski"]
+    assert (resolver.stats["hit"], resolver.stats["miss"], resolver.stats["lookup"]) == (2, 1, 1)
+
+
+def test_should_retry_negative_entry_after_ttl():
+    cache = SqlitePlaceCache(negative_ttl=timedelta(days=30))
+    client = StubClient(Place(OFFER_MODEL.location, None, None, None, None))
+    resolver = PlaceResolver(client, getLogger(), cache)
+
+    assert resolver.get(OFFER_MODEL) is None
+    assert resolver.get(OFFER_MODEL) is None
+    assert len(client.queries) == 1
+
+    expired = (datetime.utcnow() - timedelta(days=31)).isoformat()
+    cache.db_conn.execute("UPDATE place_query SET updated = ?", (expired,))
+    assert resolver.get(OFFER_MODEL) is None
+    assert len(client.queries) == 2
+
+
+def test_should_retry_negative_entry_loaded_from_csv_after_ttl(tmp_path):
+    csv_cache = str(tmp_path / "place_cache.csv")
+    client = StubClient(Place(OFFER_MODEL.location, None, None, None, None))
+    resolver = PlaceResolver(client, getLogger())
+    assert resolver.get(OFFER_MODEL) is None
+    expired = (datetime.utcnow() - timedelta(days=31)).isoformat()
+    resolver.cache.db_conn.execute("UPDATE place_query SET updated = ?", (expired,))
+    resolver.save(csv_cache)
+
+    reloaded = PlaceResolver(client, getLogger())
+    reloaded.load(csv_cache)
+
+    assert reloaded.get(OFFER_MODEL) is None
+    assert len(client.queries) == 2
+
+
+def test_should_not_cache_failed_api_calls():
+    client = StubClient(None)
+    resolver = PlaceResolver(client, getLogger())
+
+    _ = resolver.get(OFFER_MODEL)
+    _ = resolver.get(OFFER_MODEL)
+
+    assert len(client.queries) == 2
+    assert len(resolver.cache) == 0
+
+
+class StubGeocoderHandler(BaseHTTPRequestHandler):
+    requests_per_query = Counter()
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)["q"][0]
+        self.requests_per_query[query] += 1
+        if query.startswith("Flaky") and self.requests_per_query[query] == 1:
+            self.send_response(503)
+            self.end_headers()
+            return
+        if query.startswith("Proxied") and (self.requests_per_query[query] == 1 or query.startswith("Proxied only")):
+            body = b"<html><body>Bad gateway</body></html>"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        body = json.dumps([] if query.startswith("Nowhere") else
+                          [{"lat": "51.1", "lon": "17.0", "address": {"city": query.split(",")[0]}}]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_should_resolve_batch_concurrently_against_http_geocoder():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGeocoderHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    url_fmt = f"http://127.0.0.1:{server.server_address[1]}/search?key={{}}&q={{}}"
+    client = MapQuestClient("key", getLogger(), rate_limit=100., backoff_sec=0.01, base_url_fmt=url_fmt)
+    resolver = PlaceResolver(client, getLogger())
+    locations = [f"Village{i}, wrocławski" for i in range(20)] + ["Flaky, trzebnicki", "Nowhere, milicki",
+                                                                   "Proxied, oleśnicki", "Proxied only, oleśnicki"]
+    offers = [ParcelOffer(OFFER_MODEL.timestamp, str(i), OFFER_MODEL.url, loc, 1000, 100000, None)
+              for i, loc in enumerate(locations * 2)]
+
+    try:
+        resolved = resolver.resolve_many(offers, workers=4)
+    finally:
+        server.shutdown()
+        client.close()
+
+    assert resolved["Village7, wrocławski"].city == "Village7"
+    assert resolved["Flaky, trzebnicki"].city == "Flaky"
+    assert resolved["Nowhere, milicki"] is None
+    assert resolved["Proxied, oleśnicki"].city == "Proxied"
+    assert resolved["Proxied only, oleśnicki"] is None
+    assert StubGeocoderHandler.requests_per_query["Flaky, trzebnicki"] == 2
+    assert StubGeocoderHandler.requests_per_query["Proxied only, oleśnicki"] == client.max_retries + 1
+    # one retry of flaky and proxied queries each, all attempts of the query always proxied
+    retries = 2 + client.max_retries
+    assert sum(StubGeocoderHandler.requests_per_query.values()) == len(locations) + retries
+    assert resolver.stats["lookup"] == client.stats["api_call"] == len(locations)
+    assert client.stats["request"] == len(locations) + retries
+
+
+def test_should_resolve_locations_sharing_normalized_query_once():
+    client = StubClient(Place(OFFER_MODEL.location, "Wilkszyn", None, 51.19, 16.88))
+    resolver = PlaceResolver(client, getLogger())
+    locations = ["ul. Wiśniowa, Wilkszyn, średzki, dolnośląskie", "Wilkszyn, średzki, Dolnośląskie",
+                 "ul. Lipowa, Wilkszyn, średzki, dolnośląskie"]
+    offers = [ParcelOffer(OFFER_MODEL.timestamp, str(i), OFFER_MODEL.url, loc, 1000, 100000, None)
+              for i, loc in enumerate(locations)]
+
+    resolved = resolver.resolve_many(offers[:2])
+    place = resolver.get(offers[2])
+
+    assert client.queries == ["Wilkszyn, średzki"]
+    assert {loc: p.city for loc, p in resolved.items()} == {locations[0]: "Wilkszyn", locations[1]: "Wilkszyn"}
+    assert (place.location, place.city) == (locations[2], "Wilkszyn")
+    assert [p.location for p in resolver.cache.places()] == sorted(locations)
+
+
+def test_should_serve_csv_loaded_place_for_other_spelling_of_its_query(tmp_path):
+    csv_cache = str(tmp_path / "place_cache.csv")
+    write_csv(csv_cache, [["Gajków, wrocławski, Dolnośląskie", "Gajków", "", 51.03, 17.15],
+                          ["Gajków, wrocławski, dolnośląskie", "Gajków", "", 51.2, 17.2],
+                          ["Nowhere, milicki", "", "", "", ""]])
+    client = StubClient(Place(OFFER_MODEL.location, "Elsewhere", None, 50., 16.))
+    resolver = PlaceResolver(client, getLogger())
+
+    resolver.load(csv_cache)
+    resolved = resolver.resolve_locations([("www.olx.pl", "ul. Polna, Gajków, wrocławski, Dolnośląskie"),
+                                           ("www.olx.pl", "Gajków, wrocławski, dolnośląskie"),
+                                           ("www.olx.pl", "Nowhere, milicki")])
+
+    assert client.queries == []
+    assert resolved["ul. Polna, Gajków, wrocławski, Dolnośląskie"].lat == 51.03
+    assert resolved["Gajków, wrocławski, dolnośląskie"].lat == 51.2
+    assert resolved["Nowhere, milicki"] is None
@@ -0,0 +1,55 @@
+import json
+from os import path
+
+from shapely.geometry import shape
+
+from simplify_isochrone import simplify_features, main, simplified_metadata
+from test_isochrone import ISOCHRONE_MAP
+
+
+def _feature(ring):
+    return {"type": "Feature", "properties": {}, "geometry": {"type": "Polygon", "coordinates": [ring]}}
+
+
+def test_should_simplify_boundary_shared_by_isochrones_the_same_way():
+    wiggly_edge = [[1., y / 10] for y in range(11)]
+    for i, point in enumerate(wiggly_edge):
+        point[0] += 0.001 * (-1) ** i
+    left = _feature(wiggly_edge + [[0., 1.], [0., 0.], wiggly_edge[0]])
+    right = _feature(wiggly_edge[::-1] + [[2., 0.], [2., 1.], wiggly_edge[-1]])
+
+    (simple_left, simple_right), topology = simplify_features([left, right], tolerance=0.01)
+
+    left_edge = [p for p in simple_left["geometry"]["coordinates"][0][:-1] if 0.5 < p[0] < 1.5]
+    right_edge = [p for p in simple_right["geometry"]["coordinates"][0][:-1] if 0.5 < p[0] < 1.5]
+    assert sorted(left_edge) == sorted(right_edge) == [[1.001, 0.], [1.001, 1.]]
+    assert len(topology.arcs) == 3
+
+
+def test_should_keep_or_drop_features_collapsed_by_simplification():
+    tiny = _feature([[0., 0.], [1e-7, 0.], [1e-7, 1e-7], [0., 0.]])
+    square = _feature([[0., 0.], [1., 0.], [1., 1.], [0., 1.], [0., 0.]])
+
+    (kept, simple_square), _ = simplify_features([tiny, square], tolerance=0.01)
+    (dropped, _), _ = simplify_features([tiny, square], tolerance=0.01, drop_collapsed=True)
+
+    assert kept["geometry"] == tiny["geometry"]
+    assert shape(simple_square["geometry"]).area == 1.
+    assert dropped["geometry"]["coordinates"] == []
+
+
+def test_should_shrink_isochrone_map_and_cache_it(tmp_path):
+    output = str(tmp_path / "simplified.json")
+
+    main(ISOCHRONE_MAP, output)
+    modified = path.getmtime(output)
+    main(ISOCHRONE_MAP, output)
+
+    assert path.getmtime(output) == modified
+    assert path.getsize(output) < path.getsize(ISOCHRONE_MAP) / 4
+    assert simplified_metadata(output)["tolerance"] == 0.0002
+    with open(ISOCHRONE_MAP, "r", encoding="utf-8-sig") as source_, open(output, "r") as output_:
+        features = zip(json.load(source_)["features"], json.load(output_)["features"])
+    for source, simplified in features:
+        source, simplified = shape(source["geometry"]), shape(simplified["geometry"])
+        assert simplified.is_valid and source.hausdorff_distance(simplified) < 0.0003
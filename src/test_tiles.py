@@ -0,0 +1,43 @@
+import json
+from logging import getLogger
+
+import numpy as np
+from shapely.geometry import shape
+
+from tiles import tile_xy, tile_bounds, write_tiles
+
+
+def _point(lon, lat, title):
+    return {"type": "Feature", "geometry": {"type": "Point", "coordinates": [lon, lat]}, "properties": {"title": title}}
+
+
+def test_should_place_points_in_tiles_they_lie_within():
+    x, y = tile_xy([17.03, -180., 0.], [51.11, 85., 0.], 12)
+
+    assert np.floor(x).astype(int).tolist() == [2241, 0, 2048] and np.floor(y).astype(int).tolist() == [1369, 6, 2048]
+    min_lon, min_lat, max_lon, max_lat = tile_bounds(12, 2241, 1369)
+    assert min_lon <= 17.03 < max_lon and min_lat <= 51.11 < max_lat
+
+
+def test_should_cut_features_into_tile_pyramid_thinning_points_below_max_zoom(tmp_path):
+    square = {"type": "Feature", "properties": {"title": "isochrone"},
+              "geometry": {"type": "Polygon", "coordinates": [[[16.9, 51.], [17.2, 51.], [17.2, 51.2], [16.9, 51.2],
+                                                               [16.9, 51.]]]}}
+    points = [_point(17.03 + i * 1e-5, 51.11, f"offer-{i}") for i in range(10)] + [_point(16.5, 51.5, "far")]
+
+    index = write_tiles([square] + points, str(tmp_path), 8, 10, getLogger())
+
+    with open(tmp_path / "index.json") as index_:
+        assert json.load(index_) == index
+    for zoom, tiles in index["zooms"].items():
+        features = []
+        for x, y, count in tiles:
+            with open(tmp_path / zoom / str(x) / f"{y}.json") as tile_:
+                tile_features = json.load(tile_)["features"]
+            assert len(tile_features) == count
+            features.extend(tile_features)
+        titles = [f["properties"]["title"] for f in features]
+        clipped_area = sum(shape(f["geometry"]).area for f in features if f["properties"]["title"] == "isochrone")
+        assert abs(clipped_area - 0.3 * 0.2) < 1e-9
+        assert titles.count("far") == 1
+        assert sum(t.startswith("offer-") for t in titles) == (10 if zoom == "10" else 1)
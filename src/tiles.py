@@ -0,0 +1,125 @@
+import json
+import os
+from collections import defaultdict
+from logging import Logger
+from os import path
+from typing import List, Any, Dict, Tuple, Sequence
+
+import numpy as np
+import shapely
+from shapely.geometry import shape, mapping
+
+from common import GeoJsonWriter
+from simplify_isochrone import simplify_features
+
+TILE_SIZE_PX = 256
+TILE_TEMPLATE = "{z}/{x}/{y}.json"
+
+
+def tile_xy(lon: np.ndarray, lat: np.ndarray, zoom: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns fractional web mercator tile coordinates of given points at given zoom"""
+    lon, lat = np.asarray(lon, dtype=np.float64), np.radians(np.asarray(lat, dtype=np.float64))
+    tiles = 2 ** zoom
+    x = (lon + 180.) / 360. * tiles
+    y = (1. - np.log(np.tan(lat) + 1. / np.cos(lat)) / np.pi) / 2. * tiles
+    return np.clip(x, 0, tiles - 1e-9), np.clip(y, 0, tiles - 1e-9)
+
+
+def tile_bounds(zoom: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Returns (min_lon, min_lat, max_lon, max_lat) of given tile"""
+    tiles = 2 ** zoom
+    lat = [np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * row / tiles)))) for row in (y + 1, y)]
+    return x / tiles * 360. - 180., lat[0], (x + 1) / tiles * 360. - 180., lat[1]
+
+
+def pixel_size_deg(zoom: int) -> float:
+    return 360. / (TILE_SIZE_PX * 2 ** zoom)
+
+
+def _thin_points(lon: np.ndarray, lat: np.ndarray, zoom: int, cells_per_tile: int) -> np.ndarray:
+    """Returns indices of points kept at given zoom: first point of each of cells_per_tile^2 cells of a tile"""
+    x, y = tile_xy(lon, lat, zoom)
+    cells = 2 ** zoom * cells_per_tile
+    keys = np.floor(x * cells_per_tile).astype(np.int64) * cells + np.floor(y * cells_per_tile).astype(np.int64)
+    return np.sort(np.unique(keys, return_index=True)[1])
+
+
+def _simplify(features: Sequence[Dict[str, Any]], tolerance: float, precision: int) -> List[Dict[str, Any]]:
+    polygons = [i for i, f in enumerate(features) if f["geometry"]["type"] in ("Polygon", "MultiPolygon")]
+    simplified = list(features)
+    if polygons:
+        # polygons collapsed at this zoom get empty geometry, left out of tiles
+        collapsible = [features[i] for i in polygons]
+        for i, feature in zip(polygons, simplify_features(collapsible, tolerance, precision, drop_collapsed=True)[0]):
+            simplified[i] = feature
+    for i, feature in enumerate(features):
+        if feature["geometry"]["type"] in ("LineString", "MultiLineString"):
+            line = shapely.simplify(shape(feature["geometry"]), tolerance, preserve_topology=True)
+            simplified[i] = {**feature, "geometry": mapping(line)}
+    return simplified
+
+
+def _zoom_tiles(features: Sequence[Dict[str, Any]], zoom: int, thin: bool,
+                cells_per_tile: int) -> Dict[Tuple[int, int], List[Dict[str, Any]]]:
+    tiles: Dict[Tuple[int, int], List[Tuple[int, Dict[str, Any]]]] = defaultdict(list)
+    points = [i for i, f in enumerate(features) if f["geometry"]["type"] == "Point"]
+    if points:
+        lon, lat = np.array([features[i]["geometry"]["coordinates"][:2] for i in points]).T
+        kept = _thin_points(lon, lat, zoom, cells_per_tile) if thin else np.arange(len(points))
+        x, y = tile_xy(lon[kept], lat[kept], zoom)
+        for i, x_, y_ in zip(kept.tolist(), np.floor(x).astype(int).tolist(), np.floor(y).astype(int).tolist()):
+            tiles[(x_, y_)].append((points[i], features[points[i]]))
+
+    # polygons simplified away at this zoom are left out
+    others = [i for i, f in enumerate(features) if f["geometry"]["type"] != "Point" and f["geometry"]["coordinates"]]
+    geometries = shapely.from_geojson([json.dumps(features[i]["geometry"]) for i in others]) if others else []
+    for i, geometry in zip(others, geometries):
+        min_lon, min_lat, max_lon, max_lat = shapely.bounds(geometry)
+        (min_x, max_x), (max_y, min_y) = (np.floor(c).astype(int) for c in tile_xy([min_lon, max_lon],
+                                                                                    [min_lat, max_lat], zoom))
+        for x_ in range(min_x, max_x + 1):
+            for y_ in range(min_y, max_y + 1):
+                clipped = shapely.clip_by_rect(geometry, *tile_bounds(zoom, x_, y_))
+                if not clipped.is_empty:
+                    tiles[(x_, y_)].append((i, {**features[i], "geometry": mapping(clipped)}))
+    # features keep the order they were given in, so the layers stack the same way as on the single map
+    return {tile: [f for _, f in sorted(tile_features, key=lambda t: t[0])] for tile, tile_features in tiles.items()}
+
+
+def _remove_tiles(output_dir: str) -> None:
+    """Removes tiles listed in index of previous pyramid written into output_dir, if any"""
+    index_file = path.join(output_dir, "index.json")
+    if not path.isfile(index_file):
+        return
+    with open(index_file, "r") as index_:
+        index = json.load(index_)
+    for zoom, tiles in index["zooms"].items():
+        for x, y, _ in tiles:
+            tile_file = path.join(output_dir, index["tile_template"].format(z=zoom, x=x, y=y))
+            if path.isfile(tile_file):
+                os.remove(tile_file)
+
+
+def write_tiles(features: Sequence[Dict[str, Any]], output_dir: str, min_zoom: int, max_zoom: int, log: Logger,
+                cells_per_tile: int = 64) -> Dict[str, Any]:
+    """Cuts features into z/x/y GeoJSON tiles simplified to pixel size of each zoom, points thinned to one per
+    cell of a tile below max zoom; writes index.json describing the pyramid and returns it"""
+    _remove_tiles(output_dir)
+    index = {"tile_template": TILE_TEMPLATE, "tile_size_px": TILE_SIZE_PX, "min_zoom": min_zoom,
+             "max_zoom": max_zoom, "feature_count": len(features), "zooms": {}}
+    for zoom in range(min_zoom, max_zoom + 1):
+        # coordinates precise to a tenth of a pixel
+        precision = int(np.ceil(np.log10(10. / pixel_size_deg(zoom))))
+        tiles = _zoom_tiles(_simplify(features, pixel_size_deg(zoom), precision), zoom,
+                            zoom < max_zoom, cells_per_tile)
+        for (x, y), tile_features in tiles.items():
+            tile_file = path.join(output_dir, TILE_TEMPLATE.format(z=zoom, x=x, y=y))
+            os.makedirs(path.dirname(tile_file), exist_ok=True)
+            with GeoJsonWriter(tile_file, compact=True, precision=precision) as writer:
+                writer.write_all(tile_features)
+        index["zooms"][str(zoom)] = sorted([x, y, len(f)] for (x, y), f in tiles.items())
+        log.info(f"Written {len(tiles)} tiles with {sum(len(f) for f in tiles.values())} features at zoom {zoom}")
+    os.makedirs(output_dir, exist_ok=True)
+    with open(path.join(output_dir, "index.json"), "w") as index_:
+        json.dump(index, index_)
+    return index